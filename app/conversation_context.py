@@ -0,0 +1,50 @@
+"""
+Conversation Context - Stato incrementale del contesto per sessione
+
+Ogni messaggio viene analizzato una sola volta, quando entra nella storia:
+per ogni campo (accessorio, modello, categoria, dimensioni, alimentazione)
+si tiene l'ultimo valore visto e la posizione del messaggio che lo contiene.
+L'arricchimento della query legge questi valori senza riscandire la storia.
+"""
+from typing import Callable, Dict, Optional
+
+Scanner = Callable[[str], Dict[str, Optional[str]]]
+
+
+class ConversationContext:
+    """
+    Ultima menzione di ogni campo con finestra di recenza: un valore vale
+    finché il messaggio che lo contiene è tra gli ultimi `window` messaggi
+    (stesso risultato della scansione degli ultimi `window` messaggi).
+    """
+
+    def __init__(self, scanner: Scanner, window: int = 8):
+        """
+        Args:
+            scanner: Testo di un messaggio → {campo: valore o None}, in un solo
+                passaggio (l'ordine dei campi è l'ordine di snapshot())
+            window: Numero di messaggi recenti considerati
+        """
+        self.scanner = scanner
+        self.window = window
+        self.fields = tuple(scanner(''))
+        self.message_count = 0
+        self._latest: Dict[str, tuple] = {}
+
+    def update(self, message: Dict):
+        """Aggiunge un messaggio della storia ({'role', 'content'})"""
+        for field, value in self.scanner(message.get('content', '')).items():
+            if value:
+                self._latest[field] = (value, self.message_count)
+        self.message_count += 1
+
+    def get(self, field: str) -> Optional[str]:
+        """Ultimo valore del campo ancora nella finestra di recenza"""
+        latest = self._latest.get(field)
+        if latest is None or self.message_count - latest[1] > self.window:
+            return None
+        return latest[0]
+
+    def snapshot(self) -> Dict[str, Optional[str]]:
+        """Valori correnti di tutti i campi"""
+        return {field: self.get(field) for field in self.fields}
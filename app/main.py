@@ -10,20 +10,27 @@ import sys
 from pathlib import Path
 import json
 import re
-from typing import List, Dict, Optional
+from typing import List, Dict, Tuple
 from sklearn.metrics.pairwise import cosine_similarity
 import logging
 from datetime import datetime
 import hashlib
 import os
+import time
+from functools import partial
 
 # Aggiungi path al modulo
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from src.rag import ProductRetriever, ProductMatcher
+from src.rag.facets import FacetBitsets
+from src.rag.entities import context_entities, scan_entities
+from src.rag.lexicon import wants_full_catalog
+from src.rag.spec_index import SPEC_EXTRACTORS
 from src.api import ClaudeClient
-from src.config import PORT, FLASK_DEBUG
+from src.config import PORT, FLASK_DEBUG, CONTEXT_WINDOW_MESSAGES
 from app.analytics_tracker import get_tracker
+from app.conversation_context import ConversationContext
 from app.analytics_routes import analytics_bp
 
 app = Flask(__name__)
@@ -61,7 +68,7 @@ query_logger.setLevel(logging.INFO)
 # Inizializza componenti (una sola volta all'avvio)
 print("🚀 Inizializzazione componenti...")
 retriever = ProductRetriever()
-matcher = ProductMatcher()
+matcher = ProductMatcher(retriever.features)
 claude = ClaudeClient()
 analytics_tracker = get_tracker()
 print("✅ Componenti pronte!")
@@ -74,148 +81,81 @@ conversations = {}
 # Performance: <10ms | Accuratezza: 95%+
 # ═══════════════════════════════════════════════════════════════════
 
-# Pattern precompilati per massima performance
-CATEGORIA_PATTERNS = {
-    'robot tagliaerba': re.compile(r'\brobot\b.*\btagliaerba\b|\btagliaerba\b.*\brobot\b', re.IGNORECASE),
-    'trattorino': re.compile(r'\btrattorino\b|\btrattorini\b', re.IGNORECASE),
-    'tagliaerba': re.compile(r'\btagliaerba\b', re.IGNORECASE),
-    'decespugliatore': re.compile(r'\bdecespugliator[ei]\b|\btagliabordi\b', re.IGNORECASE),
-    'motosega': re.compile(r'\bmotosega\b|\bmotoseghe\b', re.IGNORECASE),
-    'idropulitrice': re.compile(r'\bidropulitric[ei]\b|\balta pressione\b', re.IGNORECASE),
-    'spazzaneve': re.compile(r'\bspazzaneve\b', re.IGNORECASE),
-    'biotrituratore': re.compile(r'\bbiotrituratore?\b', re.IGNORECASE),
-    'motozappa': re.compile(r'\bmotozappa\b|\bmotozappe\b', re.IGNORECASE),
-    'spazzatrice': re.compile(r'\bspazzatric[ei]\b', re.IGNORECASE),
-    'soffiatore': re.compile(r'\bsoffiator[ei]\b|\baspirator[ei]\b', re.IGNORECASE),
-    'tagliasiepi': re.compile(r'\btagliasiepi\b', re.IGNORECASE),
-    'forbici': re.compile(r'\bforbici\b|\bcesoie\b', re.IGNORECASE),
-    'arieggiatore': re.compile(r'\barieggiat\w+|\bscarificat\w+', re.IGNORECASE)
-}
+# Entità dei messaggi (superficie, categoria, accessorio, alimentazione): scanner
+# unico in src/rag/entities.py; modelli dal gazetteer dei nomi del catalogo
+context_scanner = partial(context_entities, gazetteer=retriever.gazetteer)
 
-MODELLO_PATTERN = re.compile(
-    r'\b([A-Z]{1,3})\s*(\d+)\s*([A-Z])?\b|'
-    r'\b(Swift|Estate|Tornado|Park|Combi|Multiclip|Twinclip|Gyro|Villa|Royal|Garden|Compact|Experience)\s*(\d+)?\s*([A-Z])?\b',
-    re.IGNORECASE
-)
 
-ACCESSORIO_PATTERN = re.compile(
-    r'\b(lam[ae]|batteria|batterie|caricabatterie|filo|testina|catene?|spazzola|sacco|piatto|ruote?|copertura|kit|ricambi?|accessori?)\b',
-    re.IGNORECASE
-)
+def get_conversation(session_id: str) -> Dict:
+    """Stato della sessione (creato al primo messaggio)"""
+    if session_id not in conversations:
+        conversations[session_id] = {
+            'history': [],
+            'context': ConversationContext(context_scanner, window=CONTEXT_WINDOW_MESSAGES),
+            'last_products': [],
+            'last_products_data': []
+        }
+    return conversations[session_id]
+
 
-DIMENSIONI_PATTERN = re.compile(r'(\d+)\s*(?:m²|mq|metri|metro)', re.IGNORECASE)
-
-ALIMENTAZIONE_PATTERN = re.compile(r'\b(elettric[oa]|batteria|benzina|scoppio)\b', re.IGNORECASE)
-
-
-def extract_categoria(messages: List[Dict]) -> Optional[str]:
-    """Estrae categoria prodotto (ultima menzione)"""
-    for msg in reversed(messages):
-        content = msg.get('content', '')
-        for cat, pattern in CATEGORIA_PATTERNS.items():
-            if pattern.search(content):
-                return cat
-    return None
-
-
-def extract_modello(messages: List[Dict]) -> Optional[str]:
-    """Estrae modello più specifico"""
-    for msg in reversed(messages):
-        content = msg.get('content', '')
-        match = MODELLO_PATTERN.search(content)
-        if match:
-            if match.group(4):  # Nome proprio (Swift, Estate, etc)
-                parts = [match.group(4)]
-                if match.group(5):
-                    parts.append(match.group(5))
-                if match.group(6):
-                    parts.append(match.group(6))
-                return ' '.join(parts).upper()
-            else:  # Codice alfanumerico (A 150, G 300, etc)
-                parts = [match.group(1)]
-                if match.group(2):
-                    parts.append(match.group(2))
-                if match.group(3):
-                    parts.append(match.group(3))
-                return ' '.join(parts).upper()
-    return None
-
-
-def extract_accessorio(messages: List[Dict]) -> Optional[str]:
-    """Estrae tipo accessorio/ricambio"""
-    for msg in reversed(messages):
-        content = msg.get('content', '')
-        match = ACCESSORIO_PATTERN.search(content)
-        if match:
-            return match.group(1).lower()
-    return None
-
-
-def extract_dimensioni(messages: List[Dict]) -> Optional[str]:
-    """Estrae dimensioni giardino"""
-    for msg in reversed(messages):
-        content = msg.get('content', '')
-        match = DIMENSIONI_PATTERN.search(content)
-        if match:
-            return f"{match.group(1)}mq"
-    return None
-
-
-def extract_alimentazione(messages: List[Dict]) -> Optional[str]:
-    """Estrae tipo alimentazione"""
-    for msg in reversed(messages):
-        content = msg.get('content', '')
-        match = ALIMENTAZIONE_PATTERN.search(content)
-        if match:
-            ali = match.group(1).lower()
-            if 'elettric' in ali:
-                return 'elettrico'
-            elif 'batteria' in ali:
-                return 'batteria'
-            elif 'benzina' in ali or 'scoppio' in ali:
-                return 'benzina'
-    return None
+def append_history(conversation: Dict, role: str, content: str):
+    """Aggiunge un messaggio alla storia e aggiorna il contesto incrementale"""
+    message = {'role': role, 'content': content}
+    conversation['history'].append(message)
+    conversation['context'].update(message)
+
+
+def model_mention_only(user_message: str) -> bool:
+    """Il messaggio cita modelli senza intento accessori, categoria, area o budget"""
+    entities = scan_entities(user_message)
+    return not (entities.cerca_accessori or entities.categoria_requisiti
+                or entities.area_mq is not None or entities.budget is not None)
+
+
+def seed_model_candidates(
+    products_with_scores: List[Tuple[dict, float]],
+    model_matches: List[Tuple[dict, float]],
+    user_message: str
+) -> List[Tuple[dict, float]]:
+    """
+    Aggiunge i modelli citati ai candidati del retrieval (con lo score del
+    migliore), tranne quando si cercano accessori: "batteria per A 1500"
+    vuole le batterie, non il robot
+    """
+    if not model_matches or scan_entities(user_message).cerca_accessori:
+        return products_with_scores
+    seen = {product.get('id') for product, _ in products_with_scores}
+    top = max((score for _, score in products_with_scores), default=1.0)
+    return products_with_scores + [(product, top) for product, _ in model_matches
+                                   if product.get('id') not in seen]
 
 
 def detect_show_all_intent(user_message: str, detected_category: str = None) -> bool:
-    message_lower = user_message.lower()
-    show_all_keywords = ['tutti', 'all', 'tutta la gamma', 'mostrami tutto', 'fammi vedere tutti', 'mostrami tutti', 'elenca tutti', 'voglio vedere tutti', 'dammi tutti', 'quali sono tutti']
-    has_show_all = any(kw in message_lower for kw in show_all_keywords)
+    has_show_all, has_explicit_category = wants_full_catalog(user_message)
     has_category = detected_category is not None
-    category_keywords = ['robot', 'trattorini', 'tagliaerba', 'decespugliatori', 'motoseghe', 'tagliasiepi', 'idropulitrici', 'soffiatori']
-    has_explicit_category = any(cat in message_lower for cat in category_keywords)
     result = has_show_all and (has_category or has_explicit_category)
     if result:
         print(f"🎯 Modalità CATALOGO COMPLETO attivata per query: '{user_message}'")
     return result
 
-def build_enriched_query(user_message: str, conversation_history: List[Dict]) -> str:
+def build_enriched_query(user_message: str, session_context: ConversationContext) -> str:
     """
     Arricchisce query con contesto conversazionale
     
-    Performance: <10ms
+    Performance: O(1), il contesto è aggiornato a ogni messaggio
     Accuratezza: 95%+
     
     Args:
         user_message: Messaggio corrente utente
-        conversation_history: Storia conversazione
+        session_context: Contesto incrementale della sessione (ultimi messaggi)
     
     Returns:
         Query arricchita con contesto
     """
     enriched_parts = [user_message]
     
-    # Analizza ultimi 8 messaggi (4 turni)
-    recent = conversation_history[-8:] if len(conversation_history) > 8 else conversation_history
-    
-    # Estrazione veloce con pattern precompilati
-    context = {
-        'accessorio': extract_accessorio(recent),
-        'modello': extract_modello(recent),
-        'categoria': extract_categoria(recent),
-        'dimensioni': extract_dimensioni(recent),
-        'alimentazione': extract_alimentazione(recent)
-    }
+    # Ultime menzioni negli ultimi CONTEXT_WINDOW_MESSAGES messaggi
+    context = session_context.snapshot()
     
     # Costruzione query semantica (ordine: specifico → generico)
     if context['accessorio']:
@@ -373,14 +313,8 @@ def chat():
     
     try:
         # 1. Recupera storia conversazione
-        if session_id not in conversations:
-            conversations[session_id] = {
-                'history': [],
-                'last_products': [],
-                'last_products_data': []
-            }
-        
-        history = conversations[session_id]['history']
+        conversation = get_conversation(session_id)
+        history = conversation['history']
         
         # 2. Rileva richiesta di confronto con prodotti precedenti
         confronto_keywords = ['confronta', 'confrontali', 'confronto', 'mettili a confronto', 
@@ -392,18 +326,23 @@ def chat():
         if is_confronto and conversations[session_id].get('last_products'):
             # Verifica se l'utente si riferisce ai prodotti precedenti
             # (non specifica nuovi modelli nella richiesta)
-            new_model_match = MODELLO_PATTERN.search(user_message)
-            if not new_model_match:
+            if not retriever.gazetteer.scan(user_message):
                 use_previous_products = True
                 print(f"🔄 Confronto richiesto - uso prodotti precedenti: {conversations[session_id]['last_products']}")
         
         # 3. Arricchisci query con contesto conversazionale
-        enriched_query = build_enriched_query(user_message, history)
+        enriched_query = build_enriched_query(user_message, conversation['context'])
         
         # 4. Estrai requisiti per creare filtri
         requirements = matcher.extract_requirements(enriched_query)
         
         # 5. Retrieval o uso prodotti precedenti
+        exact_matches = [] if use_previous_products else retriever.lookup_exact(user_message)
+        # Modelli citati nel messaggio (gazetteer): diretti solo se il messaggio
+        # non chiede altro, altrimenti candidati aggiuntivi del retrieval
+        model_matches = [] if use_previous_products or exact_matches else retriever.lookup_models(user_message)
+        model_only = bool(model_matches) and model_mention_only(user_message)
+        
         if use_previous_products:
             # Usa i prodotti mostrati in precedenza per il confronto
             reranked = []
@@ -412,6 +351,14 @@ def chat():
                 if product:
                     reranked.append((product, 1.0, ['confronto_richiesto']))
             print(f"📦 Uso {len(reranked)} prodotti precedenti per confronto")
+        elif exact_matches:
+            # EAN/SKU/nome esatto: niente retrieval né re-ranking
+            reranked = [(product, score, ['match_esatto']) for product, score in exact_matches]
+            print(f"⚡ Match esatto: {len(reranked)} prodotti")
+        elif model_only:
+            # Solo modelli citati nel testo: niente retrieval né re-ranking
+            reranked = [(product, score, ['modello_citato']) for product, score in model_matches]
+            print(f"🏷️  Modelli citati: {len(reranked)} prodotti")
         else:
             # Flusso normale: retrieval + reranking
             filters = {}
@@ -419,10 +366,16 @@ def chat():
                 filters['categoria'] = requirements['categoria']
                 print(f"🔍 Filtro categoria attivo: {filters['categoria']}")
             
-            products_with_scores = retriever.search(enriched_query, top_k=20, filters=filters)
+            # Budget/area come filtri di range; se nessun prodotto li soddisfa si cerca senza
+            range_filters = matcher.requirement_filters(requirements)
+            products_with_scores = retriever.search(enriched_query, top_k=20, filters={**filters, **range_filters}, exact_prefix=False)
+            if range_filters and not products_with_scores:
+                products_with_scores = retriever.search(enriched_query, top_k=20, filters=filters, exact_prefix=False)
             print(f"📦 Trovati {len(products_with_scores)} prodotti dal retriever")
             
-            reranked = matcher.rerank_products(products_with_scores, enriched_query)
+            products_with_scores = seed_model_candidates(products_with_scores, model_matches, user_message)
+            model_ids = {product.get('id') for product, _ in model_matches}
+            reranked = matcher.rerank_products(products_with_scores, enriched_query, boost_ids=model_ids)
 
         # Rileva modalità mostra tutti
         detected_category = requirements.get('categoria')
@@ -440,7 +393,8 @@ def chat():
         raw_response = claude.chat(
             user_message,
             conversation_history=history,
-            products_context=products_context
+            products_context=products_context,
+            session_id=session_id
         )
         
         # 8. Parsea risposta per estrarre testo, IDs prodotti e comparatore
@@ -450,14 +404,8 @@ def chat():
         print(f"🏷️  Prodotti selezionati da Claude: {selected_product_ids}")
         
         # 9. Aggiorna storia (salva solo testo pulito)
-        conversations[session_id]['history'].append({
-            'role': 'user',
-            'content': user_message
-        })
-        conversations[session_id]['history'].append({
-            'role': 'assistant',
-            'content': response_text
-        })
+        append_history(conversation, 'user', user_message)
+        append_history(conversation, 'assistant', response_text)
         
         # 10. Salva i prodotti mostrati per confronti futuri
         if selected_product_ids:
@@ -530,7 +478,8 @@ def chat():
             'products_count': len(products_data),
             'top_products': product_names[:5],
             'categories': list(set(categories)),
-            'has_comparison': comparator_data is not None
+            'has_comparison': comparator_data is not None,
+            'token_usage': claude.get_session_usage(session_id)
         }, ensure_ascii=False))
         
         # Log risultati (database) - UNICA chiamata con product_names
@@ -601,14 +550,8 @@ def chat_stream():
             yield f"data: {json.dumps({'type': 'loading', 'text': 'Sto cercando nel catalogo STIGA...'}, ensure_ascii=False)}\n\n"
             
             # 2. Storia conversazione
-            if session_id not in conversations:
-                conversations[session_id] = {
-                    'history': [],
-                    'last_products': [],
-                    'last_products_data': []
-                }
-            
-            history = conversations[session_id]['history']
+            conversation = get_conversation(session_id)
+            history = conversation['history']
             
             # 3. Rileva confronto
             confronto_keywords = ['confronta', 'confrontali', 'confronto', 'mettili a confronto', 
@@ -617,12 +560,11 @@ def chat_stream():
             use_previous_products = False
             
             if is_confronto and conversations[session_id].get('last_products'):
-                new_model_match = MODELLO_PATTERN.search(user_message)
-                if not new_model_match:
+                if not retriever.gazetteer.scan(user_message):
                     use_previous_products = True
             
             # 4. Arricchisci query
-            enriched_query = build_enriched_query(user_message, history)
+            enriched_query = build_enriched_query(user_message, conversation['context'])
             
             # 5. Requisiti
             requirements = matcher.extract_requirements(enriched_query)
@@ -630,19 +572,32 @@ def chat_stream():
             # 6. RETRIEVAL
             yield f"data: {json.dumps({'type': 'loading', 'text': 'Trovati alcuni modelli!'}, ensure_ascii=False)}\n\n"
             
+            exact_matches = [] if use_previous_products else retriever.lookup_exact(user_message)
+            model_matches = [] if use_previous_products or exact_matches else retriever.lookup_models(user_message)
+            model_only = bool(model_matches) and model_mention_only(user_message)
+            
             if use_previous_products:
                 reranked = []
                 for pid in conversations[session_id]['last_products']:
                     product = retriever.get_product_by_id(pid)
                     if product:
                         reranked.append((product, 1.0, ['confronto_richiesto']))
+            elif exact_matches:
+                reranked = [(product, score, ['match_esatto']) for product, score in exact_matches]
+            elif model_only:
+                reranked = [(product, score, ['modello_citato']) for product, score in model_matches]
             else:
                 filters = {}
                 if 'categoria' in requirements:
                     filters['categoria'] = requirements['categoria']
                 
-                products_with_scores = retriever.search(enriched_query, top_k=20, filters=filters)
-                reranked = matcher.rerank_products(products_with_scores, enriched_query)
+                range_filters = matcher.requirement_filters(requirements)
+                products_with_scores = retriever.search(enriched_query, top_k=20, filters={**filters, **range_filters}, exact_prefix=False)
+                if range_filters and not products_with_scores:
+                    products_with_scores = retriever.search(enriched_query, top_k=20, filters=filters, exact_prefix=False)
+                products_with_scores = seed_model_candidates(products_with_scores, model_matches, user_message)
+                model_ids = {product.get('id') for product, _ in model_matches}
+                reranked = matcher.rerank_products(products_with_scores, enriched_query, boost_ids=model_ids)
             
             # Modalità show all
             detected_category = requirements.get('categoria')
@@ -657,7 +612,8 @@ def chat_stream():
             for chunk in claude.stream_chat(
                 user_message,
                 conversation_history=history,
-                products_context=products_context
+                products_context=products_context,
+                session_id=session_id
             ):
                 full_response += chunk
                 yield f"data: {json.dumps({'type': 'chunk', 'text': chunk}, ensure_ascii=False)}\n\n"
@@ -666,14 +622,8 @@ def chat_stream():
             response_text, selected_product_ids, comparator_data = parse_claude_response(full_response)
             
             # 10. Aggiorna storia
-            conversations[session_id]['history'].append({
-                'role': 'user',
-                'content': user_message
-            })
-            conversations[session_id]['history'].append({
-                'role': 'assistant',
-                'content': response_text
-            })
+            append_history(conversation, 'user', user_message)
+            append_history(conversation, 'assistant', response_text)
             
             # 11. Salva prodotti
             if selected_product_ids:
@@ -826,6 +776,65 @@ def get_categories():
     return jsonify({'categories': categories})
 
 
+@app.route('/api/search', methods=['GET'])
+@auth.login_required
+def search_products():
+    """
+    Ricerca a faccette per i chip di filtro del widget (senza LLM né encoder)
+    
+    Query string:
+        q: testo (opzionale)
+        categoria, sottocategoria, alimentazione, fascia_prezzo, tecnologie:
+            ripetibili, valori in OR dentro la stessa faccetta
+        <spec>_min / <spec>_max: range numerici (prezzo, area, batteria, ...)
+        limit: numero di risultati (default 20, max 100)
+    """
+    start = time.perf_counter()
+    
+    filters = {}
+    for field in FacetBitsets.FIELDS:
+        values = [v for v in request.args.getlist(field) if v.strip()]
+        if values:
+            filters[field] = values
+    for name in SPEC_EXTRACTORS:
+        for bound in ('min', 'max'):
+            key = f'{name}_{bound}'
+            if key in request.args:
+                try:
+                    filters[key] = float(request.args[key].replace(',', '.'))
+                except ValueError:
+                    return jsonify({'error': f'Valore non numerico per {key}'}), 400
+    
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 0), 100)
+    except ValueError:
+        return jsonify({'error': 'limit non valido'}), 400
+    
+    found = retriever.faceted_search(request.args.get('q', ''), filters, top_k=limit)
+    
+    results = []
+    for product, score in found['results']:
+        immagini = product.get('immagini', [])
+        results.append({
+            'id': product.get('id'),
+            'nome': product.get('nome'),
+            'categoria': product.get('categoria', ''),
+            'sottocategoria': product.get('sottocategoria', ''),
+            'prezzo': product.get('prezzo', 'Contattaci'),
+            'prezzo_originale': product.get('prezzo_originale', ''),
+            'url': product.get('url', ''),
+            'image_url': immagini[0] if immagini else "/static/images/stiga-robot.webp",
+            'score': float(round(score, 3))
+        })
+    
+    return jsonify({
+        'results': results,
+        'total': found['total'],
+        'facets': found['facets'],
+        'took_ms': round((time.perf_counter() - start) * 1000, 3)
+    })
+
+
 @app.route('/api/product/<product_id>', methods=['GET'])
 @auth.login_required
 def get_product(product_id):
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark dello scanner di entità (src/rag/entities.py) contro il
+percorso precedente: una regex per categoria, ACCESSORIO/DIMENSIONI/
+ALIMENTAZIONE_PATTERN e le regex di ProductMatcher.extract_requirements
+(i modelli sono passati al gazetteer del catalogo, src/rag/gazetteer.py).
+Verifica anche che i due percorsi estraggano le stesse entità.
+"""
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import argparse
+import json
+import re
+import time
+
+from src.config import PRODUCTS_FILE
+from src.rag import lexicon
+from src.rag.entities import scan_entities
+
+# ─── Percorso precedente (copia delle regex sostituite) ────────────────
+
+LEGACY_CATEGORIA_PATTERNS = {
+    'robot tagliaerba': re.compile(r'\brobot\b.*\btagliaerba\b|\btagliaerba\b.*\brobot\b', re.IGNORECASE),
+    'trattorino': re.compile(r'\btrattorino\b|\btrattorini\b', re.IGNORECASE),
+    'tagliaerba': re.compile(r'\btagliaerba\b', re.IGNORECASE),
+    'decespugliatore': re.compile(r'\bdecespugliator[ei]\b|\btagliabordi\b', re.IGNORECASE),
+    'motosega': re.compile(r'\bmotosega\b|\bmotoseghe\b', re.IGNORECASE),
+    'idropulitrice': re.compile(r'\bidropulitric[ei]\b|\balta pressione\b', re.IGNORECASE),
+    'spazzaneve': re.compile(r'\bspazzaneve\b', re.IGNORECASE),
+    'biotrituratore': re.compile(r'\bbiotrituratore?\b', re.IGNORECASE),
+    'motozappa': re.compile(r'\bmotozappa\b|\bmotozappe\b', re.IGNORECASE),
+    'spazzatrice': re.compile(r'\bspazzatric[ei]\b', re.IGNORECASE),
+    'soffiatore': re.compile(r'\bsoffiator[ei]\b|\baspirator[ei]\b', re.IGNORECASE),
+    'tagliasiepi': re.compile(r'\btagliasiepi\b', re.IGNORECASE),
+    'forbici': re.compile(r'\bforbici\b|\bcesoie\b', re.IGNORECASE),
+    'arieggiatore': re.compile(r'\barieggiat\w+|\bscarificat\w+', re.IGNORECASE)
+}
+LEGACY_ACCESSORIO_PATTERN = re.compile(
+    r'\b(lam[ae]|batteria|batterie|caricabatterie|filo|testina|catene?|spazzola|sacco|piatto|ruote?|copertura|kit|ricambi?|accessori?)\b',
+    re.IGNORECASE
+)
+LEGACY_DIMENSIONI_PATTERN = re.compile(r'(\d+)\s*(?:m²|mq|metri|metro)', re.IGNORECASE)
+LEGACY_ALIMENTAZIONE_PATTERN = re.compile(r'\b(elettric[oa]|batteria|benzina|scoppio)\b', re.IGNORECASE)
+LEGACY_REQUIREMENT_PATTERNS = {
+    'robot tagliaerba': r'\brobot\b.*\btagliaerba\b|\btagliaerba\b.*\brobot\b',
+    'robot': r'\brobot\b',
+    'trattorino': r'\btrattorino\b',
+    'tagliaerba': r'\btagliaerba\b',
+    'decespugliatore': r'\bdecespugliator[ei]\b',
+    'motosega': r'\bmotosega\b',
+    'idropulitrice': r'\bidropulitric[ei]\b',
+    'tagliasiepi': r'\btagliasiepi\b',
+}
+
+
+def legacy_entities(text: str) -> tuple:
+    """Stesse entità di scan_entities, una regex per campo"""
+    lower = text.lower()
+
+    match = LEGACY_DIMENSIONI_PATTERN.search(text)
+    dimensioni = f"{match.group(1)}mq" if match else None
+    match = re.search(r'(\d+)\s*(?:m²|mq|metri)', lower)
+    area = int(match.group(1)) if match else None
+    match = re.search(r'(\d+)\s*(?:€|euro)', lower)
+    budget = int(match.group(1)) if match else None
+
+    match = LEGACY_ACCESSORIO_PATTERN.search(text)
+    accessorio = match.group(1).lower() if match else None
+    categoria = next((c for c, p in LEGACY_CATEGORIA_PATTERNS.items() if p.search(text)), None)
+
+    alimentazione = None
+    match = LEGACY_ALIMENTAZIONE_PATTERN.search(text)
+    if match:
+        ali = match.group(1).lower()
+        alimentazione = 'elettrico' if 'elettric' in ali else 'batteria' if 'batteria' in ali else 'benzina'
+
+    categoria_requisiti = next(
+        (c for c, p in LEGACY_REQUIREMENT_PATTERNS.items() if re.search(p, lower)), None
+    )
+    words = set(lower.split())
+    cerca_accessori = any(k in lower or k in words for k in lexicon.ACCESSORY_KEYWORDS)
+
+    return (dimensioni, area, budget, accessorio, categoria,
+            alimentazione, categoria_requisiti, cerca_accessori)
+
+
+SAMPLE_QUERIES = [
+    "Cerco un robot tagliaerba per 800 mq con budget 1500 euro",
+    "Mi serve una lama per il Combi 48 E",
+    "tagliaerba a batteria per giardino di 300 metri",
+    "Quale decespugliatore a scoppio mi consigli?",
+    "Confronta A 1500 e A 3000",
+    "idropulitrice alta pressione sotto i 400€",
+    "mostrami tutti i trattorini",
+    "Swift 55 S o Estate 384?",
+]
+
+
+def timed(fn, texts, rounds: int) -> float:
+    """Microsecondi medi per testo"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        scan_entities.cache_clear()
+        lexicon.scan.cache_clear()
+        lexicon._by_kind.cache_clear()
+        for text in texts:
+            fn(text)
+    return (time.perf_counter() - start) / (rounds * len(texts)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scanner di entità")
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    with open(PRODUCTS_FILE, 'r', encoding='utf-8') as f:
+        products = json.load(f)
+
+    # Messaggi brevi (query) e lunghi (descrizioni, simili alle risposte dell'assistente)
+    sets = {
+        'query': list(dict.fromkeys(SAMPLE_QUERIES + [p.get('nome', '') for p in products])),
+        'testi lunghi': list(dict.fromkeys(p.get('descrizione', '') for p in products if p.get('descrizione')))
+    }
+
+    print("="*70)
+    print("⏱️  SCANNER DI ENTITÀ vs REGEX PER CAMPO")
+    print("="*70)
+
+    for label, texts in sets.items():
+        mismatches = [t for t in texts if tuple(scan_entities(t)) != legacy_entities(t)]
+        legacy = timed(legacy_entities, texts, args.rounds)
+        scanner = timed(scan_entities, texts, args.rounds)
+        print(f"\n{label} ({len(texts)} testi)")
+        print(f"   regex per campo: {legacy:8.1f} µs/testo")
+        print(f"   scanner unico:   {scanner:8.1f} µs/testo  ({legacy / scanner:.1f}x)")
+        print(f"   differenze:      {len(mismatches)}")
+        for text in mismatches[:3]:
+            print(f"      {text[:80]!r}")
+
+
+if __name__ == '__main__':
+    main()
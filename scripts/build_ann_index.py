@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Costruisce l'indice IVF (retrieval approssimato) accanto agli embeddings prodotti
+e riporta recall@k e latenza rispetto allo scan esatto
+"""
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import argparse
+import time
+import numpy as np
+
+from src.config import EMBEDDINGS_FILE, EMBEDDINGS_STORE_FILE, ANN_INDEX_FILE
+from src.rag.ann_index import IVFIndex, ids_digest
+from src.rag.embedding_store import load_embeddings, normalize_rows as normalize
+
+
+def evaluate(index: IVFIndex, matrix: np.ndarray, nprobe: int, top_k: int, sample: int):
+    """Recall@k medio e latenza usando righe del catalogo (con rumore) come query"""
+    rng = np.random.default_rng(1)
+    picks = rng.choice(len(matrix), min(sample, len(matrix)), replace=False)
+    queries = normalize(matrix[picks] + rng.normal(0, 0.02, (len(picks), matrix.shape[1])))
+    
+    recalls, ann_times, exact_times = [], [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        exact = np.argpartition(-(matrix @ q), top_k - 1)[:top_k]
+        t1 = time.perf_counter()
+        rows = index.candidates(q, nprobe)
+        scores = matrix[rows] @ q
+        k = min(top_k, len(rows))
+        approx = rows[np.argpartition(-scores, k - 1)[:k]]
+        t2 = time.perf_counter()
+        
+        recalls.append(len(np.intersect1d(exact, approx)) / top_k)
+        exact_times.append(t1 - t0)
+        ann_times.append(t2 - t1)
+    
+    return float(np.mean(recalls)), float(np.median(exact_times)), float(np.median(ann_times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Costruisce l'indice IVF degli embeddings prodotti")
+    parser.add_argument('--lists', type=int, default=None, help="Numero di liste (default ~4·√N)")
+    parser.add_argument('--iterations', type=int, default=20, help="Iterazioni k-means")
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16], help="nprobe da valutare")
+    parser.add_argument('--top-k', type=int, default=10, help="k per la recall")
+    parser.add_argument('--sample', type=int, default=200, help="Query di valutazione")
+    args = parser.parse_args()
+    
+    print("="*70)
+    print("🚀 COSTRUZIONE INDICE IVF")
+    print("="*70)
+    print()
+    
+    print("📂 Caricamento embeddings...")
+    matrix, product_ids, _, _ = load_embeddings(EMBEDDINGS_STORE_FILE, EMBEDDINGS_FILE)
+    matrix = normalize(matrix)
+    print(f"✅ Caricati {len(matrix)} embeddings ({matrix.shape[1]} dim)")
+    print()
+    
+    print("🧠 K-means sferico...")
+    t0 = time.perf_counter()
+    index = IVFIndex.build(
+        matrix,
+        n_lists=args.lists,
+        iterations=args.iterations,
+        digest=ids_digest(product_ids, len(matrix))
+    )
+    print(f"✅ {index.n_lists} liste in {time.perf_counter() - t0:.1f}s")
+    print()
+    
+    index.save(ANN_INDEX_FILE)
+    print(f"💾 Indice salvato in: {ANN_INDEX_FILE}")
+    print()
+    
+    print("="*70)
+    print("📊 RECALL / LATENZA (vs scan esatto)")
+    print("="*70)
+    for nprobe in args.nprobe:
+        recall, exact_ms, ann_ms = evaluate(index, matrix, nprobe, args.top_k, args.sample)
+        print(f"nprobe={nprobe:<4} recall@{args.top_k}={recall:.3f}  "
+              f"esatto={exact_ms * 1000:.3f}ms  ivf={ann_ms * 1000:.3f}ms")
+    print()
+    print("Imposta RETRIEVAL_INDEX=ivf e ANN_NPROBE nel .env per attivarlo.")
+
+
+if __name__ == '__main__':
+    main()
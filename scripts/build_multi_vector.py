@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Costruisce l'indice multi-vettore (chunk per prodotto) accanto agli embeddings
+prodotti, nello stesso ordine righe dello store principale.
+Come generate_embeddings.py ricodifica solo i chunk nuovi o cambiati.
+"""
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import argparse
+import json
+from collections import Counter
+import numpy as np
+
+from src.config import EMBEDDING_MODEL, PRODUCTS_FILE, EMBEDDINGS_STORE_FILE, MULTI_VECTOR_FILE
+from src.rag.build_pipeline import EmbeddingBuilder
+from src.rag.embedding_store import read_manifest, incremental_embeddings, write_store
+from src.rag.multi_vector import chunk_texts_for_store, chunk_product_id
+from src.rag.product_text import CHUNK_BUILDER_VERSION, create_product_chunks, build_metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indice multi-vettore dei prodotti")
+    parser.add_argument('--full', action='store_true', help="Ricodifica tutti i chunk")
+    parser.add_argument('--max-chars', type=int, default=400, help="Caratteri massimi per chunk")
+    parser.add_argument('--workers', type=int, default=0, help="Processi di encoding (0 = metà dei core)")
+    parser.add_argument('--batch-size', type=int, default=32)
+    args = parser.parse_args()
+
+    print("="*70)
+    print("🧩 INDICE MULTI-VETTORE")
+    print("="*70)
+    print()
+
+    with open(PRODUCTS_FILE, 'r', encoding='utf-8') as f:
+        products = json.load(f)
+
+    # Stesso ordine righe dello store principale: i chunk di ogni riga restano contigui
+    manifest = read_manifest(EMBEDDINGS_STORE_FILE)
+    chunk_ids, texts = chunk_texts_for_store(
+        manifest['product_ids'],
+        {p['id']: p for p in products},
+        lambda product: create_product_chunks(product, args.max_chars)
+    )
+    per_product = np.array(list(Counter(chunk_product_id(c) for c in chunk_ids).values()))
+    print(f"📂 {len(per_product)} prodotti → {len(chunk_ids)} chunk "
+          f"(medio {per_product.mean():.1f}, max {per_product.max()})")
+    print()
+
+    builder = EmbeddingBuilder(EMBEDDING_MODEL, workers=args.workers, batch_size=args.batch_size)
+    print("🧠 Encoding chunk...")
+    matrix, text_hashes, stats = incremental_embeddings(
+        None if args.full else MULTI_VECTOR_FILE,
+        chunk_ids,
+        texts,
+        EMBEDDING_MODEL,
+        builder.encode
+    )
+    print(f"✅ Codificati {stats['encoded']} chunk, riusati {stats['reused']}, rimossi {stats['removed']}")
+    builder.print_report()
+
+    # Nessun riordino per categoria: l'ordine è già quello dello store principale
+    write_store(
+        MULTI_VECTOR_FILE,
+        matrix,
+        product_ids=chunk_ids,
+        model_name=EMBEDDING_MODEL,
+        extra={**build_metadata(products), 'chunk_builder_version': CHUNK_BUILDER_VERSION},
+        text_hashes=text_hashes
+    )
+    print(f"💾 Salvato: {MULTI_VECTOR_FILE}")
+    print()
+    print("Imposta MULTI_VECTOR_INDEX=True nel .env per attivarlo.")
+
+
+if __name__ == '__main__':
+    main()
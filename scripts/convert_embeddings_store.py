@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Converte il vecchio products_embeddings.pkl nello store memory-mapped
+(products_embeddings.npy + manifest), senza ricalcolare gli embeddings
+"""
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import json
+import pickle
+
+from src.config import PRODUCTS_FILE, EMBEDDINGS_FILE, EMBEDDINGS_STORE_FILE, EMBEDDING_MODEL
+from src.rag.embedding_store import write_store, manifest_path
+from src.rag.quantization import refresh_quantized
+
+
+def main():
+    print("="*70)
+    print("🔁 CONVERSIONE EMBEDDINGS PICKLE → STORE MEMORY-MAPPED")
+    print("="*70)
+    print()
+    
+    print(f"📂 Caricamento pickle da: {EMBEDDINGS_FILE}")
+    with open(EMBEDDINGS_FILE, 'rb') as f:
+        data = pickle.load(f)
+    
+    if 'product_ids' not in data:
+        print("❌ Il pickle non contiene product_ids: rigenera con scripts/generate_embeddings.py")
+        sys.exit(1)
+    
+    with open(PRODUCTS_FILE, 'r', encoding='utf-8') as f:
+        products = json.load(f)
+    
+    # Pickle generati da ProductEmbedder salvavano la dimensione al posto del modello
+    model_name = data['model_name'] if isinstance(data['model_name'], str) else EMBEDDING_MODEL
+    
+    manifest = write_store(
+        EMBEDDINGS_STORE_FILE,
+        data['embeddings'],
+        product_ids=data['product_ids'],
+        model_name=model_name,
+        products=products
+    )
+    
+    # Copie int8/float16 esistenti riallineate al nuovo store
+    refreshed = refresh_quantized(EMBEDDINGS_STORE_FILE)
+    if refreshed:
+        print(f"✅ Quantizzati riallineati: {', '.join(refreshed)}")
+    
+    print(f"✅ Store scritto: {EMBEDDINGS_STORE_FILE}")
+    print(f"✅ Manifest: {manifest_path(EMBEDDINGS_STORE_FILE)}")
+    print(f"   Righe: {manifest['count']} | Dimensione: {manifest['dimension']} | Modello: {manifest['model_name']}")
+
+
+if __name__ == '__main__':
+    main()
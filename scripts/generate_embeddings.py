@@ -7,75 +7,45 @@ import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+import argparse
 import json
-import pickle
-from sentence_transformers import SentenceTransformer
-import numpy as np
 from tqdm import tqdm
 
+from src.config import EMBEDDING_MODEL
+from src.rag.embedding_store import (
+    write_store, manifest_path, open_store, read_manifest, incremental_embeddings, manifest_staleness,
+    verify_store
+)
+from src.rag.quantization import write_quantized, report_quantization
+from src.rag.build_pipeline import EmbeddingBuilder
+from src.rag.product_text import create_product_text, build_metadata
+
 # Config
-MODEL_NAME = 'sentence-transformers/paraphrase-multilingual-mpnet-base-v2'
+MODEL_NAME = EMBEDDING_MODEL
 PRODUCTS_PATH = Path(__file__).parent.parent / 'data' / 'stiga_products.json'
-OUTPUT_PATH = Path(__file__).parent.parent / 'data' / 'embeddings' / 'products_embeddings.pkl'
-
-def create_product_text(product: dict) -> str:
-    """Crea testo completo per embedding"""
-    parts = []
-    
-    # Nome
-    if product.get('nome'):
-        parts.append(product['nome'])
-    
-    # Categoria (ripetuta 2 volte per boost)
-    if product.get('categoria'):
-        categoria = product['categoria']
-        parts.append(f"{categoria} {categoria}")
-    
-    # Descrizione COMPLETA
-    descrizione = product.get('descrizione_completa') or product.get('descrizione', '')
-    if descrizione:
-        parts.append(descrizione)
-    
-    # Caratteristiche
-    if product.get('caratteristiche'):
-        caratteristiche = product['caratteristiche']
-        if caratteristiche and isinstance(caratteristiche[0], dict):
-            chars_text = ". ".join([f"{c['titolo']}: {c['descrizione']}" for c in caratteristiche])
-        else:
-            chars_text = ", ".join(caratteristiche)
-        parts.append("Caratteristiche: " + chars_text)
-    
-    # Specifiche tecniche
-    specs = product.get('specifiche_tecniche', {})
-    if specs:
-        specs_text = []
-        for key, value in specs.items():
-            if value:
-                specs_text.append(f"{key}: {value}")
-        
-        if specs_text:
-            parts.append("Specifiche: " + ", ".join(specs_text))
-    
-    # Keywords
-    if product.get('keywords'):
-        parts.append("Keywords: " + ", ".join(product['keywords']))
-    
-    # Prezzo
-    if product.get('prezzo'):
-        parts.append(f"Prezzo: {product['prezzo']}")
-    
-    return " | ".join(parts)
+OUTPUT_PATH = Path(__file__).parent.parent / 'data' / 'embeddings' / 'products_embeddings.npy'
 
 def main():
+    parser = argparse.ArgumentParser(description="Genera gli embeddings prodotti (incrementale)")
+    parser.add_argument('--full', action='store_true', help="Ricodifica tutti i prodotti")
+    parser.add_argument('--workers', type=int, default=0, help="Processi di encoding (0 = metà dei core)")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--shard-size', type=int, default=256, help="Testi per shard")
+    args = parser.parse_args()
+    
     print("="*70)
     print("🚀 GENERAZIONE EMBEDDINGS PRODOTTI STIGA - FIXED")
     print("="*70)
     print()
     
-    # Carica modello
-    print(f"📦 Caricamento modello: {MODEL_NAME}")
-    model = SentenceTransformer(MODEL_NAME)
-    print("✅ Modello caricato!")
+    # Il modello viene caricato dai worker solo se c'è qualcosa da codificare
+    builder = EmbeddingBuilder(
+        MODEL_NAME,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        shard_size=args.shard_size
+    )
+    print(f"📦 Modello: {MODEL_NAME} ({builder.workers} worker x {builder.threads} thread)")
     print()
     
     # Carica prodotti
@@ -97,38 +67,62 @@ def main():
     print(f"✅ Preparati {len(texts)} testi")
     print()
     
+    # Solo i prodotti nuovi o con testo cambiato passano dal modello
     print("🧠 Encoding con modello...")
-    embeddings = model.encode(texts, show_progress_bar=True, batch_size=32)
-    
-    print(f"✅ Generati {len(embeddings)} embeddings")
+    embeddings, text_hashes, stats = incremental_embeddings(
+        None if args.full else OUTPUT_PATH,
+        [p['id'] for p in products],
+        texts,
+        MODEL_NAME,
+        builder.encode
+    )
+    
+    if stats['full']:
+        print(f"✅ Ricodifica completa: {stats['encoded']} prodotti")
+    else:
+        print(f"✅ Ricodificati {stats['encoded']} prodotti, riusati {stats['reused']}, rimossi {stats['removed']}")
     print(f"   Dimensione embeddings: {embeddings.shape}")
+    builder.print_report()
     print()
     
-    # Crea directory output se non esiste
-    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    # Nessuna riga cambiata: si riscrive comunque se il manifest non è allineato
+    # (builder, hash dei testi), altrimenti lo store resterebbe "non aggiornato"
+    metadata = build_metadata(products)
+    unchanged = not stats['full'] and stats['encoded'] == 0 and stats['removed'] == 0
+    if unchanged and not manifest_staleness(read_manifest(OUTPUT_PATH), MODEL_NAME, metadata):
+        print("✅ Embeddings già aggiornati: nessun file riscritto")
+        return
     
-    # Salva embeddings CON PRODUCT_IDS
+    # Salva embeddings CON PRODUCT_IDS (store memory-mapped + manifest)
     print(f"💾 Salvataggio embeddings in: {OUTPUT_PATH}")
     
-    data_to_save = {
-        'embeddings': embeddings,
-        'product_ids': [p['id'] for p in products],  # CRITICAL FIX!
-        'model_name': MODEL_NAME,
-        'num_products': len(products),
-        'embedding_dim': embeddings.shape[1]
-    }
-    
-    with open(OUTPUT_PATH, 'wb') as f:
-        pickle.dump(data_to_save, f)
+    manifest = write_store(
+        OUTPUT_PATH,
+        embeddings,
+        product_ids=[p['id'] for p in products],  # CRITICAL FIX!
+        model_name=MODEL_NAME,
+        products=products,
+        extra=metadata,
+        text_hashes=text_hashes
+    )
+    
+    print(f"✅ Embeddings salvati con successo! (manifest: {manifest_path(OUTPUT_PATH).name})")
+    verify_store(OUTPUT_PATH)
+    print("✅ sha1 della matrice verificato contro il manifest")
+    print()
     
-    print("✅ Embeddings salvati con successo!")
+    # Versioni quantizzate (int8 + float16) per lo scan compatto
+    print("🗜️  Quantizzazione int8 / float16...")
+    stored_matrix, stored_manifest = open_store(OUTPUT_PATH)
+    write_quantized(OUTPUT_PATH, stored_matrix, product_ids=stored_manifest['product_ids'])
+    report_quantization(OUTPUT_PATH, ['int8', 'float16'], top_k=10, rescore_factor=4, sample=200)
     print()
     
     print("="*70)
     print("📊 STATISTICHE")
     print("="*70)
     print(f"Prodotti processati: {len(products)}")
-    print(f"Product IDs salvati: {len(data_to_save['product_ids'])}")
+    print(f"Product IDs salvati: {len(manifest['product_ids'])}")
     print(f"Embeddings generati: {len(embeddings)}")
     print(f"Dimensione embeddings: {embeddings.shape[1]}")
     print(f"Modello utilizzato: {MODEL_NAME}")
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Genera le versioni int8 / float16 dello store embeddings e riporta
+la perdita di recall rispetto alla ricerca esatta
+"""
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import argparse
+
+from src.config import EMBEDDINGS_STORE_FILE
+from src.rag.embedding_store import open_store
+from src.rag.quantization import QUANTIZATION_KINDS, write_quantized, report_quantization
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantizza gli embeddings prodotti")
+    parser.add_argument('--kinds', nargs='+', default=list(QUANTIZATION_KINDS), choices=QUANTIZATION_KINDS)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--rescore-factor', type=int, default=4)
+    parser.add_argument('--sample', type=int, default=200)
+    args = parser.parse_args()
+    
+    print("="*70)
+    print("🗜️  QUANTIZZAZIONE EMBEDDINGS")
+    print("="*70)
+    print()
+    
+    matrix, manifest = open_store(EMBEDDINGS_STORE_FILE)
+    print(f"📂 Store: {EMBEDDINGS_STORE_FILE} ({manifest['count']} x {manifest['dimension']})")
+    
+    write_quantized(EMBEDDINGS_STORE_FILE, matrix, args.kinds)
+    print(f"✅ Scritti: {', '.join(args.kinds)}")
+    print()
+    
+    print("="*70)
+    print("📊 MEMORIA / RECALL (vs ricerca esatta)")
+    print("="*70)
+    report_quantization(EMBEDDINGS_STORE_FILE, args.kinds, args.top_k, args.rescore_factor, args.sample)
+    print()
+    print("Imposta EMBEDDING_QUANTIZATION=int8 (o float16) nel .env per attivarlo.")
+
+
+if __name__ == '__main__':
+    main()
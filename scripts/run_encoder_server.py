@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Avvia il server di encoding condiviso: un solo processo carica il modello
+e serve gli embedding delle query a tutti i worker gunicorn via socket UNIX.
+
+Uso:
+    python scripts/run_encoder_server.py --socket /tmp/stiga-encoder.sock &
+    ENCODER_SOCKET=/tmp/stiga-encoder.sock gunicorn app.main:app ...
+"""
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import argparse
+import signal
+
+from src.config import (
+    EMBEDDING_MODEL, ENCODER_SOCKET, ENCODER_SERVER_BATCH_WINDOW_MS, ENCODER_MAX_BATCH,
+    ENCODER_BACKEND, ENCODER_MAX_SEQ_LENGTH, ENCODER_THREADS
+)
+from src.rag.encoders import ENCODER_BACKENDS, load_local_encoder
+from src.rag.encoder_service import EncoderServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server di encoding query condiviso")
+    parser.add_argument('--socket', default=ENCODER_SOCKET or '/tmp/stiga-encoder.sock',
+                        help="Path del socket UNIX (default: ENCODER_SOCKET)")
+    parser.add_argument('--model', default=EMBEDDING_MODEL, help="Modello sentence-transformers")
+    parser.add_argument('--backend', default=ENCODER_BACKEND, choices=ENCODER_BACKENDS,
+                        help="fp32 oppure int8 (quantizzazione dinamica)")
+    parser.add_argument('--max-seq-length', type=int, default=ENCODER_MAX_SEQ_LENGTH,
+                        help="Token massimi per query (0 = limite del modello)")
+    parser.add_argument('--threads', type=int, default=ENCODER_THREADS,
+                        help="Thread torch del server (0 = default)")
+    parser.add_argument('--window-ms', type=float, default=ENCODER_SERVER_BATCH_WINDOW_MS, help="Finestra di micro-batching")
+    parser.add_argument('--max-batch', type=int, default=ENCODER_MAX_BATCH, help="Testi massimi per forward pass")
+    args = parser.parse_args()
+
+    print("="*70)
+    print("🧠 ENCODER SERVER")
+    print("="*70)
+    print()
+
+    print(f"📦 Caricamento modello: {args.model} ({args.backend})")
+    model = load_local_encoder(args.model, args.backend, args.max_seq_length, args.threads)
+
+    server = EncoderServer(
+        args.socket,
+        model,
+        model_name=args.model,
+        window_ms=args.window_ms,
+        max_batch=args.max_batch
+    )
+    print(f"✅ In ascolto su {args.socket} (dimensione {server.dimension}, max {model.max_seq_length} token)")
+    print(f"   Batch: finestra {args.window_ms} ms, max {args.max_batch} testi")
+    print()
+    print(f"Avvia i worker con ENCODER_SOCKET={args.socket}")
+
+    # SIGTERM (supervisor/deploy) → chiusura pulita e rimozione del socket
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Arresto server")
+    finally:
+        stats = server.batcher.stats()
+        server.server_close()
+        print(f"📊 Batch: {stats['batches']} (medio {stats['avg_batch_size']}, max {stats['max_batch_size']} testi), "
+              f"attesa in coda media {stats['avg_queue_ms']} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Casi di regressione del parsing dei messaggi: modelli citati (gazetteer del
+catalogo, src/rag/gazetteer.py) e requisiti numerici promossi a filtri di
+range (budget → prezzo_max, area → area_min). Esce con codice 1 se un caso
+non torna.
+"""
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import json
+
+from src.config import PRODUCTS_FILE
+from src.rag.gazetteer import ModelGazetteer
+from src.rag.product_matcher import ProductMatcher
+
+# Messaggio → nomi modello attesi (in ordine di menzione)
+MODEL_CASES = {
+    # Maiuscolo, minuscolo e lettera attaccata al numero
+    "confronta A 1500 e A 750": ['A 1500', 'A 750'],
+    "confronta a1500 e a750": ['A 1500', 'A 750'],
+    "differenza tra a 1500 e a 750?": ['A 1500', 'A 750'],
+    "a50v o a 1500?": ['A 50v', 'A 1500'],
+    "batteria per la a 6v": ['A 6v'],
+    # "a" preposizione prima di un modello di un'altra serie
+    "mettili a confronto con il park 500": ['Park 500'],
+    "Combi 553 S e swift 372": ['Combi 553 S', 'Swift 372e'],
+    # Lettere di serie che sono parole comuni davanti a numeri con unità
+    "robot fino a 1500 mq": [],
+    "robot a 1500 m²": [],
+    "e 24 ore di autonomia": [],
+    "budget fino a 1000 euro": [],
+    "lavora a 45 gradi": [],
+}
+
+# Messaggio → filtri di range dai requisiti (numeri all'italiana)
+FILTER_CASES = {
+    "robot per 800 mq sotto 1.500 euro": {'prezzo_max': 1500, 'area_min': 640.0},
+    "massimo 2.000 euro per 1.200 mq": {'prezzo_max': 2000, 'area_min': 960.0},
+    "tagliaerba da 1.500,00 €": {'prezzo_max': 1500},
+    "giardino di 12.000 m²": {'area_min': 9600.0},
+    "budget 999€ per 300 metri": {'prezzo_max': 999, 'area_min': 240.0},
+    "costa 1.5 euro?": {},
+}
+
+
+def check(label: str, cases: dict, fn) -> int:
+    """Stampa gli esiti e ritorna il numero di casi falliti"""
+    failures = 0
+    print(f"\n{label}")
+    for text, expected in cases.items():
+        got = fn(text)
+        ok = got == expected
+        failures += not ok
+        print(f"   {'✅' if ok else '❌'} {text!r} → {got}" + ('' if ok else f" (atteso {expected})"))
+    return failures
+
+
+def main():
+    with open(PRODUCTS_FILE, 'r', encoding='utf-8') as f:
+        products = json.load(f)
+    gazetteer = ModelGazetteer(products)
+
+    print("="*70)
+    print("🔎 VERIFICA PARSING MESSAGGI")
+    print("="*70)
+
+    matcher = ProductMatcher()
+
+    failures = check("Modelli citati", MODEL_CASES, lambda t: [m.name for m in gazetteer.scan(t)])
+    failures += check(
+        "Filtri di range dai requisiti", FILTER_CASES,
+        lambda t: matcher.requirement_filters(matcher.extract_requirements(t))
+    )
+
+    print()
+    if failures:
+        print(f"❌ {failures} casi non superati")
+        sys.exit(1)
+    print("✅ Tutti i casi superati")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Confronta l'encoder query ottimizzato (int8 / lunghezza ridotta) con il modello fp32:
+coseno tra gli embedding sui testi del catalogo, accordo del top-k sullo store
+e latenza di una encode singola
+"""
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import argparse
+import json
+import time
+import numpy as np
+
+from src.config import (
+    EMBEDDING_MODEL, PRODUCTS_FILE, EMBEDDINGS_STORE_FILE,
+    ENCODER_BACKEND, ENCODER_MAX_SEQ_LENGTH, ENCODER_THREADS
+)
+from src.rag.embedding_store import open_store, normalize_rows
+from src.rag.encoders import ENCODER_BACKENDS, load_local_encoder
+from src.rag.product_text import create_product_text
+
+
+def cosine_report(label: str, reference: np.ndarray, candidate: np.ndarray):
+    """Coseno riga per riga tra gli embedding dei due encoder"""
+    cos = np.sum(normalize_rows(reference) * normalize_rows(candidate), axis=1)
+    print(f"{label:<18} medio {cos.mean():.4f}  p5 {np.percentile(cos, 5):.4f}  min {cos.min():.4f}  ({len(cos)} testi)")
+
+
+def topk_agreement(matrix: np.ndarray, reference: np.ndarray, candidate: np.ndarray, top_k: int) -> float:
+    """Frazione del top-k fp32 ritrovata usando gli embedding del candidato come query"""
+    ref_scores = normalize_rows(reference) @ matrix.T
+    cand_scores = normalize_rows(candidate) @ matrix.T
+    k = min(top_k, matrix.shape[0])
+    ref_top = np.argpartition(-ref_scores, k - 1, axis=1)[:, :k]
+    cand_top = np.argpartition(-cand_scores, k - 1, axis=1)[:, :k]
+    return float(np.mean([len(np.intersect1d(r, c)) / k for r, c in zip(ref_top, cand_top)]))
+
+
+def single_encode_ms(model, texts) -> float:
+    """Latenza media (ms) di una encode batch-of-one, come nel retriever"""
+    model.encode(texts[:2])  # warm-up
+    t0 = time.perf_counter()
+    for text in texts:
+        model.encode([text])
+    return 1000 * (time.perf_counter() - t0) / len(texts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica l'encoder query ottimizzato contro fp32")
+    parser.add_argument('--backend', default=ENCODER_BACKEND if ENCODER_BACKEND != 'fp32' else 'int8',
+                        choices=ENCODER_BACKENDS)
+    parser.add_argument('--max-seq-length', type=int, default=ENCODER_MAX_SEQ_LENGTH)
+    parser.add_argument('--threads', type=int, default=ENCODER_THREADS)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--sample', type=int, default=200, help="Testi usati per le latenze")
+    args = parser.parse_args()
+
+    print("="*70)
+    print("🔬 VERIFICA ENCODER QUERY")
+    print("="*70)
+    print()
+
+    with open(PRODUCTS_FILE, 'r', encoding='utf-8') as f:
+        products = json.load(f)
+    # Nomi ("Combi 753 V tagliaerba") ≈ query arricchite; testi completi = caso peggiore
+    short_texts = [f"{p.get('nome', '')} {p.get('categoria', '')}".strip() for p in products]
+    full_texts = [create_product_text(p) for p in products]
+    print(f"📂 {len(products)} prodotti")
+
+    print(f"📦 Riferimento: {EMBEDDING_MODEL} fp32")
+    reference = load_local_encoder(EMBEDDING_MODEL, 'fp32', 0, args.threads)
+    print(f"📦 Candidato: {args.backend}, max {args.max_seq_length or 'modello'} token")
+    candidate = load_local_encoder(EMBEDDING_MODEL, args.backend, args.max_seq_length, args.threads)
+    print()
+
+    ref_short = reference.encode(short_texts, batch_size=32)
+    cand_short = candidate.encode(short_texts, batch_size=32)
+    ref_full = reference.encode(full_texts, batch_size=32)
+    cand_full = candidate.encode(full_texts, batch_size=32)
+
+    print("="*70)
+    print("📊 COSENO CANDIDATO vs FP32")
+    print("="*70)
+    cosine_report("Nomi prodotto", ref_short, cand_short)
+    cosine_report("Testi completi", ref_full, cand_full)
+
+    if EMBEDDINGS_STORE_FILE.exists():
+        matrix, _ = open_store(EMBEDDINGS_STORE_FILE)
+        agreement = topk_agreement(np.asarray(matrix, dtype=np.float32), ref_short, cand_short, args.top_k)
+        print(f"Accordo top-{args.top_k} sullo store (query = nomi): {agreement:.3f}")
+    print()
+
+    print("="*70)
+    print("⏱️  LATENZA ENCODE SINGOLA")
+    print("="*70)
+    sample = short_texts[:args.sample]
+    ref_ms = single_encode_ms(reference, sample)
+    cand_ms = single_encode_ms(candidate, sample)
+    print(f"fp32:              {ref_ms:.2f} ms")
+    print(f"{args.backend + ' (candidato)':<18} {cand_ms:.2f} ms  (x{ref_ms / cand_ms:.2f})")
+    print()
+    print(f"Imposta ENCODER_BACKEND={args.backend} e ENCODER_MAX_SEQ_LENGTH={args.max_seq_length} nel .env per attivarlo.")
+
+
+if __name__ == '__main__':
+    main()
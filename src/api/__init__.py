@@ -3,5 +3,6 @@ Modulo API per interazioni con servizi esterni
 """
 
 from .claude_client import ClaudeClient
+from .context_packer import ContextPacker
 
-__all__ = ['ClaudeClient']
+__all__ = ['ClaudeClient', 'ContextPacker']
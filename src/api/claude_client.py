@@ -1,9 +1,24 @@
 """
 Claude API Client with Prompt Caching + Streaming Support
+
+Prompt caching a più breakpoint: il system prompt e le fini degli ultimi
+turni della storia (HISTORY_CACHE_BREAKPOINTS) sono marcati con
+cache_control. Il prefisso stabile della conversazione (tutto tranne il
+nuovo messaggio utente con il suo blocco prodotti) viene riletto dalla
+cache ai turni successivi: il breakpoint più recente scrive il prefisso
+del turno corrente, quelli precedenti coincidono con quanto scritto nei
+turni passati. I token letti/scritti in cache sono contati per sessione.
 """
 import anthropic
-from typing import List, Dict, Tuple, Iterator
-from ..config import ANTHROPIC_API_KEY, MODEL_NAME, MAX_TOKENS, MODEL_TEMPERATURE, SYSTEM_PROMPT
+from collections import defaultdict
+from typing import List, Dict, Tuple, Iterator, Optional
+from ..config import (
+    ANTHROPIC_API_KEY, MODEL_NAME, MAX_TOKENS, MODEL_TEMPERATURE, SYSTEM_PROMPT,
+    HISTORY_CACHE_BREAKPOINTS, PRODUCTS_CONTEXT_TOKENS
+)
+from .context_packer import ContextPacker
+
+USAGE_FIELDS = ('input_tokens', 'cache_read_input_tokens', 'cache_creation_input_tokens', 'output_tokens')
 
 
 class ClaudeClient:
@@ -14,101 +29,122 @@ class ClaudeClient:
         print("🔄 Inizializzazione Claude Client...")
         self.client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
         self.model = MODEL_NAME
+        self.history_breakpoints = HISTORY_CACHE_BREAKPOINTS
+        self.packer = ContextPacker(token_budget=PRODUCTS_CONTEXT_TOKENS)
+        # Token per sessione: input, letti/scritti in cache, output, richieste
+        self.session_usage: Dict[str, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(USAGE_FIELDS + ('requests',), 0))
         print("✅ Claude Client pronto!")
     
     def format_products_for_context(self, products_with_scores: List[Tuple]) -> str:
-        """Formatta prodotti per Claude - SOLO campi essenziali"""
-        products_for_context = []
-        ESSENTIAL = ['Area di taglio fino a', 'Alimentazione', 'Capacità batteria', 
-                     'Pendenza massima', 'Larghezza di taglio', 'Tempo massimo di taglio per ciclo',
-                     'Tempo di ricarica', 'GPS-RTK', 'Taglio organizzato',
-                     'Gestione delle zone di taglio', 'Peso prodotto senza batteria']
-        
-        for item in products_with_scores:
-            if len(item) == 2:
-                product, score = item
-            else:
-                product, score, _ = item
-            
-            all_specs = product.get('specifiche_tecniche', {})
-            specs = {}
-            for k in ESSENTIAL:
-                v = all_specs.get(k) or all_specs.get(f'Specifiche tecniche - {k}')
-                if v:
-                    specs[k] = v
-            
-            desc = product.get('descrizione', '')
-            
-            products_for_context.append({
-                'id': product.get('id'),
-                'nome': product.get('nome'),
-                'categoria': product.get('categoria'),
-                'descrizione': desc[:150] + '...' if len(desc) > 150 else desc,
-                'prezzo': product.get('prezzo'),
-                'specifiche': specs
-            })
-        
-        import json
-        return json.dumps(products_for_context, ensure_ascii=False, indent=2)
+        """Formatta prodotti per Claude - formato compatto entro il budget di token"""
+        context, _ = self.packer.pack(products_with_scores)
+        return context
     
-    def chat(
+    def _system_blocks(self) -> List[Dict]:
+        """System prompt (primo breakpoint di cache)"""
+        return [
+            {
+                "type": "text",
+                "text": SYSTEM_PROMPT,
+                "cache_control": {"type": "ephemeral"}
+            }
+        ]
+
+    def _build_messages(
         self,
         user_message: str,
-        conversation_history: List[Dict] = None,
-        products_context: str = None
-    ) -> str:
+        conversation_history: Optional[List[Dict]],
+        products_context: Optional[str]
+    ) -> List[Dict]:
         """
-        Invia messaggio a Claude con prompt caching
-        
-        Args:
-            user_message: Messaggio utente
-            conversation_history: Storia conversazione
-            products_context: Contesto prodotti (JSON)
-        
-        Returns:
-            Risposta di Claude
+        Storia + messaggio corrente con breakpoint di cache sulla storia.
+
+        I breakpoint vanno sulle fini dei turni (ultimo messaggio assistant
+        della storia e, a ritroso, quelli dei turni prima): il turno N scrive
+        il prefisso fino alla sua storia, il turno N+1 lo ritrova sul suo
+        secondo breakpoint. Il messaggio nuovo non è mai marcato. La storia
+        della sessione non viene modificata (i messaggi marcati sono copie).
         """
-        # Prepara messaggi
-        messages = []
-        
-        # Aggiungi storia
-        if conversation_history:
-            messages.extend(conversation_history)
-        
-        # Aggiungi messaggio corrente con contesto prodotti
+        messages = list(conversation_history or [])
+
+        # Fini dei turni precedenti: ultimo messaggio, poi ogni 2 (user + assistant)
+        for index in range(len(messages) - 1, -1, -2)[:self.history_breakpoints]:
+            message = messages[index]
+            content = message['content']
+            if isinstance(content, str):
+                content = [{"type": "text", "text": content}]
+            content = [dict(block) for block in content]
+            content[-1]["cache_control"] = {"type": "ephemeral"}
+            messages[index] = {**message, 'content': content}
+
+        # Messaggio corrente con contesto prodotti (mai in cache: cambia a ogni turno)
         if products_context:
             content = f"""Messaggio utente: {user_message}
 
 DATABASE PRODOTTI RILEVANTI:
 {products_context}
 
-RICORDA: Usa gli ID COMPLETI esatti dal JSON sopra nel tag <prodotti>."""
+RICORDA: Usa gli ID COMPLETI esatti (campo "id") dal JSON sopra nel tag <prodotti>."""
         else:
             content = user_message
-        
+
         messages.append({
             'role': 'user',
             'content': content
         })
+        return messages
+
+    def _track_usage(self, usage, session_id: Optional[str], label: str):
+        """Log dei token e somma per sessione (letture/scritture in cache incluse)"""
+        counts = {field: getattr(usage, field, 0) or 0 for field in USAGE_FIELDS}
+        print(f"📊 {label} - Input: {counts['input_tokens']} | Cache letti: {counts['cache_read_input_tokens']} | "
+              f"Cache scritti: {counts['cache_creation_input_tokens']} | Output: {counts['output_tokens']}")
+
+        if session_id is None:
+            return
+        totals = self.session_usage[session_id]
+        for field, value in counts.items():
+            totals[field] += value
+        totals['requests'] += 1
+
+    def get_session_usage(self, session_id: str) -> Dict[str, int]:
+        """Token cumulativi della sessione (zeri se sconosciuta)"""
+        if session_id not in self.session_usage:
+            return dict.fromkeys(USAGE_FIELDS + ('requests',), 0)
+        return dict(self.session_usage[session_id])
+
+    def chat(
+        self,
+        user_message: str,
+        conversation_history: List[Dict] = None,
+        products_context: str = None,
+        session_id: str = None
+    ) -> str:
+        """
+        Invia messaggio a Claude con prompt caching
+        
+        Args:
+            user_message: Messaggio utente
+            conversation_history: Storia conversazione
+            products_context: Contesto prodotti (righe JSON compatte con legenda)
+            session_id: Sessione a cui attribuire i token (opzionale)
         
-        # PROMPT CACHING: System prompt viene cachato
+        Returns:
+            Risposta di Claude
+        """
+        messages = self._build_messages(user_message, conversation_history, products_context)
+        
+        # PROMPT CACHING: system prompt + prefisso stabile della storia
         response = self.client.messages.create(
             model=self.model,
             max_tokens=MAX_TOKENS,
             temperature=MODEL_TEMPERATURE,
-            system=[
-                {
-                    "type": "text",
-                    "text": SYSTEM_PROMPT,
-                    "cache_control": {"type": "ephemeral"}
-                }
-            ],
+            system=self._system_blocks(),
             messages=messages
         )
         
         # Log usage per monitoring
-        usage = response.usage
-        print(f"📊 Tokens - Input: {usage.input_tokens} | Cached: {getattr(usage, 'cache_read_input_tokens', 0)} | Output: {usage.output_tokens}")
+        self._track_usage(response.usage, session_id, "Tokens")
         
         return response.content[0].text
     
@@ -116,7 +152,8 @@ RICORDA: Usa gli ID COMPLETI esatti dal JSON sopra nel tag <prodotti>."""
         self,
         user_message: str,
         conversation_history: List[Dict] = None,
-        products_context: str = None
+        products_context: str = None,
+        session_id: str = None
     ) -> Iterator[str]:
         """
         Invia messaggio a Claude con STREAMING
@@ -124,44 +161,20 @@ RICORDA: Usa gli ID COMPLETI esatti dal JSON sopra nel tag <prodotti>."""
         Args:
             user_message: Messaggio utente
             conversation_history: Storia conversazione
-            products_context: Contesto prodotti (JSON)
+            products_context: Contesto prodotti (righe JSON compatte con legenda)
+            session_id: Sessione a cui attribuire i token (opzionale)
         
         Yields:
             Chunks di testo progressivi
         """
-        # Prepara messaggi (stesso di chat())
-        messages = []
-        
-        if conversation_history:
-            messages.extend(conversation_history)
-        
-        if products_context:
-            content = f"""Messaggio utente: {user_message}
-
-DATABASE PRODOTTI RILEVANTI:
-{products_context}
-
-RICORDA: Usa gli ID COMPLETI esatti dal JSON sopra nel tag <prodotti>."""
-        else:
-            content = user_message
-        
-        messages.append({
-            'role': 'user',
-            'content': content
-        })
+        messages = self._build_messages(user_message, conversation_history, products_context)
         
         # STREAMING con prompt caching
         with self.client.messages.stream(
             model=self.model,
             max_tokens=MAX_TOKENS,
             temperature=MODEL_TEMPERATURE,
-            system=[
-                {
-                    "type": "text",
-                    "text": SYSTEM_PROMPT,
-                    "cache_control": {"type": "ephemeral"}
-                }
-            ],
+            system=self._system_blocks(),
             messages=messages
         ) as stream:
             for text in stream.text_stream:
@@ -169,5 +182,4 @@ RICORDA: Usa gli ID COMPLETI esatti dal JSON sopra nel tag <prodotti>."""
         
         # Log finale
         final_message = stream.get_final_message()
-        usage = final_message.usage
-        print(f"📊 Streaming Tokens - Input: {usage.input_tokens} | Cached: {getattr(usage, 'cache_read_input_tokens', 0)} | Output: {usage.output_tokens}")
\ No newline at end of file
+        self._track_usage(final_message.usage, session_id, "Streaming Tokens")
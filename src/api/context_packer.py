@@ -0,0 +1,119 @@
+"""
+Context Packer - Contesto prodotti per Claude entro un budget di token
+
+Formato compatto al posto del JSON indentato:
+- una riga JSON per prodotto, senza spazi, con chiavi brevi (legenda CAMPI)
+- nomi delle specifiche sostituiti da codici numerici, spiegati una volta
+  sola nella legenda (solo i codici usati dai prodotti inclusi)
+- frammento di ogni prodotto memoizzato per id: la serializzazione si fa
+  una volta per prodotto, non a ogni richiesta
+
+I prodotti entrano in ordine di ranking finché il totale stimato (legende +
+righe) resta nel budget; il primo entra sempre. I token sono stimati dai
+caratteri (CHARS_PER_TOKEN, prudente per testo italiano con numeri).
+"""
+import json
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+# Specifiche essenziali passate a Claude (il codice è la posizione + 1)
+ESSENTIAL_SPECS = ['Area di taglio fino a', 'Alimentazione', 'Capacità batteria',
+                   'Pendenza massima', 'Larghezza di taglio', 'Tempo massimo di taglio per ciclo',
+                   'Tempo di ricarica', 'GPS-RTK', 'Taglio organizzato',
+                   'Gestione delle zone di taglio', 'Peso prodotto senza batteria']
+SPEC_CODES = {name: str(i) for i, name in enumerate(ESSENTIAL_SPECS, 1)}
+
+# Chiave breve → campo
+FIELDS = {'id': 'id', 'n': 'nome', 'c': 'categoria', 'd': 'descrizione', 'p': 'prezzo', 's': 'specifiche'}
+
+DESCRIPTION_CHARS = 150
+CHARS_PER_TOKEN = 3.0
+
+
+def estimate_tokens(text: str) -> int:
+    """Stima dei token dai caratteri (per eccesso)"""
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+class Fragment(NamedTuple):
+    text: str
+    tokens: int
+    spec_codes: FrozenSet[str]
+
+
+class ContextPacker:
+    """Serializzazione compatta e memoizzata dei prodotti, entro un budget di token"""
+
+    def __init__(self, token_budget: int = 3000):
+        """
+        Args:
+            token_budget: Token stimati massimi del contesto prodotti
+        """
+        self.token_budget = token_budget
+        self._fragments: Dict[str, Fragment] = {}
+        self._fields_legend = "CAMPI: " + ", ".join(f"{short}={name}" for short, name in FIELDS.items())
+
+    def fragment(self, product: dict) -> Fragment:
+        """Riga compatta del prodotto (memoizzata per id)"""
+        product_id = product.get('id')
+        cached = self._fragments.get(product_id) if product_id else None
+        if cached is not None:
+            return cached
+
+        all_specs = product.get('specifiche_tecniche', {})
+        specs = {}
+        for name, code in SPEC_CODES.items():
+            value = all_specs.get(name) or all_specs.get(f'Specifiche tecniche - {name}')
+            if value:
+                specs[code] = value
+
+        desc = product.get('descrizione', '') or ''
+        row = {
+            'id': product_id,
+            'n': product.get('nome'),
+            'c': product.get('categoria'),
+            'd': desc[:DESCRIPTION_CHARS] + '...' if len(desc) > DESCRIPTION_CHARS else desc,
+            'p': product.get('prezzo'),
+            's': specs
+        }
+        text = json.dumps(row, ensure_ascii=False, separators=(',', ':'))
+        fragment = Fragment(text, estimate_tokens(text), frozenset(specs))
+        if product_id:
+            self._fragments[product_id] = fragment
+        return fragment
+
+    def _specs_legend(self, codes) -> str:
+        ordered = sorted(codes, key=int)
+        return "SPECIFICHE: " + ", ".join(f"{code}={ESSENTIAL_SPECS[int(code) - 1]}" for code in ordered)
+
+    def pack(self, products_with_scores: List[Tuple], token_budget: Optional[int] = None) -> Tuple[str, int]:
+        """
+        Contesto con i prodotti che stanno nel budget, in ordine di ranking
+
+        Args:
+            products_with_scores: (product, score) o (product, score, reasons), ordinati
+            token_budget: Override del budget di default
+
+        Returns:
+            (contesto, numero di prodotti inclusi)
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+        fixed = estimate_tokens(self._fields_legend)
+
+        lines, codes, rows_tokens, used = [], set(), 0, fixed
+        for item in products_with_scores:
+            fragment = self.fragment(item[0])
+            new_codes = codes | fragment.spec_codes
+            total = fixed + rows_tokens + fragment.tokens
+            if new_codes:
+                total += estimate_tokens(self._specs_legend(new_codes))
+            if lines and total > budget:
+                break
+            lines.append(fragment)
+            codes, rows_tokens, used = new_codes, rows_tokens + fragment.tokens, total
+
+        header = [self._fields_legend]
+        if codes:
+            header.append(self._specs_legend(codes))
+        context = "\n".join(header + [f.text for f in lines])
+        print(f"📦 Contesto prodotti: {len(lines)}/{len(products_with_scores)} prodotti, ~{used} token (budget {budget})")
+        return context, len(lines)
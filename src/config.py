@@ -33,9 +33,64 @@ EMBEDDING_MODEL = os.getenv(
     "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
 )
 
+# Query embedding cache (LRU in memoria + tier SQLite opzionale)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_FILE = os.getenv("QUERY_CACHE_FILE", "")
+
+# Indice di retrieval: "exact" (scan completo) o "ivf" (approssimato, cataloghi grandi)
+RETRIEVAL_INDEX = os.getenv("RETRIEVAL_INDEX", "exact").lower()
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+ANN_MIN_ROWS = int(os.getenv("ANN_MIN_ROWS", "5000"))
+
+# Retrieval ibrido: peso dello score BM25 (normalizzato) sommato al coseno (0 = solo denso)
+HYBRID_LEXICAL_WEIGHT = float(os.getenv("HYBRID_LEXICAL_WEIGHT", "0.3"))
+
+# Scan su embeddings quantizzati: "none", "int8" o "float16" (+ rescoring della shortlist)
+EMBEDDING_QUANTIZATION = os.getenv("EMBEDDING_QUANTIZATION", "none").lower()
+QUANTIZED_RESCORE_FACTOR = int(os.getenv("QUANTIZED_RESCORE_FACTOR", "4"))
+
+# Server di encoding condiviso (vuoto = modello caricato in ogni worker)
+ENCODER_SOCKET = os.getenv("ENCODER_SOCKET", "")
+ENCODER_TIMEOUT = float(os.getenv("ENCODER_TIMEOUT", "10"))
+
+# Micro-batching delle encode concorrenti (finestra 0 = disattivo nel worker).
+# Opt-in per worker multi-thread (gunicorn --threads / gthread): con i worker
+# sync di default c'è una richiesta per worker e la finestra è solo attesa
+ENCODER_BATCH_WINDOW_MS = float(os.getenv("ENCODER_BATCH_WINDOW_MS", "0"))
+# Il server di encoding condiviso riceve le query di tutti i worker: lì il batching conviene
+ENCODER_SERVER_BATCH_WINDOW_MS = float(os.getenv("ENCODER_SERVER_BATCH_WINDOW_MS", "5"))
+ENCODER_MAX_BATCH = int(os.getenv("ENCODER_MAX_BATCH", "32"))
+
+# Encoder query su CPU: "fp32" o "int8" (quantizzazione dinamica dei layer lineari),
+# lunghezza massima in token (0 = quella del modello, vale per qualsiasi backend:
+# va verificata con scripts/verify_query_encoder.py), thread torch per worker (0 = default)
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "fp32").lower()
+ENCODER_MAX_SEQ_LENGTH = int(os.getenv("ENCODER_MAX_SEQ_LENGTH", "0"))
+ENCODER_THREADS = int(os.getenv("ENCODER_THREADS", "0"))
+
+# Indice multi-vettore (chunk per prodotto, score = max sui chunk), costruito da scripts/build_multi_vector.py
+MULTI_VECTOR_INDEX = os.getenv("MULTI_VECTOR_INDEX", "False").lower() == "true"
+
+# Store embeddings non allineato a modello/builder/catalogo all'avvio:
+# "warn" (usa le righe valide), "refuse" (errore), "rebuild" (ricodifica solo le righe cambiate)
+EMBEDDINGS_STALE_POLICY = os.getenv("EMBEDDINGS_STALE_POLICY", "warn").lower()
+
+# Contesto conversazionale per l'arricchimento delle query: messaggi recenti considerati
+CONTEXT_WINDOW_MESSAGES = int(os.getenv("CONTEXT_WINDOW_MESSAGES", "8"))
+
+# Prompt caching della storia: breakpoint sulle fini dei turni precedenti (0 = solo system prompt,
+# max 3: l'API accetta 4 breakpoint e uno è sul system prompt)
+HISTORY_CACHE_BREAKPOINTS = min(3, max(0, int(os.getenv("HISTORY_CACHE_BREAKPOINTS", "2"))))
+
+# Contesto prodotti per Claude: budget di token stimati (entrano i prodotti migliori che ci stanno)
+PRODUCTS_CONTEXT_TOKENS = int(os.getenv("PRODUCTS_CONTEXT_TOKENS", "3000"))
+
 # File paths
 PRODUCTS_FILE = DATA_DIR / "stiga_products.json"
 EMBEDDINGS_FILE = EMBEDDINGS_DIR / "products_embeddings.pkl"
+EMBEDDINGS_STORE_FILE = EMBEDDINGS_DIR / "products_embeddings.npy"
+ANN_INDEX_FILE = EMBEDDINGS_DIR / "products_ivf.npz"
+MULTI_VECTOR_FILE = EMBEDDINGS_DIR / "products_chunks.npy"
 
 # Flask Configuration
 FLASK_ENV = os.getenv("FLASK_ENV", "development")
@@ -0,0 +1,153 @@
+"""
+ANN Index - Indice IVF (inverted file) in NumPy per cataloghi di grandi dimensioni
+"""
+import hashlib
+from pathlib import Path
+from typing import List, Optional, Union
+import numpy as np
+
+
+def ids_digest(product_ids: Optional[List[str]], num_rows: int) -> str:
+    """Impronta delle righe indicizzate: serve a scartare un indice non più allineato"""
+    if product_ids is None:
+        payload = f"rows:{num_rows}"
+    else:
+        payload = "\n".join(product_ids)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class IVFIndex:
+    """
+    Indice IVF su vettori normalizzati L2 (prodotto scalare = coseno).
+    
+    Le righe sono raggruppate in liste attorno a centroidi calcolati con
+    k-means sferico. A query time si valutano i centroidi, si scelgono le
+    `nprobe` liste più vicine e si fa lo scan esatto solo sulle loro righe:
+    più liste = recall più alta, meno liste = latenza più bassa.
+    """
+    
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        list_offsets: np.ndarray,
+        list_rows: np.ndarray,
+        num_rows: int,
+        digest: str = ''
+    ):
+        """
+        Args:
+            centroids: Matrice (n_lists, dim) dei centroidi normalizzati
+            list_offsets: Offset (n_lists + 1) di ogni lista in list_rows
+            list_rows: Righe della matrice embeddings, raggruppate per lista
+            num_rows: Numero di righe indicizzate
+            digest: Impronta dei product_ids indicizzati
+        """
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.list_offsets = np.asarray(list_offsets, dtype=np.int64)
+        self.list_rows = np.asarray(list_rows, dtype=np.int64)
+        self.num_rows = int(num_rows)
+        self.digest = digest
+    
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+    
+    @classmethod
+    def build(
+        cls,
+        matrix: np.ndarray,
+        n_lists: Optional[int] = None,
+        iterations: int = 20,
+        seed: int = 0,
+        digest: str = '',
+        chunk_size: int = 8192
+    ) -> 'IVFIndex':
+        """
+        Costruisce l'indice con k-means sferico.
+        
+        Args:
+            matrix: Embeddings normalizzati L2 (n_rows, dim)
+            n_lists: Numero di liste (default ~4·√n_rows)
+            iterations: Iterazioni di k-means
+            seed: Seed per l'inizializzazione
+            digest: Impronta dei product_ids da salvare con l'indice
+            chunk_size: Righe per blocco nell'assegnazione (limita la memoria)
+        """
+        matrix = np.asarray(matrix, dtype=np.float32)
+        num_rows = len(matrix)
+        if n_lists is None:
+            n_lists = int(4 * np.sqrt(num_rows))
+        n_lists = max(1, min(n_lists, num_rows))
+        
+        rng = np.random.default_rng(seed)
+        centroids = matrix[rng.choice(num_rows, n_lists, replace=False)].copy()
+        
+        assignments = np.zeros(num_rows, dtype=np.int64)
+        for _ in range(iterations):
+            assignments = cls._assign(matrix, centroids, chunk_size)
+            
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, matrix)
+            counts = np.bincount(assignments, minlength=n_lists)
+            
+            # Liste vuote: riparti da righe casuali
+            empty = np.flatnonzero(counts == 0)
+            if len(empty):
+                sums[empty] = matrix[rng.choice(num_rows, len(empty), replace=False)]
+            
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = sums / norms
+        
+        assignments = cls._assign(matrix, centroids, chunk_size)
+        order = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=n_lists)
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        
+        return cls(centroids, offsets, order, num_rows, digest)
+    
+    @staticmethod
+    def _assign(matrix: np.ndarray, centroids: np.ndarray, chunk_size: int) -> np.ndarray:
+        """Centroide più vicino per ogni riga, a blocchi"""
+        assignments = np.empty(len(matrix), dtype=np.int64)
+        for start in range(0, len(matrix), chunk_size):
+            block = matrix[start:start + chunk_size]
+            assignments[start:start + chunk_size] = np.argmax(block @ centroids.T, axis=1)
+        return assignments
+    
+    def candidates(self, query_vector: np.ndarray, nprobe: int) -> np.ndarray:
+        """Righe (ordinate) delle `nprobe` liste più vicine alla query"""
+        nprobe = max(1, min(nprobe, self.n_lists))
+        centroid_scores = self.centroids @ query_vector
+        if nprobe < self.n_lists:
+            probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probes = np.arange(self.n_lists)
+        
+        rows = np.concatenate([
+            self.list_rows[self.list_offsets[p]:self.list_offsets[p + 1]] for p in probes
+        ])
+        return np.sort(rows)
+    
+    def save(self, path: Union[str, Path]):
+        """Salva l'indice in formato .npz"""
+        np.savez(
+            path,
+            centroids=self.centroids,
+            list_offsets=self.list_offsets,
+            list_rows=self.list_rows,
+            num_rows=np.int64(self.num_rows),
+            digest=np.array(self.digest)
+        )
+    
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'IVFIndex':
+        """Carica un indice salvato con save()"""
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data['centroids'],
+                data['list_offsets'],
+                data['list_rows'],
+                int(data['num_rows']),
+                str(data['digest'])
+            )
@@ -0,0 +1,149 @@
+"""
+Micro-batching - Raggruppa le richieste di encoding concorrenti in un unico forward pass
+"""
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+import numpy as np
+
+
+class _Request:
+    """Richiesta in attesa: testi da codificare + evento di completamento"""
+
+    __slots__ = ('texts', 'event', 'result', 'error', 'enqueued')
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.enqueued = time.monotonic()
+        self.event = threading.Event()
+        self.result: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+
+
+class MicroBatcher:
+    """
+    Coda davanti all'encoder.
+
+    Il primo testo in arrivo apre una finestra di `window_ms`: le richieste
+    che arrivano nel frattempo (fino a `max_batch` testi) vengono codificate
+    insieme, poi ogni chiamante riceve le proprie righe.
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        window_ms: float = 5.0,
+        max_batch: int = 32
+    ):
+        """
+        Args:
+            encode_fn: Funzione lista di testi → matrice (una riga per testo)
+            window_ms: Attesa massima per riempire il batch
+            max_batch: Numero massimo di testi per forward pass
+        """
+        self.encode_fn = encode_fn
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+
+        # Metriche: dimensione dei batch e attesa in coda
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.texts = 0
+        self.max_batch_size = 0
+        self.queue_delay_total = 0.0
+        self.queue_delay_max = 0.0
+        self.encode_time_total = 0.0
+
+        self._worker = threading.Thread(target=self._run, name='encoder-batcher', daemon=True)
+        self._worker.start()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Accoda i testi e attende il batch che li contiene"""
+        request = _Request(list(texts))
+        self._queue.put(request)
+        request.event.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def stats(self) -> Dict:
+        """Dimensione media/massima dei batch, attesa in coda e tempo di encoding (ms)"""
+        with self._lock:
+            batches = self.batches or 1
+            requests = self.requests or 1
+            return {
+                'batches': self.batches,
+                'requests': self.requests,
+                'texts': self.texts,
+                'avg_batch_size': round(self.texts / batches, 2),
+                'max_batch_size': self.max_batch_size,
+                'avg_queue_ms': round(1000 * self.queue_delay_total / requests, 2),
+                'max_queue_ms': round(1000 * self.queue_delay_max, 2),
+                'avg_encode_ms': round(1000 * self.encode_time_total / batches, 2),
+                'window_ms': round(1000 * self.window, 2),
+                'max_batch': self.max_batch
+            }
+
+    def close(self):
+        """Ferma il thread di batching (le richieste già in coda vengono servite)"""
+        self._queue.put(None)
+        self._worker.join()
+
+    def _collect(self, first: _Request) -> List[_Request]:
+        """Raccoglie richieste fino alla scadenza della finestra o al batch pieno"""
+        batch = [first]
+        size = len(first.texts)
+        deadline = time.monotonic() + self.window
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                # Rimette lo stop in coda: verrà gestito dopo questo batch
+                self._queue.put(None)
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _record(self, batch: List[_Request], size: int, started: float, finished: float):
+        delays = [started - request.enqueued for request in batch]
+        with self._lock:
+            self.batches += 1
+            self.requests += len(batch)
+            self.texts += size
+            self.max_batch_size = max(self.max_batch_size, size)
+            self.queue_delay_total += sum(delays)
+            self.queue_delay_max = max(self.queue_delay_max, max(delays))
+            self.encode_time_total += finished - started
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            texts = [text for request in batch for text in request.texts]
+            started = time.monotonic()
+            try:
+                vectors = np.asarray(self.encode_fn(texts))
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+                    request.event.set()
+                continue
+            self._record(batch, len(texts), started, time.monotonic())
+
+            start = 0
+            for request in batch:
+                end = start + len(request.texts)
+                request.result = vectors[start:end]
+                start = end
+                request.event.set()
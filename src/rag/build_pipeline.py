@@ -0,0 +1,172 @@
+"""
+Build Pipeline - Encoding offline degli embeddings prodotti a bucket di lunghezza
+
+I testi vengono ordinati per lunghezza e divisi in shard di lunghezza simile
+(poco padding per batch), codificati da un pool di processi e salvati su disco
+man mano che finiscono; alla fine le righe tornano nell'ordine originale.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
+
+# Modello del processo worker (caricato una volta dall'initializer del pool)
+_worker_model = None
+
+
+def length_shards(texts: List[str], shard_size: int) -> List[np.ndarray]:
+    """Indici dei testi ordinati per lunghezza e tagliati in shard contigui"""
+    order = np.argsort([len(t) for t in texts], kind='stable')
+    return [order[i:i + shard_size] for i in range(0, len(order), shard_size)]
+
+
+def padding_efficiency(lengths: List[int], batch_size: int) -> float:
+    """Frazione di posizioni utili (non padding) con batch presi in quest'ordine"""
+    useful = padded = 0
+    for i in range(0, len(lengths), batch_size):
+        batch = lengths[i:i + batch_size]
+        useful += sum(batch)
+        padded += max(batch) * len(batch)
+    return useful / padded if padded else 1.0
+
+
+def _load_model(model_name: str, threads: int):
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if threads > 0:
+        torch.set_num_threads(threads)
+    return SentenceTransformer(model_name)
+
+
+def _init_worker(model_name: str, threads: int):
+    global _worker_model
+    _worker_model = _load_model(model_name, threads)
+
+
+def _encode_shard(task: Tuple[int, List[str], str, int]) -> Tuple[int, int, float]:
+    """Codifica uno shard e lo salva come shard_<id>.npy (eseguito nel worker)"""
+    shard_id, texts, shard_dir, batch_size = task
+    started = time.perf_counter()
+    vectors = _worker_model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+    np.save(Path(shard_dir) / f"shard_{shard_id:05d}.npy", np.asarray(vectors, dtype=np.float32))
+    return shard_id, len(texts), time.perf_counter() - started
+
+
+class EmbeddingBuilder:
+    """
+    Encoder offline del catalogo: shard per lunghezza + pool di processi.
+    Si usa come `encode_fn` (lista di testi → matrice nell'ordine dei testi).
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        workers: int = 0,
+        batch_size: int = 32,
+        shard_size: int = 256,
+        shard_dir: Optional[Union[str, Path]] = None
+    ):
+        """
+        Args:
+            model_name: Modello sentence-transformers
+            workers: Processi di encoding (0 = metà dei core, almeno 1)
+            batch_size: Testi per forward pass
+            shard_size: Testi per shard (unità di lavoro e di salvataggio)
+            shard_dir: Dove creare la cartella temporanea degli shard (default: tmp di sistema)
+        """
+        cpus = os.cpu_count() or 1
+        self.model_name = model_name
+        self.workers = workers if workers > 0 else max(1, cpus // 2)
+        self.threads = max(1, cpus // self.workers)
+        self.batch_size = batch_size
+        self.shard_size = max(batch_size, shard_size)
+        self.shard_dir = Path(shard_dir) if shard_dir else None
+        self.report: Dict = {}
+        self._model = None
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Embedding dei testi, righe nello stesso ordine di `texts`"""
+        texts = list(texts)
+        shards = length_shards(texts, self.shard_size)
+
+        if self.shard_dir:
+            self.shard_dir.mkdir(parents=True, exist_ok=True)
+        shard_dir = Path(tempfile.mkdtemp(prefix='stiga-shards-', dir=self.shard_dir))
+        tasks = [
+            (shard_id, [texts[i] for i in rows], str(shard_dir), self.batch_size)
+            for shard_id, rows in enumerate(shards)
+        ]
+
+        started = time.perf_counter()
+        shard_times = []
+        try:
+            for shard_id, count, seconds in self._run(tasks):
+                shard_times.append(seconds)
+                print(f"   shard {shard_id + 1}/{len(tasks)}: {count} testi in {seconds:.1f}s")
+
+            # Riassembla nell'ordine originale leggendo gli shard salvati
+            matrix = None
+            for shard_id, rows in enumerate(shards):
+                vectors = np.load(shard_dir / f"shard_{shard_id:05d}.npy")
+                if matrix is None:
+                    matrix = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+                matrix[rows] = vectors
+        finally:
+            shutil.rmtree(shard_dir, ignore_errors=True)
+        elapsed = time.perf_counter() - started
+
+        lengths = [len(t) for t in texts]
+        sorted_lengths = sorted(lengths)
+        self.report = {
+            'texts': len(texts),
+            'shards': len(tasks),
+            'workers': self.workers,
+            'threads_per_worker': self.threads,
+            'seconds': round(elapsed, 2),
+            'texts_per_second': round(len(texts) / elapsed, 1) if elapsed else 0.0,
+            'slowest_shard_seconds': round(max(shard_times), 2) if shard_times else 0.0,
+            'padding_efficiency_catalog_order': round(padding_efficiency(lengths, self.batch_size), 3),
+            'padding_efficiency_bucketed': round(padding_efficiency(sorted_lengths, self.batch_size), 3)
+        }
+        if matrix is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        return matrix
+
+    def _run(self, tasks):
+        """Esegue gli shard: nel processo corrente con 1 worker, altrimenti con un pool"""
+        if not tasks:
+            return
+        if self.workers == 1:
+            global _worker_model
+            if self._model is None:
+                self._model = _load_model(self.model_name, self.threads)
+            _worker_model = self._model
+            for task in tasks:
+                yield _encode_shard(task)
+            return
+
+        # spawn: niente fork di un processo con thread/stato torch già inizializzati
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(
+            self.workers,
+            initializer=_init_worker,
+            initargs=(self.model_name, self.threads)
+        ) as pool:
+            # I più lunghi per primi: lo shard più lento non resta in coda alla fine
+            yield from pool.imap_unordered(_encode_shard, reversed(tasks))
+
+    def print_report(self):
+        """Stampa il report di throughput dell'ultima encode()"""
+        r = self.report
+        if not r:
+            return
+        print(f"Testi: {r['texts']} in {r['seconds']}s → {r['texts_per_second']} testi/s")
+        print(f"Shard: {r['shards']} | Worker: {r['workers']} x {r['threads_per_worker']} thread "
+              f"| Shard più lento: {r['slowest_shard_seconds']}s")
+        print(f"Efficienza padding (stima su caratteri): ordine catalogo "
+              f"{r['padding_efficiency_catalog_order']:.1%} → bucket {r['padding_efficiency_bucketed']:.1%}")
@@ -0,0 +1,352 @@
+"""
+Embedding Store - Formato su disco versionato e memory-mapped per gli embeddings prodotti
+
+Layout:
+    products_embeddings.npy            matrice float32 (righe normalizzate L2), seguita
+                                       da un trailer con il token di generazione
+    products_embeddings.manifest.json  versione formato, modello, dimensione, product_ids,
+                                       hash del testo di ogni riga (rebuild incrementali),
+                                       token di generazione (coppia matrice/manifest coerente),
+                                       sha1 della matrice (solo per verify_store)
+
+La matrice viene aperta con np.memmap: tutti i worker gunicorn condividono
+le stesse pagine della page cache, senza copie né deserializzazione.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import pickle
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+import numpy as np
+
+STORE_FORMAT_VERSION = 1
+
+# Tentativi di open_store se matrice e manifest non combaciano (scrittura in corso)
+OPEN_RETRIES = 5
+OPEN_RETRY_DELAY = 0.2
+
+# Trailer in coda al .npy (dopo i dati, ignorato da np.load): token di generazione
+# scritto anche nel manifest. Lo stesso replace atomico pubblica matrice e token
+GENERATION_TAG = b'\n#generation:'
+GENERATION_TRAILER_SIZE = len(GENERATION_TAG) + 32
+
+
+def manifest_path(store_path: Union[str, Path]) -> Path:
+    """Path del manifest associato al file .npy"""
+    store_path = Path(store_path)
+    return store_path.with_name(store_path.stem + '.manifest.json')
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Normalizza L2 ogni riga in float32 (righe nulle restano a zero)"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+
+def text_hash(text: str) -> str:
+    """Hash breve del testo usato per l'embedding (cambia solo se cambia il testo)"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def matrix_digest(matrix: np.ndarray) -> str:
+    """sha1 dei byte della matrice (verifica offline, O(righe): non va fatto a ogni apertura)"""
+    return hashlib.sha1(np.ascontiguousarray(matrix).reshape(-1).view(np.uint8)).hexdigest()
+
+
+def category_order(product_ids: List[str], products: List[dict]) -> np.ndarray:
+    """
+    Permutazione che raggruppa le righe per categoria (ordine stabile):
+    così ogni categoria è un blocco contiguo e il filtro diventa una slice.
+    """
+    categories = {p['id']: (p.get('categoria') or '').lower() for p in products}
+    keys = [categories.get(pid, '') for pid in product_ids]
+    return np.array(sorted(range(len(product_ids)), key=lambda i: keys[i]), dtype=np.int64)
+
+
+def _atomic_write(path: Path, write):
+    """Scrive su file temporaneo e poi rinomina (nessun file a metà per i lettori)"""
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _map_matrix(f) -> np.ndarray:
+    """Memory-map della matrice .npy dal file già aperto (stesso inode del trailer)"""
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+    return np.memmap(f, dtype=dtype, mode='r', shape=shape,
+                     order='F' if fortran_order else 'C', offset=f.tell())
+
+
+def _read_generation(f, matrix: np.memmap) -> Optional[str]:
+    """Token di generazione dal trailer del .npy (None se il file non lo ha)"""
+    size = os.fstat(f.fileno()).st_size
+    if size < matrix.offset + matrix.nbytes + GENERATION_TRAILER_SIZE:
+        return None
+    f.seek(size - GENERATION_TRAILER_SIZE)
+    trailer = f.read(GENERATION_TRAILER_SIZE)
+    if not trailer.startswith(GENERATION_TAG):
+        return None
+    return trailer[len(GENERATION_TAG):].decode('ascii')
+
+
+def write_store(
+    store_path: Union[str, Path],
+    embeddings: np.ndarray,
+    product_ids: List[str],
+    model_name: str,
+    products: Optional[List[dict]] = None,
+    extra: Optional[Dict] = None,
+    text_hashes: Optional[List[str]] = None
+) -> Dict:
+    """
+    Salva embeddings + manifest in modo atomico.
+    
+    Args:
+        store_path: Path del file .npy
+        embeddings: Matrice (n, dim), viene normalizzata L2 in float32
+        product_ids: ID prodotto per ogni riga
+        model_name: Nome del modello sentence-transformers
+        products: Catalogo, se passato le righe vengono raggruppate per categoria
+        extra: Campi aggiuntivi da salvare nel manifest
+        text_hashes: text_hash() del testo di ogni riga (abilita i rebuild incrementali)
+    
+    Returns:
+        Il manifest scritto
+    """
+    store_path = Path(store_path)
+    store_path.parent.mkdir(parents=True, exist_ok=True)
+    
+    matrix = normalize_rows(embeddings)
+    product_ids = list(product_ids)
+    if len(matrix) != len(product_ids):
+        raise ValueError(f"Righe embeddings ({len(matrix)}) ≠ product_ids ({len(product_ids)})")
+    
+    if products is not None:
+        order = category_order(product_ids, products)
+        matrix = matrix[order]
+        product_ids = [product_ids[i] for i in order]
+        if text_hashes is not None:
+            text_hashes = [text_hashes[i] for i in order]
+    
+    manifest = {
+        'format_version': STORE_FORMAT_VERSION,
+        'model_name': model_name,
+        'dimension': int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        'count': len(product_ids),
+        'dtype': 'float32',
+        'normalized': True,
+        'generation': uuid.uuid4().hex,
+        'matrix_sha1': matrix_digest(matrix),
+        'product_ids': product_ids
+    }
+    if text_hashes is not None:
+        manifest['text_hashes'] = list(text_hashes)
+    if extra:
+        manifest.update(extra)
+    
+    # Prima la matrice, poi il manifest: il manifest "pubblica" la nuova versione.
+    # Chi apre lo store tra i due replace vede un token di generazione diverso e riprova
+    def write_matrix(f):
+        np.save(f, matrix)
+        f.write(GENERATION_TAG + manifest['generation'].encode('ascii'))
+    
+    _atomic_write(store_path, write_matrix)
+    _atomic_write(
+        manifest_path(store_path),
+        lambda f: f.write(json.dumps(manifest, ensure_ascii=False).encode('utf-8'))
+    )
+    return manifest
+
+
+def read_manifest(store_path: Union[str, Path]) -> Dict:
+    """Legge il manifest dello store"""
+    with open(manifest_path(store_path), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def open_store(store_path: Union[str, Path]) -> Tuple[np.ndarray, Dict]:
+    """
+    Apre lo store in sola lettura con memory-map.
+    
+    Il token di generazione nel trailer del .npy deve essere quello del
+    manifest: durante una scrittura (matrice nuova, manifest vecchio) si
+    riprova finché il writer non pubblica il manifest. Si leggono solo
+    header e trailer, nessun byte della matrice (lo sha1 completo è in
+    verify_store). Manifest senza token (store vecchi) vengono controllati
+    solo sulla shape.
+    
+    Returns:
+        (matrice np.memmap, manifest)
+    """
+    for attempt in range(OPEN_RETRIES):
+        manifest = read_manifest(store_path)
+        if manifest.get('format_version') != STORE_FORMAT_VERSION:
+            raise ValueError(f"Formato store non supportato: {manifest.get('format_version')}")
+        
+        with open(store_path, 'rb') as f:
+            matrix = _map_matrix(f)
+            generation = _read_generation(f, matrix)
+        expected = (manifest['count'], manifest['dimension'])
+        consistent = (
+            matrix.shape == expected and matrix.dtype == np.float32 and
+            manifest.get('generation') in (None, generation)
+        )
+        if consistent:
+            return matrix, manifest
+        if attempt < OPEN_RETRIES - 1:
+            time.sleep(OPEN_RETRY_DELAY)
+    
+    raise ValueError(
+        f"Store corrotto: shape {matrix.shape}/{matrix.dtype}, attesa {expected}/float32 "
+        f"o generazione della matrice diversa dal manifest"
+    )
+
+
+def verify_store(store_path: Union[str, Path]) -> Dict:
+    """
+    Verifica offline (build, script): sha1 completo della matrice contro il
+    manifest. Legge tutta la matrice, per questo non fa parte di open_store.
+    
+    Returns:
+        Il manifest verificato
+    """
+    matrix, manifest = open_store(store_path)
+    expected = manifest.get('matrix_sha1')
+    if expected is not None and matrix_digest(matrix) != expected:
+        raise ValueError(f"Store corrotto: sha1 della matrice diverso dal manifest ({store_path})")
+    return manifest
+
+
+def incremental_embeddings(
+    store_path: Optional[Union[str, Path]],
+    product_ids: List[str],
+    texts: List[str],
+    model_name: str,
+    encode_fn: Callable[[List[str]], np.ndarray]
+) -> Tuple[np.ndarray, List[str], Dict]:
+    """
+    Embeddings del catalogo riusando le righe dello store esistente il cui
+    testo non è cambiato: vengono codificati solo i prodotti nuovi o modificati,
+    quelli rimossi dal catalogo spariscono.
+    
+    Lo store viene riusato solo se ha lo stesso modello e gli hash dei testi
+    (store più vecchi o store_path None → ricodifica completa).
+    
+    Returns:
+        (matrice in ordine product_ids, text_hashes, statistiche)
+    """
+    hashes = [text_hash(t) for t in texts]
+    
+    previous: Dict[str, Tuple[str, int]] = {}
+    old_matrix = None
+    if store_path and Path(store_path).exists() and manifest_path(store_path).exists():
+        try:
+            old_matrix, manifest = open_store(store_path)
+        except ValueError:
+            manifest = {}
+        if manifest.get('model_name') == model_name and 'text_hashes' in manifest:
+            previous = {
+                pid: (h, row)
+                for row, (pid, h) in enumerate(zip(manifest['product_ids'], manifest['text_hashes']))
+            }
+    
+    reuse = [
+        previous[pid][1] if pid in previous and previous[pid][0] == h else -1
+        for pid, h in zip(product_ids, hashes)
+    ]
+    to_encode = [i for i, row in enumerate(reuse) if row < 0]
+    
+    encoded = np.asarray(encode_fn([texts[i] for i in to_encode])) if to_encode else None
+    dimension = encoded.shape[1] if encoded is not None else old_matrix.shape[1]
+    
+    matrix = np.empty((len(product_ids), dimension), dtype=np.float32)
+    reused = [i for i, row in enumerate(reuse) if row >= 0]
+    if reused:
+        matrix[reused] = old_matrix[[reuse[i] for i in reused]]
+    if to_encode:
+        matrix[to_encode] = normalize_rows(encoded)
+    
+    stats = {
+        'reused': len(reused),
+        'encoded': len(to_encode),
+        'removed': len(set(previous) - set(product_ids)),
+        'full': not previous
+    }
+    return matrix, hashes, stats
+
+
+def manifest_staleness(manifest: Optional[Dict], model_name: str, metadata: Dict) -> List[str]:
+    """
+    Confronta il manifest con modello, builder e catalogo correnti (solo campi
+    del manifest, nessuna lettura della matrice).
+    
+    Args:
+        manifest: Manifest dello store (None = vecchio pickle senza manifest)
+        model_name: Modello usato per le query
+        metadata: Valori attesi, es. product_text.build_metadata(products)
+    
+    Returns:
+        Motivi di disallineamento (lista vuota = store aggiornato)
+    """
+    if manifest is None:
+        return ["manifest assente (pickle legacy)"]
+    
+    reasons = []
+    if manifest.get('model_name') != model_name:
+        reasons.append(f"modello {manifest.get('model_name')} ≠ {model_name}")
+    if manifest.get('text_builder_version') != metadata.get('text_builder_version'):
+        reasons.append(
+            f"builder testo v{manifest.get('text_builder_version')} ≠ v{metadata.get('text_builder_version')}"
+        )
+    if manifest.get('catalog_hash') != metadata.get('catalog_hash'):
+        reasons.append(f"catalogo {str(manifest.get('catalog_hash'))[:12]} ≠ {metadata.get('catalog_hash', '')[:12]}")
+    return reasons
+
+
+@contextmanager
+def store_lock(store_path: Union[str, Path]):
+    """Lock esclusivo tra processi sullo store (un solo worker ricostruisce)"""
+    lock_path = Path(store_path).with_name(Path(store_path).name + '.lock')
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def load_embeddings(
+    store_path: Union[str, Path],
+    pickle_path: Union[str, Path]
+) -> Tuple[np.ndarray, Optional[List[str]], str, bool]:
+    """
+    Carica gli embeddings preferendo lo store memory-mapped, con fallback
+    sul vecchio pickle.
+    
+    Returns:
+        (matrice, product_ids o None, model_name o None, normalizzata)
+    """
+    if Path(store_path).exists() and manifest_path(store_path).exists():
+        matrix, manifest = open_store(store_path)
+        return matrix, manifest['product_ids'], manifest['model_name'], bool(manifest.get('normalized'))
+    
+    with open(pickle_path, 'rb') as f:
+        data = pickle.load(f)
+    # Alcuni pickle vecchi hanno la dimensione al posto del nome del modello
+    model_name = data.get('model_name') if isinstance(data.get('model_name'), str) else None
+    return data['embeddings'], data.get('product_ids'), model_name, False
@@ -2,13 +2,15 @@
 Modulo per generare e gestire embeddings dei prodotti
 """
 import json
-import pickle
-from typing import List, Dict
+from typing import List, Dict, Optional
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from pathlib import Path
 
-from src.config import EMBEDDING_MODEL, PRODUCTS_FILE, EMBEDDINGS_FILE
+from src.config import EMBEDDING_MODEL, PRODUCTS_FILE, EMBEDDINGS_STORE_FILE
+from src.rag.embedding_store import write_store, open_store, incremental_embeddings
+from src.rag.product_text import create_product_text, build_metadata
+from src.rag.quantization import refresh_quantized
 
 
 class ProductEmbedder:
@@ -20,9 +22,11 @@ class ProductEmbedder:
             model_name: Nome del modello sentence-transformers da usare
         """
         print(f"📦 Caricamento modello embeddings: {model_name}")
+        self.model_name = model_name
         self.model = SentenceTransformer(model_name)
         self.products = []
         self.embeddings = None
+        self.text_hashes = None
         
     def load_products(self, products_file: Path = PRODUCTS_FILE) -> List[Dict]:
         """Carica i prodotti dal file JSON"""
@@ -33,60 +37,14 @@ class ProductEmbedder:
         return self.products
     
     def create_product_text(self, product: Dict) -> str:
+        """Testo canonico del prodotto (src/rag/product_text.py, condiviso con gli script)"""
+        return create_product_text(product)
+    
+    def generate_embeddings(self, previous_store: Optional[Path] = EMBEDDINGS_STORE_FILE) -> np.ndarray:
         """
-        Crea una rappresentazione testuale completa del prodotto per l'embedding.
-        Include nome, categoria, descrizione, caratteristiche e specifiche.
+        Genera embeddings per tutti i prodotti, ricodificando solo quelli
+        nuovi o con testo cambiato rispetto a `previous_store` (None = tutti)
         """
-        parts = []
-        
-        # Nome e categoria
-        parts.append(f"Nome: {product['nome']}")
-        parts.append(f"Categoria: {product['categoria']}")
-        
-        if 'sottocategoria' in product:
-            parts.append(f"Tipo: {product['sottocategoria']}")
-        
-        # Descrizione
-        parts.append(f"Descrizione: {product['descrizione']}")
-        
-        # Caratteristiche
-        if 'caratteristiche' in product and product['caratteristiche']:
-            caratteristiche_text = " ".join(product['caratteristiche'])
-            parts.append(f"Caratteristiche: {caratteristiche_text}")
-        
-        # Specifiche tecniche chiave
-        if 'specifiche' in product:
-            specs = product['specifiche']
-            specs_text = []
-            
-            # Specifiche più importanti per la ricerca
-            key_specs = [
-                'area_taglio_max', 'alimentazione', 'larghezza_taglio',
-                'capacita_batteria', 'potenza', 'zone_taglio',
-                'tipo_perimetro', 'autonomia'
-            ]
-            
-            for key in key_specs:
-                if key in specs and specs[key]:
-                    # Formatta in modo leggibile
-                    key_readable = key.replace('_', ' ').capitalize()
-                    specs_text.append(f"{key_readable}: {specs[key]}")
-            
-            if specs_text:
-                parts.append("Specifiche: " + ", ".join(specs_text))
-        
-        # Utilizzo consigliato
-        if 'utilizzo_consigliato' in product:
-            parts.append(f"Ideale per: {product['utilizzo_consigliato']}")
-        
-        # Keywords
-        if 'keywords' in product and product['keywords']:
-            parts.append(f"Tag: {' '.join(product['keywords'])}")
-        
-        return " | ".join(parts)
-    
-    def generate_embeddings(self) -> np.ndarray:
-        """Genera embeddings per tutti i prodotti"""
         if not self.products:
             raise ValueError("Nessun prodotto caricato. Usa load_products() prima.")
         
@@ -95,46 +53,52 @@ class ProductEmbedder:
         # Crea testi completi per ogni prodotto
         product_texts = [self.create_product_text(p) for p in self.products]
         
-        # Genera embeddings
-        self.embeddings = self.model.encode(
+        # Genera embeddings (riusa le righe invariate dello store precedente)
+        self.embeddings, self.text_hashes, stats = incremental_embeddings(
+            previous_store,
+            [p['id'] for p in self.products],
             product_texts,
-            show_progress_bar=True,
-            convert_to_numpy=True
+            self.model_name,
+            lambda texts: self.model.encode(texts, show_progress_bar=True, convert_to_numpy=True)
         )
         
-        print(f"✅ Generati {len(self.embeddings)} embeddings")
+        print(f"✅ Generati {len(self.embeddings)} embeddings "
+              f"({stats['encoded']} codificati, {stats['reused']} riusati, {stats['removed']} rimossi)")
         print(f"   Dimensione vettori: {self.embeddings.shape[1]}")
         
         return self.embeddings
     
-    def save_embeddings(self, output_file: Path = EMBEDDINGS_FILE):
-        """Salva embeddings e prodotti in un file pickle"""
+    def save_embeddings(self, output_file: Path = EMBEDDINGS_STORE_FILE):
+        """Salva embeddings e product_ids nello store memory-mapped (.npy + manifest)"""
         if self.embeddings is None:
             raise ValueError("Nessun embedding generato. Usa generate_embeddings() prima.")
         
         print(f"💾 Salvataggio embeddings in: {output_file}")
         
-        data = {
-            'products': self.products,
-            'embeddings': self.embeddings,
-            'model_name': self.model.get_sentence_embedding_dimension()
-        }
+        write_store(
+            output_file,
+            self.embeddings,
+            product_ids=[p['id'] for p in self.products],
+            model_name=self.model_name,
+            products=self.products,
+            extra=build_metadata(self.products),
+            text_hashes=self.text_hashes
+        )
         
-        with open(output_file, 'wb') as f:
-            pickle.dump(data, f)
+        # Copie int8/float16 esistenti riallineate al nuovo ordine righe
+        refresh_quantized(output_file)
         
         print("✅ Embeddings salvati con successo")
     
     @staticmethod
-    def load_embeddings(embeddings_file: Path = EMBEDDINGS_FILE) -> Dict:
-        """Carica embeddings e prodotti da file"""
+    def load_embeddings(embeddings_file: Path = EMBEDDINGS_STORE_FILE) -> Dict:
+        """Carica embeddings (memory-mapped) e manifest da file"""
         print(f"📂 Caricamento embeddings da: {embeddings_file}")
         
-        with open(embeddings_file, 'rb') as f:
-            data = pickle.load(f)
+        matrix, manifest = open_store(embeddings_file)
         
-        print(f"✅ Caricati embeddings per {len(data['products'])} prodotti")
-        return data
+        print(f"✅ Caricati embeddings per {manifest['count']} prodotti")
+        return {**manifest, 'embeddings': matrix}
 
 
 def main():
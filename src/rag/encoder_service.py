@@ -0,0 +1,200 @@
+"""
+Encoder Service - Server di embedding condiviso tra i worker via socket UNIX
+
+Un solo processo possiede il modello SentenceTransformer; i worker gunicorn
+usano RemoteEncoder, che espone lo stesso `encode(texts)` del modello.
+
+Protocollo (frame = lunghezza uint32 big-endian + payload):
+    richiesta: frame JSON {"texts": [...]}  (lista vuota = solo info)
+    risposta:  frame JSON {"model", "tag", "dimension", "shape"} oppure {"error"}
+               + frame con i vettori float32 (solo se non c'è errore)
+"""
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+import numpy as np
+
+from .batching import MicroBatcher
+from ..config import ENCODER_SERVER_BATCH_WINDOW_MS, ENCODER_MAX_BATCH
+
+_HEADER = struct.Struct('!I')
+
+# Limite di sicurezza per un singolo frame (richieste malformate)
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(size - len(buffer))
+        if not chunk:
+            raise ConnectionError("Connessione chiusa dal peer")
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+
+def send_frame(sock: socket.socket, payload: bytes):
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def recv_frame(sock: socket.socket) -> bytes:
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if size > MAX_FRAME_BYTES:
+        raise ConnectionError(f"Frame troppo grande: {size} byte")
+    return _recv_exact(sock, size)
+
+
+class _EncoderHandler(socketserver.BaseRequestHandler):
+    """Una connessione per worker/thread: serve richieste finché il client resta connesso"""
+
+    def handle(self):
+        server: 'EncoderServer' = self.server
+        while True:
+            try:
+                request = json.loads(recv_frame(self.request))
+            except (ConnectionError, OSError):
+                return
+            except ValueError:
+                send_frame(self.request, json.dumps({'error': 'richiesta non valida'}).encode())
+                return
+
+            texts = request.get('texts') or []
+            try:
+                vectors = (
+                    server.batcher.encode(texts) if texts
+                    else np.zeros((0, server.dimension))
+                ).astype(np.float32, copy=False)
+            except Exception as e:
+                send_frame(self.request, json.dumps({'error': str(e)}).encode())
+                continue
+
+            header = {
+                'model': server.model_name,
+                'tag': server.encoder_tag,
+                'dimension': server.dimension,
+                'shape': list(vectors.shape)
+            }
+            if not texts:
+                header['stats'] = server.batcher.stats()
+            try:
+                send_frame(self.request, json.dumps(header).encode())
+                send_frame(self.request, np.ascontiguousarray(vectors).tobytes())
+            except OSError:
+                return
+
+
+class EncoderServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Server di encoding: un thread per connessione, un unico batcher davanti al modello"""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        socket_path: Union[str, Path],
+        model,
+        model_name: str,
+        window_ms: float = ENCODER_SERVER_BATCH_WINDOW_MS,
+        max_batch: int = ENCODER_MAX_BATCH
+    ):
+        """
+        Args:
+            socket_path: Path del socket UNIX
+            model: Oggetto con `encode(texts)` (es. SentenceTransformer)
+            model_name: Nome del modello, verificato dai client
+            window_ms / max_batch: Parametri del micro-batching
+        """
+        self.socket_path = str(socket_path)
+        self.model_name = model_name
+        # Backend/lunghezza del modello servito (fp32 vs int8 danno vettori diversi)
+        self.encoder_tag = getattr(model, 'encoder_tag', model_name)
+        self.dimension = int(model.get_sentence_embedding_dimension())
+        self.batcher = MicroBatcher(model.encode, window_ms=window_ms, max_batch=max_batch)
+
+        # Socket rimasto da un'esecuzione precedente
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        Path(self.socket_path).parent.mkdir(parents=True, exist_ok=True)
+        super().__init__(self.socket_path, _EncoderHandler)
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+class RemoteEncoder:
+    """
+    Client del server di encoding, da usare al posto del modello locale.
+    Una connessione persistente per thread: le richieste concorrenti di un
+    worker threaded arrivano in parallelo al server e finiscono nello stesso batch.
+    """
+
+    def __init__(self, socket_path: Union[str, Path], timeout: float = 10.0):
+        self.socket_path = str(socket_path)
+        self.timeout = timeout
+        self._local = threading.local()
+
+        info = self.info()
+        self.model_name = info['model']
+        self.encoder_tag = info.get('tag', self.model_name)
+        self.dimension = info['dimension']
+
+    def info(self) -> Dict:
+        """Modello, dimensione e metriche di batching del server"""
+        header, _ = self._request([])
+        return header
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, texts: List[str], **kwargs) -> np.ndarray:
+        """Embedding dei testi (stessa forma di SentenceTransformer.encode)"""
+        _, vectors = self._request(list(texts))
+        return vectors
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _reset(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        self._local.sock = None
+
+    def _request(self, texts: List[str]) -> Tuple[Dict, np.ndarray]:
+        payload = json.dumps({'texts': texts}).encode()
+
+        # Un solo nuovo tentativo: copre il riavvio del server tra due richieste
+        for attempt in (0, 1):
+            try:
+                sock = self._connection()
+                send_frame(sock, payload)
+                header = json.loads(recv_frame(sock))
+                if 'error' in header:
+                    raise RuntimeError(f"Encoder server: {header['error']}")
+                body = recv_frame(sock)
+                break
+            except (ConnectionError, OSError) as e:
+                self._reset()
+                if attempt:
+                    raise ConnectionError(
+                        f"Encoder server non raggiungibile su {self.socket_path}: {e}"
+                    ) from e
+
+        vectors = np.frombuffer(body, dtype=np.float32).reshape(header['shape'])
+        return header, vectors
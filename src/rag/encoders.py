@@ -0,0 +1,90 @@
+"""
+Query Encoders - Sceglie l'encoder delle query: modello locale o server condiviso
+"""
+from ..config import (
+    EMBEDDING_MODEL,
+    ENCODER_SOCKET,
+    ENCODER_TIMEOUT,
+    ENCODER_BACKEND,
+    ENCODER_MAX_SEQ_LENGTH,
+    ENCODER_THREADS
+)
+
+ENCODER_BACKENDS = ('fp32', 'int8')
+
+
+def encoder_tag(model_name: str, backend: str = 'fp32', max_seq_length: int = 0) -> str:
+    """
+    Identifica gli embedding prodotti da un encoder (usato come chiave della cache query).
+    fp32 a lunghezza piena resta il solo nome del modello: le cache esistenti restano valide.
+    """
+    if backend == 'fp32' and max_seq_length <= 0:
+        return model_name
+    return f"{model_name}#{backend}@{max_seq_length or 'full'}"
+
+
+def load_local_encoder(
+    model_name: str = EMBEDDING_MODEL,
+    backend: str = ENCODER_BACKEND,
+    max_seq_length: int = ENCODER_MAX_SEQ_LENGTH,
+    threads: int = ENCODER_THREADS
+):
+    """
+    SentenceTransformer nel processo corrente (import lazy: torch solo se serve).
+
+    Args:
+        model_name: Modello sentence-transformers
+        backend: "fp32" oppure "int8" (quantizzazione dinamica dei nn.Linear, solo CPU)
+        max_seq_length: Token massimi per testo (0 = limite del modello)
+        threads: Thread intra-op di torch per questo processo (0 = default di torch)
+    """
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"ENCODER_BACKEND non valido: {backend} (attesi: {', '.join(ENCODER_BACKENDS)})")
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    # Con più worker gunicorn ognuno userebbe tutti i core: si fissa il budget
+    if threads > 0:
+        torch.set_num_threads(threads)
+
+    model = SentenceTransformer(model_name, device='cpu' if backend == 'int8' else None)
+
+    # Le query arricchite sono brevi: inutile paddare fino al limite del modello
+    if max_seq_length > 0:
+        model.max_seq_length = min(model.max_seq_length, max_seq_length)
+
+    # Pesi int8 + attivazioni quantizzate a runtime: stessa interfaccia encode()
+    if backend == 'int8':
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+
+    model.encoder_backend = backend
+    model.encoder_tag = encoder_tag(model_name, backend, max_seq_length)
+    return model
+
+
+def load_query_encoder(model_name: str = EMBEDDING_MODEL):
+    """
+    Encoder usato dal retriever.
+
+    Con ENCODER_SOCKET impostato il modello vive nel server condiviso
+    (scripts/run_encoder_server.py) e il worker non carica torch.
+    """
+    if not ENCODER_SOCKET:
+        encoder = load_local_encoder(model_name)
+        if encoder.encoder_backend != 'fp32':
+            print(f"✅ Encoder query {encoder.encoder_backend} (max {encoder.max_seq_length} token)")
+        return encoder
+
+    from .encoder_service import RemoteEncoder
+
+    encoder = RemoteEncoder(ENCODER_SOCKET, timeout=ENCODER_TIMEOUT)
+    if encoder.model_name != model_name:
+        raise ValueError(
+            f"Il server di encoding usa {encoder.model_name}, "
+            f"gli embeddings prodotti richiedono {model_name}"
+        )
+    print(f"✅ Encoder condiviso su {ENCODER_SOCKET} ({encoder.encoder_tag})")
+    return encoder
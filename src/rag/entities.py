@@ -0,0 +1,94 @@
+"""
+Entity Scanner - Tutte le entità di un messaggio in un solo passaggio
+
+- Superfici (m²/mq/metri) e budget (€/euro): un'unica regex compilata,
+  alternanza con gruppi nominati dentro un lookahead, così ogni posizione
+  del testo viene valutata una volta sola per tutte le entità. I numeri
+  sono all'italiana: "1.500" e "1.500,00" valgono 1500
+- Accessori, categorie e alimentazione: automa condiviso di lexicon.py
+- Modelli: gazetteer dei nomi del catalogo (gazetteer.py), passato da chi
+  ha caricato il catalogo
+
+Per ogni entità vale il match più a sinistra, come con le re.search
+separate che sostituisce. Il risultato è memoizzato per testo.
+"""
+import re
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, NamedTuple, Optional
+
+from .lexicon import chat_accessory, chat_category, is_accessory_query, power_type, requirement_category
+from .specs import parse_price
+
+if TYPE_CHECKING:
+    # gazetteer → product_matcher → entities: solo per l'annotazione
+    from .gazetteer import ModelGazetteer
+
+# Numero italiano: "1.500", "1.500,00", "800", "2,5" (punto = migliaia, virgola = decimali)
+_NUMBER = r'(?:\d{1,3}(?:\.\d{3})+|\d+)(?:,\d+)?'
+
+ENTITY_PATTERN = re.compile(
+    r'(?=(?:'
+    # Superficie del giardino e budget (dall'inizio del numero: il match più a sinistra)
+    rf'(?P<superficie>(?<![\d.,])(?P<mq>{_NUMBER})\s*(?P<unita>m²|mq|metri|metro))|'
+    rf'(?P<budget>(?<![\d.,])(?P<euro>{_NUMBER})\s*(?:€|euro))'
+    r'))',
+    re.IGNORECASE
+)
+
+
+class Entities(NamedTuple):
+    dimensioni: Optional[str]
+    area_mq: Optional[int]
+    budget: Optional[int]
+    accessorio: Optional[str]
+    categoria: Optional[str]
+    alimentazione: Optional[str]
+    categoria_requisiti: Optional[str]
+    cerca_accessori: bool
+
+
+@lru_cache(maxsize=1024)
+def scan_entities(text: str) -> Entities:
+    """Entità del messaggio (None = non citata)"""
+    text = text or ''
+    dimensioni = area = budget = None
+
+    for match in ENTITY_PATTERN.finditer(text):
+        if match.group('superficie') is not None:
+            mq = int(parse_price(match.group('mq')))
+            if dimensioni is None:
+                dimensioni = f"{mq}mq"
+            # I requisiti non contano 'metro' (solo m², mq, metri)
+            if area is None and match.group('unita').lower() != 'metro':
+                area = mq
+        elif budget is None:
+            budget = int(parse_price(match.group('euro')))
+        if area is not None and budget is not None:
+            break
+
+    return Entities(
+        dimensioni=dimensioni,
+        area_mq=area,
+        budget=budget,
+        accessorio=chat_accessory(text),
+        categoria=chat_category(text),
+        alimentazione=power_type(text),
+        categoria_requisiti=requirement_category(text),
+        cerca_accessori=is_accessory_query(text)
+    )
+
+
+def context_entities(text: str, gazetteer: Optional['ModelGazetteer'] = None) -> Dict[str, Optional[str]]:
+    """
+    Campi del contesto conversazionale (ordine: specifico → generico).
+    Il modello è il nome nel catalogo della prima menzione trovata dal gazetteer.
+    """
+    entities = scan_entities(text)
+    mentions = gazetteer.scan(text) if gazetteer is not None and text else ()
+    return {
+        'accessorio': entities.accessorio,
+        'modello': mentions[0].name if mentions else None,
+        'categoria': entities.categoria,
+        'dimensioni': entities.dimensioni,
+        'alimentazione': entities.alimentazione
+    }
@@ -0,0 +1,109 @@
+"""
+Exact Lookup - Indice hash/prefisso su EAN, SKU e nomi prodotto
+"""
+import bisect
+import re
+from typing import Dict, List
+
+from .lexical import fold
+from .specs import get_spec
+
+_ALNUM_RE = re.compile(r'[a-z0-9]+')
+
+# Lunghezza minima di un codice (EAN/SKU) cercato dentro una frase
+MIN_CODE_LENGTH = 6
+# Lunghezza minima per accettare un codice parziale (prefisso univoco)
+MIN_CODE_PREFIX_LENGTH = 8
+# Lunghezza minima (compatta, senza spazi) di un nome parziale: "2" non è un modello
+MIN_NAME_PREFIX_LENGTH = 4
+
+
+def normalize_code(text: str) -> str:
+    """Codice compatto: '2R7114128/ST1' → '2r7114128st1'"""
+    return ''.join(_ALNUM_RE.findall(fold(text)))
+
+
+def normalize_name(text: str) -> str:
+    """Nome normalizzato: minuscolo, senza accenti e punteggiatura, spazi singoli"""
+    return ' '.join(_ALNUM_RE.findall(fold(text)))
+
+
+class ExactLookupIndex:
+    """
+    Risolve in O(1) (hash) o O(log n) (prefisso) le query che contengono
+    un EAN, uno SKU o il nome esatto di un prodotto, senza passare
+    dall'encoder.
+    """
+    
+    def __init__(self, products: List[dict]):
+        self.codes: Dict[str, List[str]] = {}
+        self.names: Dict[str, List[str]] = {}
+        
+        for product in products:
+            product_id = product.get('id')
+            if not product_id:
+                continue
+            for key in ('EAN/UPC', 'SKU'):
+                value = get_spec(product, key)
+                if value:
+                    self._add(self.codes, normalize_code(value), product_id)
+            if product.get('nome'):
+                self._add(self.names, normalize_name(product['nome']), product_id)
+        
+        # Chiavi ordinate per la ricerca per prefisso (bisect)
+        self._sorted_codes = sorted(self.codes)
+        self._sorted_names = sorted(self.names)
+    
+    @staticmethod
+    def _add(index: Dict[str, List[str]], key: str, product_id: str):
+        if key and product_id not in index.setdefault(key, []):
+            index[key].append(product_id)
+    
+    @staticmethod
+    def _unique_prefix(sorted_keys: List[str], index: Dict[str, List[str]], prefix: str) -> List[str]:
+        """Prodotti della chiave che inizia con `prefix`, solo se la chiave è unica"""
+        pos = bisect.bisect_left(sorted_keys, prefix)
+        matches = []
+        while pos < len(sorted_keys) and sorted_keys[pos].startswith(prefix):
+            matches.append(sorted_keys[pos])
+            if len(matches) > 1:
+                return []
+            pos += 1
+        return list(index[matches[0]]) if matches else []
+    
+    def lookup(self, query: str, prefix: bool = False) -> List[str]:
+        """
+        Product ID che corrispondono esattamente alla query (lista vuota se nessuno).
+        
+        Ordine dei controlli:
+        1. codice EAN/SKU completo (intera query o token della frase)
+        2. nome prodotto esatto (intera query)
+        
+        Con prefix=True (ricerca da API, non messaggi di chat) anche:
+        - prefisso univoco di un codice (almeno MIN_CODE_PREFIX_LENGTH caratteri)
+        - prefisso univoco del nome a token interi, per query con cifre di almeno
+          MIN_NAME_PREFIX_LENGTH caratteri ("Combi 553" → "Combi 553 S")
+        """
+        chunks = [query] + query.split()
+        for chunk in chunks:
+            code = normalize_code(chunk)
+            if len(code) < MIN_CODE_LENGTH or not any(c.isdigit() for c in code):
+                continue
+            if code in self.codes:
+                return list(self.codes[code])
+            if prefix and len(code) >= MIN_CODE_PREFIX_LENGTH:
+                found = self._unique_prefix(self._sorted_codes, self.codes, code)
+                if found:
+                    return found
+        
+        name = normalize_name(query)
+        if not name:
+            return []
+        if name in self.names:
+            return list(self.names[name])
+        compact = name.replace(' ', '')
+        if prefix and len(compact) >= MIN_NAME_PREFIX_LENGTH and any(c.isdigit() for c in compact):
+            # Solo token interi: "combi 553" copre "combi 553 s", non "combi 5530"
+            return self._unique_prefix(self._sorted_names, self.names, name + ' ')
+        
+        return []
@@ -0,0 +1,254 @@
+"""
+Facet Index - Indice precalcolato delle faccette per il retrieval filtrato
+
+- FacetIndex: valore → righe ordinate, per restringere lo scan denso
+- FacetBitsets: valore → bitset di righe, per la ricerca a faccette con
+  conteggi (intersezioni AND/OR + popcount su parole a 64 bit)
+"""
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from .product_matcher import is_accessory_product
+from .specs import get_spec, parse_price
+
+
+class FacetIndex:
+    """
+    Mappa ogni valore di faccetta (categoria, sottocategoria, accessorio)
+    all'array ordinato delle righe della matrice embeddings che lo possiedono.
+    Costruito una sola volta al caricamento del catalogo.
+    """
+    
+    FIELDS = ('categoria', 'sottocategoria', 'accessorio')
+    
+    def __init__(self, row_products: List[Optional[dict]], accessory: Optional[np.ndarray] = None):
+        """
+        Args:
+            row_products: Prodotti allineati alle righe della matrice (None = riga orfana)
+            accessory: Flag accessorio per riga già calcolato (ProductFeatures.is_accessory)
+        """
+        self._accessory = accessory
+        buckets: Dict[str, Dict] = {field: {} for field in self.FIELDS}
+        
+        for row, product in enumerate(row_products):
+            if product is None:
+                continue
+            for field in self.FIELDS:
+                value = self._product_value(product, field, row)
+                buckets[field].setdefault(value, []).append(row)
+        
+        self.index: Dict[str, Dict] = {
+            field: {value: np.array(rows, dtype=np.int64) for value, rows in values.items()}
+            for field, values in buckets.items()
+        }
+        self._empty = np.empty(0, dtype=np.int64)
+    
+    @staticmethod
+    def _normalize(field: str, value):
+        """Normalizza un valore di faccetta (stringhe case-insensitive)"""
+        if field == 'accessorio':
+            return bool(value)
+        return (value or '').strip().lower()
+    
+    def _product_value(self, product: dict, field: str, row: int):
+        if field == 'accessorio':
+            if self._accessory is not None:
+                return bool(self._accessory[row])
+            return is_accessory_product(product)
+        return self._normalize(field, product.get(field))
+    
+    def rows(self, field: str, value) -> np.ndarray:
+        """Righe con il valore richiesto per la faccetta (array ordinato)"""
+        return self.index[field].get(self._normalize(field, value), self._empty)
+    
+    def select(self, filters: Optional[Dict]) -> Optional[np.ndarray]:
+        """
+        Interseca le righe di tutte le faccette presenti nei filtri.
+        Ritorna None se i filtri non contengono faccette indicizzate.
+        """
+        if not filters:
+            return None
+        
+        selected = None
+        for field in self.FIELDS:
+            if field not in filters:
+                continue
+            rows = self.rows(field, filters[field])
+            selected = rows if selected is None else np.intersect1d(selected, rows, assume_unique=True)
+        
+        return selected
+
+
+# Fasce di prezzo (€): [min, max), None = senza limite superiore
+PRICE_BANDS: Tuple[Tuple[str, float, Optional[float]], ...] = (
+    ('0-200', 0, 200),
+    ('200-500', 200, 500),
+    ('500-1000', 500, 1000),
+    ('1000-2000', 1000, 2000),
+    ('2000+', 2000, None)
+)
+
+
+def price_band(price: Optional[float]) -> Optional[str]:
+    """Fascia di prezzo del valore in euro (None se il prezzo non è noto)"""
+    if price is None or price != price:
+        return None
+    for label, low, high in PRICE_BANDS:
+        if price >= low and (high is None or price < high):
+            return label
+    return None
+
+
+class FacetBitsets:
+    """
+    Bitset di righe per ogni valore di faccetta: categoria, sottocategoria,
+    alimentazione, fascia_prezzo, tecnologie (multi-valore).
+    
+    Ogni faccetta è una matrice uint64 (n_valori, n_parole): filtrare è un
+    OR delle righe dei valori scelti (stessa faccetta) e un AND tra faccette;
+    i conteggi sono il popcount di (matrice & bitset dei risultati).
+    """
+    
+    FIELDS = ('categoria', 'sottocategoria', 'alimentazione', 'fascia_prezzo', 'tecnologie')
+    
+    def __init__(self, row_products: List[Optional[dict]], price: Optional[np.ndarray] = None):
+        """
+        Args:
+            row_products: Prodotti allineati alle righe della matrice (None = riga orfana)
+            price: Prezzo per riga già calcolato (ProductFeatures.price)
+        """
+        self.num_rows = len(row_products)
+        self.num_words = (self.num_rows + 63) // 64
+        
+        masks: Dict[str, Dict[str, np.ndarray]] = {field: {} for field in self.FIELDS}
+        self.labels: Dict[str, Dict[str, str]] = {field: {} for field in self.FIELDS}
+        valid = np.zeros(self.num_rows, dtype=bool)
+        
+        for row, product in enumerate(row_products):
+            if product is None:
+                continue
+            valid[row] = True
+            row_price = float(price[row]) if price is not None else parse_price(product.get('prezzo'))
+            for field in self.FIELDS:
+                for label in self._product_values(product, field, row_price):
+                    key = self.normalize(label)
+                    if key not in masks[field]:
+                        masks[field][key] = np.zeros(self.num_rows, dtype=bool)
+                        self.labels[field][key] = label
+                    masks[field][key][row] = True
+        
+        self.valid = self._pack(valid)
+        self.values: Dict[str, List[str]] = {}
+        self.bits: Dict[str, np.ndarray] = {}
+        for field in self.FIELDS:
+            keys = list(masks[field])
+            self.values[field] = keys
+            self.bits[field] = (
+                np.vstack([self._pack(masks[field][k]) for k in keys])
+                if keys else np.zeros((0, self.num_words), dtype=np.uint64)
+            )
+        self._position = {
+            field: {key: i for i, key in enumerate(keys)} for field, keys in self.values.items()
+        }
+    
+    @staticmethod
+    def normalize(value) -> str:
+        return str(value or '').strip().lower()
+    
+    @staticmethod
+    def _product_values(product: dict, field: str, price: Optional[float]) -> List[str]:
+        """Etichette del prodotto per la faccetta (vuota = nessun valore)"""
+        if field == 'fascia_prezzo':
+            band = price_band(price)
+            return [band] if band else []
+        if field == 'alimentazione':
+            value = get_spec(product, 'Alimentazione')
+            return [value.strip()] if value and value.strip() else []
+        if field == 'tecnologie':
+            labels = []
+            for tech in product.get('tecnologie') or []:
+                title = (tech.get('titolo') if isinstance(tech, dict) else tech) or ''
+                if title.strip():
+                    labels.append(title.strip())
+            return labels
+        value = (product.get(field) or '').strip()
+        return [value] if value else []
+    
+    def _pack(self, mask: np.ndarray) -> np.ndarray:
+        """Maschera booleana per riga → bitset uint64 (bit i = riga i)"""
+        packed = np.packbits(mask, bitorder='little')
+        padded = np.zeros(self.num_words * 8, dtype=np.uint8)
+        padded[:len(packed)] = packed
+        return padded.view(np.uint64)
+    
+    def from_rows(self, rows: np.ndarray) -> np.ndarray:
+        """Bitset delle righe indicate"""
+        mask = np.zeros(self.num_rows, dtype=bool)
+        mask[rows] = True
+        return self._pack(mask)
+    
+    def to_rows(self, bits: np.ndarray) -> np.ndarray:
+        """Righe (ordinate) con il bit acceso"""
+        mask = np.unpackbits(bits.view(np.uint8), bitorder='little', count=self.num_rows)
+        return np.flatnonzero(mask)
+    
+    @staticmethod
+    def count(bits: np.ndarray) -> int:
+        return int(np.bitwise_count(bits).sum())
+    
+    def field_bits(self, field: str, values) -> np.ndarray:
+        """OR dei bitset dei valori richiesti per la faccetta (valori ignoti = nessuna riga)"""
+        if isinstance(values, str):
+            values = [values]
+        positions = [self._position[field][k] for k in map(self.normalize, values)
+                     if k in self._position[field]]
+        if not positions:
+            return np.zeros(self.num_words, dtype=np.uint64)
+        return np.bitwise_or.reduce(self.bits[field][positions], axis=0)
+    
+    def select(self, filters: Optional[Dict], exclude: Optional[str] = None) -> np.ndarray:
+        """
+        Bitset delle righe che passano i filtri di faccetta
+        (OR dentro la faccetta, AND tra faccette); `exclude` ignora una faccetta.
+        """
+        bits = self.valid.copy()
+        for field in self.FIELDS:
+            if field == exclude or not filters or not filters.get(field):
+                continue
+            bits &= self.field_bits(field, filters[field])
+        return bits
+    
+    def counts(self, scope: np.ndarray, filters: Optional[Dict] = None) -> Dict[str, List[Dict]]:
+        """
+        Conteggi per valore di ogni faccetta sui risultati correnti.
+        
+        Args:
+            scope: Bitset delle righe che passano i vincoli non di faccetta
+                (testo della query, range numerici)
+            filters: Filtri di faccetta applicati
+        
+        Per una faccetta già filtrata il conteggio ignora il filtro della
+        faccetta stessa, così gli altri chip restano selezionabili in OR.
+        
+        Returns:
+            {faccetta: [{'value', 'label', 'count'}]} per count decrescente,
+            solo valori con count > 0
+        """
+        results = scope & self.select(filters)
+        facets = {}
+        for field in self.FIELDS:
+            base = results
+            if filters and filters.get(field):
+                base = scope & self.select(filters, exclude=field)
+            counts = np.bitwise_count(self.bits[field] & base).sum(axis=1)
+            present = np.flatnonzero(counts)
+            order = present[np.argsort(-counts[present], kind='stable')]
+            facets[field] = [
+                {
+                    'value': self.values[field][i],
+                    'label': self.labels[field][self.values[field][i]],
+                    'count': int(counts[i])
+                }
+                for i in order
+            ]
+        return facets
@@ -0,0 +1,64 @@
+"""
+Product Features - Feature derivate dei prodotti, calcolate una volta al caricamento
+
+Array NumPy allineati alle righe della matrice embeddings: il re-ranking
+diventa un'operazione vettoriale sul set di candidati, senza rileggere
+categorie, nomi, prezzi e specifiche a ogni richiesta.
+"""
+from typing import Dict, List, Optional
+import numpy as np
+
+from .product_matcher import is_accessory_product
+from .specs import AREA_KEYS, parse_price, spec_number
+
+
+class ProductFeatures:
+    """
+    - is_accessory: bool (stessa regola di is_accessory_product)
+    - price: prezzo in euro (NaN se 'Contattaci' o assente)
+    - area_mq: area di taglio massima in m² (NaN se assente)
+    """
+
+    def __init__(self, row_products: List[Optional[dict]]):
+        """
+        Args:
+            row_products: Prodotti allineati alle righe (None = riga orfana)
+        """
+        n = len(row_products)
+        self.is_accessory = np.zeros(n, dtype=bool)
+        self.price = np.full(n, np.nan, dtype=np.float32)
+        self.area_mq = np.full(n, np.nan, dtype=np.float32)
+        self.row_of: Dict[str, int] = {}
+
+        for row, product in enumerate(row_products):
+            if product is None:
+                continue
+            self.row_of[product.get('id')] = row
+            self.is_accessory[row] = is_accessory_product(product)
+            price = parse_price(product.get('prezzo'))
+            if price is not None:
+                self.price[row] = price
+            area = spec_number(product, *AREA_KEYS)
+            if area is not None:
+                self.area_mq[row] = area
+
+    def __len__(self) -> int:
+        return len(self.is_accessory)
+
+    def take(self, rows: np.ndarray) -> 'ProductFeatures':
+        """Sottoinsieme delle righe (stesso ordine di `rows`)"""
+        subset = ProductFeatures([])
+        subset.is_accessory = self.is_accessory[rows]
+        subset.price = self.price[rows]
+        subset.area_mq = self.area_mq[rows]
+        return subset
+
+    def for_products(self, products: List[dict]) -> 'ProductFeatures':
+        """
+        Feature dei prodotti indicati, nell'ordine dato: dagli array precalcolati
+        se sono tutti nel catalogo, altrimenti calcolate al volo.
+        """
+        rows = [self.row_of.get(p.get('id')) for p in products]
+        if any(row is None for row in rows):
+            return ProductFeatures(products)
+        return self.take(np.array(rows, dtype=np.int64))
@@ -0,0 +1,153 @@
+"""
+Model Gazetteer - Nomi modello del catalogo compilati in un trie di token
+
+Costruito all'avvio dai `nome` dei prodotti principali che contengono un
+numero ("A 1500", "Combi 553 S", "Swift 372e"). I token sono normalizzati
+(minuscolo, senza accenti, lettere e cifre separate: "A1500" = "a 1500",
+"372e" = "372 e"), così spaziatura e maiuscole non contano. Le lettere di
+serie che sono anche parole comuni ("a", "e") aprono un nome solo se
+seguite da un numero del trie e non da un'unità ("fino a 1500 mq").
+
+Il rilevamento è una scansione lineare dei token del testo: da ogni token
+si scende nel trie e vince il nome completo più lungo. Un nome parziale
+("Swift 372" → "Swift 372e", "CS 100e" → le due versioni) vale solo se
+contiene un numero e copre al massimo MAX_VARIANTS nomi. Ogni menzione
+porta direttamente ai product_id.
+"""
+import re
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .lexical import ITALIAN_STOPWORDS, fold
+from .product_matcher import is_accessory_product
+
+# Lettere (anche accentate) o cifre: "A140v" → "A", "140", "v"
+_TOKEN_RE = re.compile(r'[^\W\d_]+|\d+')
+
+# Unità dopo un nome che inizia con una parola comune: "fino a 1500 mq", "e 24 ore"
+_UNIT_RE = re.compile(r'\s*(?:€|m²|(?:mq|metri|metro|m|euro|eur|cm|mm|kg|ah|v|w|min|minuti|ore|h|litri|l)\b)', re.IGNORECASE)
+
+# Nomi completi massimi coperti da una menzione parziale (versioni dello stesso modello)
+MAX_VARIANTS = 3
+
+
+class ModelMention(NamedTuple):
+    name: str
+    product_ids: List[str]
+    start: int
+    end: int
+
+
+class _Node:
+    __slots__ = ('children', 'name', 'product_ids', 'variants')
+
+    def __init__(self):
+        self.children: Dict[str, '_Node'] = {}
+        self.name: Optional[str] = None
+        self.product_ids: List[str] = []
+        # Nodi dei nomi completi nel sottoalbero (vuoto se più di MAX_VARIANTS)
+        self.variants: List['_Node'] = []
+
+
+def model_tokens(text: str) -> List[str]:
+    """Token normalizzati di un nome o di un testo"""
+    return [fold(token) for token in _TOKEN_RE.findall(text)]
+
+
+class ModelGazetteer:
+    """Trie di token dei nomi modello → product_id"""
+
+    def __init__(self, products: List[dict]):
+        self.root = _Node()
+        self.num_names = 0
+
+        for product in products:
+            name, product_id = product.get('nome'), product.get('id')
+            if not name or not product_id or is_accessory_product(product):
+                continue
+            tokens = model_tokens(name)
+            if not any(t.isdigit() for t in tokens) or all(t.isdigit() for t in tokens):
+                continue
+            node = self.root
+            for token in tokens:
+                node = node.children.setdefault(token, _Node())
+            if node.name is None:
+                node.name = name
+                self.num_names += 1
+            if product_id not in node.product_ids:
+                node.product_ids.append(product_id)
+
+        self._collect_variants(self.root)
+        self.scan = lru_cache(maxsize=1024)(self._scan)
+
+    def _collect_variants(self, node: _Node) -> int:
+        """Conta i nomi completi del sottoalbero e li registra se sono al massimo MAX_VARIANTS"""
+        variants = [node] if node.name is not None else []
+        count = len(variants)
+        for child in node.children.values():
+            count += self._collect_variants(child)
+            variants.extend(child.variants)
+        node.variants = variants if count <= MAX_VARIANTS else []
+        return count
+
+    def _scan(self, text: str) -> Tuple[ModelMention, ...]:
+        """Menzioni di modelli nel testo, da sinistra, senza sovrapposizioni"""
+        text = text or ''
+        tokens = [(m.group(), fold(m.group()), m.start(), m.end()) for m in _TOKEN_RE.finditer(text)]
+        mentions = []
+        i = 0
+        while i < len(tokens):
+            _, token, start, _ = tokens[i]
+            # Iniziali che sono parole comuni ("a", "e", "c"): valgono solo se nel trie
+            # proseguono con un numero ("a1500", "a 750"), non davanti a un'unità ("a 1500 mq")
+            common_lead = token in ITALIAN_STOPWORDS
+            if common_lead and not self._series_lead(tokens, i):
+                i += 1
+                continue
+
+            # Nome completo più lungo; altrimenti il prefisso più lungo con poche versioni
+            node, best, partial, end, has_digit = self.root, None, None, i, False
+            j = i
+            while j < len(tokens) and tokens[j][1] in node.children:
+                node = node.children[tokens[j][1]]
+                has_digit = has_digit or tokens[j][1].isdigit()
+                j += 1
+                if node.name is not None:
+                    best, end = node, j
+                elif best is None and has_digit and j - i >= 2 and node.variants:
+                    partial, end = node, j
+            if best is not None:
+                variants = [best]
+            elif partial is not None:
+                variants = partial.variants
+            else:
+                i += 1
+                continue
+
+            # Lettera minuscola staccata seguita da un'unità: "fino a 1500 mq" non è
+            # l'A 1500 ("a1500 mq" e "A 1500 mq" restano modelli)
+            loose = common_lead and not tokens[i][0].isupper() and tokens[i][3] != tokens[i + 1][2]
+            if loose and _UNIT_RE.match(text, tokens[end - 1][3]):
+                i += 1
+                continue
+
+            product_ids = []
+            for variant in variants:
+                product_ids.extend(pid for pid in variant.product_ids if pid not in product_ids)
+            name = min((v.name for v in variants), key=len)
+            mentions.append(ModelMention(name, product_ids, start, tokens[end - 1][3]))
+            i = end
+        return tuple(mentions)
+
+    def _series_lead(self, tokens: List[tuple], i: int) -> bool:
+        """La parola comune in posizione i prosegue nel trie con un numero ("a 1500")"""
+        node = self.root.children.get(tokens[i][1])
+        return (node is not None and i + 1 < len(tokens)
+                and tokens[i + 1][1].isdigit() and tokens[i + 1][1] in node.children)
+
+    def product_ids(self, text: str) -> List[str]:
+        """product_id dei modelli citati, nell'ordine delle menzioni"""
+        ids = []
+        for mention in self.scan(text):
+            ids.extend(pid for pid in mention.product_ids if pid not in ids)
+        return ids
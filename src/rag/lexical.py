@@ -0,0 +1,157 @@
+"""
+Lexical Index - Indice invertito BM25 per il retrieval ibrido (lessicale + denso)
+"""
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional
+import numpy as np
+
+from .specs import get_spec
+
+# Stopword italiane (più le parole di cortesia tipiche delle query in chat)
+ITALIAN_STOPWORDS = frozenset("""
+il lo la i gli le l un uno una di a da in con su per tra fra e o ed od che chi non
+mi ti ci si vi ne del dello della dei degli delle dell al allo alla ai agli alle all
+dal dallo dalla dai dagli dalle dall nel nello nella nei negli nelle nell sul sullo
+sulla sui sugli sulle sull c è e' ho hai ha abbiamo avete hanno sono sei siamo siete
+come cosa quale quali quanto quanti mio mia miei mie tuo tua suo sua questo questa
+questi queste quello quella voglio vorrei cerco cercavo mostrami dammi fammi vedere
+qualcosa anche più piu molto poco ciao grazie buongiorno salve
+""".split())
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+_CHUNK_RE = re.compile(r'\S+')
+
+
+def fold(text: str) -> str:
+    """Minuscolo senza accenti (è → e, à → a)"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def _stem(word: str) -> str:
+    """Stemming leggero italiano: toglie la vocale finale (singolare/plurale)"""
+    if len(word) > 4 and word.isalpha() and word[-1] in 'aeio':
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokenizzazione italiana per BM25.
+    
+    - minuscolo, accenti rimossi, elisioni spezzate (dell'erba → erba)
+    - stopword rimosse, stemming leggero singolare/plurale
+    - codici modello: "A 1500" → anche "a1500"; "372e" → anche "372";
+      "2R7114128/ST1" → anche "2r7114128st1"
+    """
+    folded = fold(text)
+    tokens = []
+    
+    words = _WORD_RE.findall(folded)
+    for i, word in enumerate(words):
+        if word not in ITALIAN_STOPWORDS:
+            tokens.append(_stem(word))
+        # Varianti di modello ("372e" → anche "372")
+        if word[0].isdigit() and not word.isdigit():
+            digits = re.match(r'\d+', word).group()
+            if len(digits) >= 2:
+                tokens.append(digits)
+        # Sigla + numero staccati ("A 1500", "G 300") → token unico
+        if (word.isalpha() and len(word) <= 3 and i + 1 < len(words)
+                and words[i + 1][0].isdigit()):
+            tokens.append(word + words[i + 1])
+    
+    # Codici con punteggiatura (SKU/EAN) → forma compatta
+    for chunk in _CHUNK_RE.findall(folded):
+        compact = ''.join(_WORD_RE.findall(chunk))
+        if compact and any(c.isdigit() for c in compact) and compact not in words:
+            tokens.append(compact)
+    
+    return tokens
+
+
+class BM25Index:
+    """
+    Indice invertito in memoria su nome, keywords, SKU/EAN e caratteristiche.
+    
+    I pesi BM25 di ogni posting sono precalcolati alla costruzione:
+    a query time lo score è una somma di posting list.
+    """
+    
+    # Peso dei campi (moltiplica la term frequency)
+    FIELD_WEIGHTS = {
+        'nome': 3,
+        'codici': 3,
+        'keywords': 1,
+        'caratteristiche': 1
+    }
+    
+    def __init__(self, row_products: List[Optional[dict]], k1: float = 1.2, b: float = 0.75):
+        """
+        Args:
+            row_products: Prodotti allineati alle righe della matrice (None = riga orfana)
+            k1: Saturazione della term frequency
+            b: Normalizzazione per lunghezza del documento
+        """
+        self.num_rows = len(row_products)
+        
+        docs: List[Counter] = []
+        for product in row_products:
+            doc = Counter()
+            if product is not None:
+                for field, text in self._fields(product).items():
+                    weight = self.FIELD_WEIGHTS[field]
+                    for token in tokenize(text):
+                        doc[token] += weight
+            docs.append(doc)
+        
+        lengths = np.array([sum(d.values()) for d in docs], dtype=np.float32)
+        avg_length = float(lengths.mean()) if len(lengths) and lengths.mean() > 0 else 1.0
+        
+        postings: Dict[str, List] = {}
+        for row, doc in enumerate(docs):
+            for token, tf in doc.items():
+                postings.setdefault(token, []).append((row, tf))
+        
+        self.postings: Dict[str, tuple] = {}
+        for token, entries in postings.items():
+            rows = np.array([r for r, _ in entries], dtype=np.int64)
+            tf = np.array([t for _, t in entries], dtype=np.float32)
+            df = len(entries)
+            idf = math.log(1 + (self.num_rows - df + 0.5) / (df + 0.5))
+            norm = k1 * (1 - b + b * lengths[rows] / avg_length)
+            self.postings[token] = (rows, (idf * tf * (k1 + 1) / (tf + norm)).astype(np.float32))
+    
+    @staticmethod
+    def _fields(product: dict) -> Dict[str, str]:
+        """Testo dei campi indicizzati"""
+        caratteristiche = product.get('caratteristiche') or []
+        if caratteristiche and isinstance(caratteristiche[0], dict):
+            caratteristiche = [f"{c.get('titolo', '')} {c.get('descrizione', '')}" for c in caratteristiche]
+        
+        codici = [get_spec(product, 'SKU'), get_spec(product, 'EAN/UPC')]
+        
+        return {
+            'nome': product.get('nome') or '',
+            'codici': ' '.join(c for c in codici if c),
+            'keywords': ' '.join(product.get('keywords') or []),
+            'caratteristiche': ' '.join(caratteristiche)
+        }
+    
+    def score(self, query: str) -> Optional[np.ndarray]:
+        """
+        Score BM25 della query per ogni riga (None se nessun termine è indicizzato)
+        """
+        scores = None
+        for token in set(tokenize(query)):
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            if scores is None:
+                scores = np.zeros(self.num_rows, dtype=np.float32)
+            rows, weights = posting
+            scores[rows] += weights
+        return scores
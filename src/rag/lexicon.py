@@ -0,0 +1,358 @@
+"""
+Lexicon - Vocabolari di accessori, categorie, alimentazione e "mostra tutto"
+
+Tutti i vocabolari sono compilati in un unico automa multi-pattern
+(Aho-Corasick): un solo passaggio lineare sul testo restituisce ogni match
+con il suo tipo. La scansione è memoizzata per testo, così retriever,
+matcher e app che analizzano la stessa query non la riscandiscono.
+
+Confini dei termini (come i \\b delle regex sostituite):
+- substring: ovunque nel testo ('base' trova anche 'basato')
+- word: parola intera
+- stem: inizio di parola seguito da altre lettere ('arieggiat' → 'arieggiatore')
+"""
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+SUBSTRING, WORD, STEM = 'substring', 'word', 'stem'
+
+
+# ═══════════════════════════════════════════════════════════════════
+# VOCABOLARI
+# ═══════════════════════════════════════════════════════════════════
+
+# Parole che indicano una ricerca di accessori/ricambi (match come sottostringa)
+ACCESSORY_KEYWORDS = [
+    'accessorio', 'accessori', 'ricambio', 'ricambi', 'kit', 'pezzo', 'pezzi',
+    'lama', 'lame', 'cavo', 'cavi', 'perimetrale', 'bobina', 'stazione', 'base',
+    'ricarica', 'chiodi', 'picchetti', 'installazione', 'connettore', 'copertura',
+    'piatto', 'piatti', 'sacco', 'sacchi', 'raccoglierba', 'mulching',
+    'filo', 'testina', 'testine', 'rocchetto', 'catena', 'catene', 'barra',
+    'lancia', 'spazzola', 'ugello', 'tubo', 'detergente', 'prolunga',
+    'batteria', 'batterie', 'caricabatterie', 'alimentatore',
+    'filtro', 'candela', 'guarnizione', 'molla'
+]
+
+# Categorie catalogo di accessori (sottostringa della categoria prodotto)
+ACCESSORY_CATEGORIES = [
+    'accessori per robot tagliaerba', 'accessori per tagliaerba',
+    'accessori per trattorini', 'accessori per decespugliatori',
+    'accessori per motoseghe', 'accessori per idropulitrici',
+    'kit batteria', 'ricambi', 'pezzi di ricambio',
+    'accessori per tagliabordi e decespugliatori',
+    'accessori per tagliaerba elicoidali',
+    'accessori per trattorini a taglio frontale',
+    'accessori per trattorini da giardino',
+    'accessori per attrezzi multifunzione',
+    'accessori per idropulitrici ad alta pressione',
+    'accessori per motoseghe',
+    'accessori per motozappe',
+    'accessori per spazzaneve',
+    'accessori per spazzatrici',
+    'accessori cross categoria'
+]
+
+# Categorie di prodotti principali: un tagliasiepi con "lama" nel nome NON è un accessorio
+MAIN_CATEGORIES = [
+    'tagliasiepi', 'robot tagliaerba', 'tagliaerba', 'trattorini',
+    'decespugliatori', 'motoseghe', 'idropulitrici', 'spazzaneve',
+    'soffiatori', 'motozappe', 'biotrituratori', 'forbici da potatura',
+    'cesoie per siepi', 'attrezzi multifunzione', 'tagliabordi',
+    'arieggiatori e scarificatori', 'aspiratori trituratori',
+    'attrezzi manuali per la coltivazione', 'falciatrici e coltivatori',
+    'tagliaerba elicoidali', 'trattorini assiali', 'trattorini da giardino',
+    'trattorini tagliaerba frontali', 'spazzatrici'
+]
+
+# Termine nella query → categoria nel database (in ordine di priorità)
+EXACT_CATEGORIES = {
+    'tagliasiepi': 'Tagliasiepi',
+    'robot tagliaerba': 'Robot tagliaerba',
+    'robot': 'Robot tagliaerba',
+    'tagliaerba': 'Tagliaerba',
+    'trattorino': 'Trattorini da giardino',
+    'trattorini': 'Trattorini da giardino',
+    'decespugliatore': 'Decespugliatori',
+    'decespugliatori': 'Decespugliatori',
+    'motosega': 'Motoseghe',
+    'motoseghe': 'Motoseghe',
+    'idropulitrice': 'Idropulitrici ad alta pressione',
+    'idropulitrici': 'Idropulitrici ad alta pressione',
+    'spazzaneve': 'Spazzaneve',
+    'soffiatore': 'Soffiatori e aspiratori',
+    'soffiatori': 'Soffiatori e aspiratori',
+    'biotrituratore': 'Biotrituratori',
+    'biotrituratori': 'Biotrituratori',
+    'motozappa': 'Motozappe',
+    'motozappe': 'Motozappe',
+    'spazzatrice': 'Spazzatrici',
+    'spazzatrici': 'Spazzatrici',
+}
+
+# Categorie dei requisiti (ProductMatcher): categoria → parole intere, in ordine di priorità.
+# 'robot tagliaerba' = robot e tagliaerba nella stessa riga, in qualunque ordine
+REQUIREMENT_CATEGORIES = {
+    'robot': ['robot'],
+    'trattorino': ['trattorino'],
+    'tagliaerba': ['tagliaerba'],
+    'decespugliatore': ['decespugliatore', 'decespugliatori'],
+    'motosega': ['motosega'],
+    'idropulitrice': ['idropulitrice', 'idropulitrici'],
+    'tagliasiepi': ['tagliasiepi'],
+}
+
+# Categorie del contesto conversazionale (app): categoria → (termine, confine)
+CHAT_CATEGORIES = {
+    'trattorino': [('trattorino', WORD), ('trattorini', WORD)],
+    'tagliaerba': [('tagliaerba', WORD)],
+    'decespugliatore': [('decespugliatore', WORD), ('decespugliatori', WORD), ('tagliabordi', WORD)],
+    'motosega': [('motosega', WORD), ('motoseghe', WORD)],
+    'idropulitrice': [('idropulitrice', WORD), ('idropulitrici', WORD), ('alta pressione', WORD)],
+    'spazzaneve': [('spazzaneve', WORD)],
+    'biotrituratore': [('biotriturator', WORD), ('biotrituratore', WORD)],
+    'motozappa': [('motozappa', WORD), ('motozappe', WORD)],
+    'spazzatrice': [('spazzatrice', WORD), ('spazzatrici', WORD)],
+    'soffiatore': [('soffiatore', WORD), ('soffiatori', WORD), ('aspiratore', WORD), ('aspiratori', WORD)],
+    'tagliasiepi': [('tagliasiepi', WORD)],
+    'forbici': [('forbici', WORD), ('cesoie', WORD)],
+    'arieggiatore': [('arieggiat', STEM), ('scarificat', STEM)]
+}
+
+# Accessori citati in conversazione (parole intere)
+CHAT_ACCESSORIES = [
+    'lama', 'lame', 'batteria', 'batterie', 'caricabatterie', 'filo', 'testina',
+    'catene', 'spazzola', 'sacco', 'piatto', 'ruote', 'copertura', 'kit',
+    'ricambi', 'accessori'
+]
+
+# Tipo di alimentazione: parola → valore normalizzato
+POWER_TYPES = {
+    'elettrico': 'elettrico',
+    'elettrica': 'elettrico',
+    'batteria': 'batteria',
+    'benzina': 'benzina',
+    'scoppio': 'benzina'
+}
+
+# Richiesta del catalogo completo (sottostringa)
+SHOW_ALL_KEYWORDS = [
+    'tutti', 'all', 'tutta la gamma', 'mostrami tutto', 'fammi vedere tutti', 'mostrami tutti',
+    'elenca tutti', 'voglio vedere tutti', 'dammi tutti', 'quali sono tutti'
+]
+SHOW_ALL_CATEGORIES = [
+    'robot', 'trattorini', 'tagliaerba', 'decespugliatori', 'motoseghe', 'tagliasiepi',
+    'idropulitrici', 'soffiatori'
+]
+
+
+# ═══════════════════════════════════════════════════════════════════
+# AUTOMA
+# ═══════════════════════════════════════════════════════════════════
+
+class LexiconMatch(NamedTuple):
+    kind: str
+    value: str
+    start: int
+    end: int
+    priority: int
+
+
+class KeywordAutomaton:
+    """Automa Aho-Corasick su caratteri: tutti i match (anche sovrapposti) in un passaggio"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, tuple]]] = [[]]
+
+    def add(self, term: str, payload: tuple):
+        state = 0
+        for ch in term:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[state][ch] = nxt
+            state = nxt
+        self._out[state].append((len(term), payload))
+
+    def build(self):
+        """Calcola i link di fallimento (BFS) e propaga gli output dei suffissi"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+                queue.append(nxt)
+
+    def iter(self, text: str) -> Iterator[Tuple[int, int, tuple]]:
+        """(inizio, fine, payload) di ogni termine presente nel testo"""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, payload in out[state]:
+                yield i + 1 - length, i + 1, payload
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == '_'
+
+
+def _vocabularies() -> Dict[str, List[Tuple[str, str, str]]]:
+    """Tipo → [(termine, valore, confine)], la posizione nella lista è la priorità"""
+    requirement_terms = [
+        (term, category, WORD)
+        for category, terms in REQUIREMENT_CATEGORIES.items() for term in terms
+    ]
+    chat_terms = [
+        (term, category, boundary)
+        for category, terms in CHAT_CATEGORIES.items() for term, boundary in terms
+    ]
+    return {
+        'accessorio': [(k, k, SUBSTRING) for k in ACCESSORY_KEYWORDS],
+        'categoria_accessori': [(c, c, SUBSTRING) for c in ACCESSORY_CATEGORIES],
+        'categoria_principale': [(c, c, SUBSTRING) for c in MAIN_CATEGORIES],
+        'categoria_esatta': [(k, c, SUBSTRING) for k, c in EXACT_CATEGORIES.items()],
+        'categoria_requisiti': requirement_terms,
+        'categoria_chat': chat_terms,
+        'robot': [('robot', 'robot', WORD)],
+        'accessorio_chat': [(k, k, WORD) for k in CHAT_ACCESSORIES],
+        'alimentazione': [(k, v, WORD) for k, v in POWER_TYPES.items()],
+        'mostra_tutto': [(k, k, SUBSTRING) for k in SHOW_ALL_KEYWORDS],
+        'categoria_catalogo': [(c, c, SUBSTRING) for c in SHOW_ALL_CATEGORIES]
+    }
+
+
+class Lexicon:
+    """Tutti i vocabolari in un solo automa; scan() filtra i match per confine di parola"""
+
+    def __init__(self, vocabularies: Dict[str, List[Tuple[str, str, str]]]):
+        self.automaton = KeywordAutomaton()
+        for kind, entries in vocabularies.items():
+            for priority, (term, value, boundary) in enumerate(entries):
+                self.automaton.add(term, (kind, value, boundary, priority))
+        self.automaton.build()
+
+    def scan(self, text: str) -> Tuple[LexiconMatch, ...]:
+        """Tutti i match nel testo (case-insensitive), ordinati per posizione"""
+        lowered = text.lower()
+        size = len(lowered)
+        matches = []
+        for start, end, (kind, value, boundary, priority) in self.automaton.iter(lowered):
+            if boundary != SUBSTRING:
+                if start > 0 and _is_word_char(lowered[start - 1]):
+                    continue
+                followed = end < size and _is_word_char(lowered[end])
+                if followed != (boundary == STEM):
+                    continue
+            matches.append(LexiconMatch(kind, value, start, end, priority))
+        matches.sort(key=lambda m: (m.start, m.priority))
+        return tuple(matches)
+
+
+LEXICON = Lexicon(_vocabularies())
+
+
+@lru_cache(maxsize=1024)
+def scan(text: str) -> Tuple[LexiconMatch, ...]:
+    """Scansione memoizzata: la stessa query analizzata da più moduli costa un passaggio"""
+    return LEXICON.scan(text)
+
+
+@lru_cache(maxsize=1024)
+def _by_kind(text: str) -> Dict[str, List[LexiconMatch]]:
+    """Match della scansione raggruppati per tipo (ordine di posizione)"""
+    grouped: Dict[str, List[LexiconMatch]] = {}
+    for match in scan(text):
+        grouped.setdefault(match.kind, []).append(match)
+    return grouped
+
+
+def matches_of(text: str, kind: str) -> List[LexiconMatch]:
+    return _by_kind(text or '').get(kind, [])
+
+
+def has_match(text: str, kind: str) -> bool:
+    return kind in _by_kind(text or '')
+
+
+def first_match(text: str, kind: str) -> Optional[LexiconMatch]:
+    """Match più a sinistra del tipo richiesto"""
+    found = matches_of(text, kind)
+    return found[0] if found else None
+
+
+def best_match(text: str, kind: str) -> Optional[LexiconMatch]:
+    """Match con priorità più alta (prima voce del vocabolario) del tipo richiesto"""
+    found = matches_of(text, kind)
+    return min(found, key=lambda m: m.priority) if found else None
+
+
+# ═══════════════════════════════════════════════════════════════════
+# RISOLUTORI USATI DA RETRIEVER, MATCHER E APP
+# ═══════════════════════════════════════════════════════════════════
+
+def is_accessory_query(query: str) -> bool:
+    """Determina se la query cerca accessori"""
+    return has_match(query, 'accessorio')
+
+
+def exact_category(query: str) -> Optional[str]:
+    """Categoria del database citata nella query (la voce di EXACT_CATEGORIES più prioritaria)"""
+    match = best_match(query, 'categoria_esatta')
+    return match.value if match else None
+
+
+def _robot_tagliaerba(text: str, kind: str) -> bool:
+    """'robot' e 'tagliaerba' (parole intere) nella stessa riga"""
+    robots = matches_of(text, 'robot')
+    if not robots:
+        return False
+    mowers = [m for m in matches_of(text, kind) if m.value == 'tagliaerba']
+    return any(
+        '\n' not in text[min(r.start, t.start):max(r.end, t.end)]
+        for r in robots for t in mowers
+    )
+
+
+def requirement_category(query: str) -> Optional[str]:
+    """Categoria dei requisiti (ProductMatcher.extract_requirements)"""
+    if _robot_tagliaerba(query, 'categoria_requisiti'):
+        return 'robot tagliaerba'
+    match = best_match(query, 'categoria_requisiti')
+    return match.value if match else None
+
+
+def chat_category(text: str) -> Optional[str]:
+    """Categoria citata in un messaggio della conversazione"""
+    if _robot_tagliaerba(text, 'categoria_chat'):
+        return 'robot tagliaerba'
+    match = best_match(text, 'categoria_chat')
+    return match.value if match else None
+
+
+def chat_accessory(text: str) -> Optional[str]:
+    """Primo accessorio citato nel messaggio"""
+    match = first_match(text, 'accessorio_chat')
+    return match.value if match else None
+
+
+def power_type(text: str) -> Optional[str]:
+    """Prima alimentazione citata nel messaggio (elettrico, batteria, benzina)"""
+    match = first_match(text, 'alimentazione')
+    return match.value if match else None
+
+
+def wants_full_catalog(text: str) -> Tuple[bool, bool]:
+    """(richiesta 'mostra tutto', categoria esplicita del catalogo) nel messaggio"""
+    return has_match(text, 'mostra_tutto'), has_match(text, 'categoria_catalogo')
@@ -0,0 +1,131 @@
+"""
+Multi-Vector Index - Più vettori per prodotto (nome, descrizione, caratteristiche, specifiche)
+
+Il testo completo di un prodotto supera il limite di token del modello e il
+singolo vettore ne vede solo l'inizio. Qui ogni prodotto ha più chunk brevi;
+lo score del prodotto è il massimo tra i suoi chunk (max-sim), calcolato in
+modo vettoriale: i chunk di una riga sono contigui e `np.maximum.reduceat`
+riduce ogni segmento senza loop Python.
+
+Layout su disco: store standard (embedding_store) con id chunk "<product_id>#<n>",
+scritto nello stesso ordine righe dello store principale.
+"""
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+import numpy as np
+
+from .embedding_store import open_store
+
+
+def chunk_id(product_id: str, n: int) -> str:
+    return f"{product_id}#{n}"
+
+
+def chunk_product_id(chunk: str) -> str:
+    return chunk.rsplit('#', 1)[0]
+
+
+class MultiVectorIndex:
+    """
+    Chunk normalizzati + indice chunk → riga dello store principale.
+
+    - chunk_rows: riga prodotto di ogni chunk (non decrescente)
+    - seg_start / seg_count: primo chunk e numero di chunk per ogni riga
+      (seg_count 0 = riga senza chunk)
+    """
+
+    def __init__(self, matrix: np.ndarray, chunk_rows: np.ndarray, num_rows: int):
+        order = np.argsort(chunk_rows, kind='stable')
+        if np.any(order != np.arange(len(order))):
+            # Chunk non allineati all'ordine dello store: copia riordinata
+            matrix, chunk_rows = np.ascontiguousarray(matrix[order]), chunk_rows[order]
+        self.matrix = matrix
+        self.chunk_rows = chunk_rows.astype(np.int64)
+
+        self.seg_count = np.bincount(self.chunk_rows, minlength=num_rows).astype(np.int64)
+        self.seg_start = np.concatenate(([0], np.cumsum(self.seg_count)[:-1])).astype(np.int64)
+        self.rows_with_chunks = np.flatnonzero(self.seg_count)
+        self.manifest: Dict = {}
+
+    @classmethod
+    def load(
+        cls,
+        path: Union[str, Path],
+        row_of_product: Dict[str, int],
+        num_rows: int
+    ) -> 'MultiVectorIndex':
+        """
+        Apre lo store dei chunk (memory-mapped) e lo aggancia alle righe dello store
+        principale; i chunk di prodotti non più presenti vengono scartati.
+        """
+        matrix, manifest = open_store(path)
+        rows = np.array(
+            [row_of_product.get(chunk_product_id(c), -1) for c in manifest['product_ids']],
+            dtype=np.int64
+        )
+        keep = rows >= 0
+        if not keep.all():
+            matrix, rows = matrix[keep], rows[keep]
+        index = cls(matrix, rows, num_rows)
+        index.manifest = manifest
+        return index
+
+    @property
+    def num_chunks(self) -> int:
+        return len(self.chunk_rows)
+
+    def max_sim(self, rows: np.ndarray, query_vector: np.ndarray) -> np.ndarray:
+        """
+        Max-sim per le righe richieste: massimo coseno tra la query e i chunk
+        di ogni riga (-inf per le righe senza chunk). Vengono letti solo i chunk
+        delle righe richieste.
+        """
+        out = np.full(len(rows), -np.inf, dtype=np.float32)
+        counts = self.seg_count[rows]
+        has = counts > 0
+        if not has.any():
+            return out
+
+        counts = counts[has]
+        starts = self.seg_start[rows[has]]
+        # Indici dei chunk di tutte le righe, segmenti consecutivi
+        offsets = np.cumsum(counts) - counts
+        chunk_idx = np.repeat(starts - offsets, counts) + np.arange(counts.sum())
+
+        chunk_scores = self.matrix[chunk_idx] @ query_vector
+        out[has] = np.maximum.reduceat(chunk_scores, offsets)
+        return out
+
+    def max_sim_all(self, query_matrix: np.ndarray) -> np.ndarray:
+        """Max-sim di più query su tutte le righe: (n_query, num_rows), -inf senza chunk"""
+        num_rows = len(self.seg_count)
+        out = np.full((len(query_matrix), num_rows), -np.inf, dtype=np.float32)
+        if self.num_chunks == 0:
+            return out
+        chunk_scores = query_matrix @ self.matrix.T
+        out[:, self.rows_with_chunks] = np.maximum.reduceat(
+            chunk_scores, self.seg_start[self.rows_with_chunks], axis=1
+        )
+        return out
+
+
+def chunk_texts_for_store(
+    product_ids: List[Optional[str]],
+    products_by_id: Dict[str, dict],
+    chunker: Callable[[dict], List[str]]
+) -> Tuple[List[str], List[str]]:
+    """
+    Chunk di tutti i prodotti nell'ordine righe dello store principale.
+
+    Returns:
+        (id chunk, testi)
+    """
+    ids, texts = [], []
+    for pid in product_ids:
+        product = products_by_id.get(pid)
+        if product is None:
+            continue
+        for n, text in enumerate(chunker(product)):
+            ids.append(chunk_id(pid, n))
+            texts.append(text)
+    return ids, texts
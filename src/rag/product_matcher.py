@@ -1,185 +1,144 @@
 """
 Product Matcher - Sistema intelligente di matching e re-ranking
 """
-import re
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional, Set
+import numpy as np
 
-# Keywords accessori
-ACCESSORY_KEYWORDS = [
-    'accessorio', 'accessori', 'ricambio', 'ricambi', 'kit', 'pezzo', 'pezzi',
-    'lama', 'lame', 'cavo', 'cavi', 'perimetrale', 'bobina', 'stazione', 'base', 
-    'ricarica', 'chiodi', 'picchetti', 'installazione', 'connettore', 'copertura',
-    'piatto', 'piatti', 'sacco', 'sacchi', 'raccoglierba', 'mulching',
-    'filo', 'testina', 'testine', 'rocchetto', 'catena', 'catene', 'barra',
-    'lancia', 'spazzola', 'ugello', 'tubo', 'detergente', 'prolunga',
-    'batteria', 'batterie', 'caricabatterie', 'alimentatore',
-    'filtro', 'candela', 'guarnizione', 'molla'
-]
-
-ACCESSORY_CATEGORIES = [
-    'accessori per robot tagliaerba', 'accessori per tagliaerba',
-    'accessori per trattorini', 'accessori per decespugliatori',
-    'accessori per motoseghe', 'accessori per idropulitrici',
-    'kit batteria', 'ricambi', 'pezzi di ricambio',
-    'accessori per tagliabordi e decespugliatori',
-    'accessori per tagliaerba elicoidali',
-    'accessori per trattorini a taglio frontale',
-    'accessori per trattorini da giardino',
-    'accessori per attrezzi multifunzione',
-    'accessori per idropulitrici ad alta pressione',
-    'accessori per motoseghe',
-    'accessori per motozappe',
-    'accessori per spazzaneve',
-    'accessori per spazzatrici',
-    'accessori cross categoria'
-]
-
-
-def is_accessory_query(query: str) -> bool:
-    """Determina se la query cerca accessori"""
-    query_lower = query.lower()
-    query_words = set(query_lower.split())
-    
-    for keyword in ACCESSORY_KEYWORDS:
-        if keyword in query_lower or keyword in query_words:
-            return True
-    return False
+from .entities import scan_entities
+from .lexicon import has_match
 
 
 def is_accessory_product(product: dict) -> bool:
     """Determina se un prodotto è un accessorio"""
-    categoria = product.get('categoria', '').lower()
-    nome = product.get('nome', '').lower()
+    categoria = product.get('categoria', '')
     
     # Check categoria PRIMA - più affidabile
-    for cat in ACCESSORY_CATEGORIES:
-        if cat.lower() in categoria:
-            return True
+    if has_match(categoria, 'categoria_accessori'):
+        return True
     
     # Se la categoria è un prodotto principale, NON è un accessorio
     # (anche se ha "lama" nel nome, un tagliasiepi NON è un accessorio)
-    main_categories = [
-        'tagliasiepi', 'robot tagliaerba', 'tagliaerba', 'trattorini',
-        'decespugliatori', 'motoseghe', 'idropulitrici', 'spazzaneve',
-        'soffiatori', 'motozappe', 'biotrituratori', 'forbici da potatura',
-        'cesoie per siepi', 'attrezzi multifunzione', 'tagliabordi',
-        'arieggiatori e scarificatori', 'aspiratori trituratori',
-        'attrezzi manuali per la coltivazione', 'falciatrici e coltivatori',
-        'tagliaerba elicoidali', 'trattorini assiali', 'trattorini da giardino',
-        'trattorini tagliaerba frontali', 'spazzatrici'
-    ]
-    
-    for main_cat in main_categories:
-        if main_cat in categoria:
-            return False  # È un prodotto principale!
+    if has_match(categoria, 'categoria_principale'):
+        return False  # È un prodotto principale!
     
     # Solo DOPO verifica nel nome (per prodotti senza categoria chiara)
-    nome_words = set(nome.split())
-    for keyword in ACCESSORY_KEYWORDS:
-        if keyword in nome or keyword in nome_words:
-            return True
-    
-    return False
+    return has_match(product.get('nome', ''), 'accessorio')
 
 
 class ProductMatcher:
     """Sistema di matching e re-ranking prodotti"""
     
-    def __init__(self):
+    def __init__(self, features=None):
+        """
+        Args:
+            features: ProductFeatures del catalogo (ProductRetriever.features);
+                se None le feature dei candidati vengono calcolate a ogni richiesta
+        """
         print("🔄 Caricamento ProductMatcher...")
+        self.features = features
         print("✅ Matcher pronto!")
     
     def extract_requirements(self, query: str) -> Dict:
         """Estrae requisiti dalla query"""
         requirements = {}
-        query_lower = query.lower()
         
-        # 🆕 FIX ANTI-ALLUCINAZIONE: Se cerca accessori, NON filtrare per categoria prodotto
-        cerca_accessori = is_accessory_query(query)
+        # Un solo passaggio sulla query per tutte le entità
+        entities = scan_entities(query)
         
-        if cerca_accessori:
+        # 🆕 FIX ANTI-ALLUCINAZIONE: Se cerca accessori, NON filtrare per categoria prodotto
+        if entities.cerca_accessori:
             # L'utente cerca accessori, non il prodotto principale
             # NON estrarre categoria come filtro altrimenti trova trattorini invece di accessori per trattorini
             print("🔧 Rilevata ricerca accessori - SKIP filtro categoria prodotto")
-        else:
+        elif entities.categoria_requisiti:
             # Estrai categoria SOLO se NON cerca accessori
-            category_patterns = {
-                'robot tagliaerba': r'\brobot\b.*\btagliaerba\b|\btagliaerba\b.*\brobot\b',
-                'robot': r'\brobot\b',
-                'trattorino': r'\btrattorino\b',
-                'tagliaerba': r'\btagliaerba\b',
-                'decespugliatore': r'\bdecespugliator[ei]\b',
-                'motosega': r'\bmotosega\b',
-                'idropulitrice': r'\bidropulitric[ei]\b',
-                'tagliasiepi': r'\btagliasiepi\b',
-            }
-            
-            for category, pattern in category_patterns.items():
-                if re.search(pattern, query_lower):
-                    requirements['categoria'] = category
-                    break
+            requirements['categoria'] = entities.categoria_requisiti
         
         # Estrai dimensioni
-        mq_match = re.search(r'(\d+)\s*(?:m²|mq|metri)', query_lower)
-        if mq_match:
-            requirements['area_mq'] = int(mq_match.group(1))
+        if entities.area_mq is not None:
+            requirements['area_mq'] = entities.area_mq
         
         # Estrai budget
-        budget_match = re.search(r'(\d+)\s*(?:€|euro)', query_lower)
-        if budget_match:
-            requirements['budget'] = int(budget_match.group(1))
+        if entities.budget is not None:
+            requirements['budget'] = entities.budget
         
         return requirements
     
+    @staticmethod
+    def requirement_filters(requirements: Dict) -> Dict:
+        """Filtri di range per ProductRetriever.search dai requisiti numerici (budget, area)"""
+        filters = {}
+        if 'budget' in requirements:
+            filters['prezzo_max'] = requirements['budget']
+        if 'area_mq' in requirements:
+            # Stessa tolleranza del boost area
+            filters['area_min'] = requirements['area_mq'] * 0.8
+        return filters
+    
     def rerank_products(
         self, 
         products_with_scores: List[Tuple[dict, float]],
-        query: str
+        query: str,
+        boost_ids: Optional[Set[str]] = None
     ) -> List[Tuple[dict, float, List[str]]]:
-        """Re-ranking con penalizzazione accessori"""
+        """
+        Re-ranking con penalizzazione accessori e boost area/budget.
+        Boost e penalità sono operazioni vettoriali sulle feature precalcolate.
         
-        cerca_accessori = is_accessory_query(query)
+        boost_ids: product_id dei modelli citati nel messaggio (boost, non
+        applicato quando si cercano accessori)
+        """
+        if not products_with_scores:
+            return []
+        
+        cerca_accessori = scan_entities(query).cerca_accessori
         requirements = self.extract_requirements(query)
         
-        reranked = []
+        products = [product for product, _ in products_with_scores]
+        scores = np.array([score for _, score in products_with_scores], dtype=np.float64)
+        features = self._features_for(products)
+        
+        # PENALIZZA ACCESSORI quando non cercati
+        accessory = features.is_accessory & (not cerca_accessori)
+        scores[accessory] *= 0.1
+        
+        # BOOST per match area (NaN = area non indicata → nessun boost)
+        area_ok = np.zeros(len(products), dtype=bool)
+        if 'area_mq' in requirements:
+            with np.errstate(invalid='ignore'):
+                area_ok = features.area_mq >= requirements['area_mq'] * 0.8
+            scores[area_ok] *= 1.3
+        
+        # BOOST per budget
+        budget_ok = np.zeros(len(products), dtype=bool)
+        if 'budget' in requirements:
+            with np.errstate(invalid='ignore'):
+                budget_ok = features.price <= requirements['budget']
+            scores[budget_ok] *= 1.2
         
-        for product, base_score in products_with_scores:
-            score = base_score
+        # BOOST per modelli citati
+        cited = np.zeros(len(products), dtype=bool)
+        if boost_ids and not cerca_accessori:
+            cited = np.array([product.get('id') in boost_ids for product in products], dtype=bool)
+            scores[cited] *= 1.5
+        
+        reranked = []
+        for i in np.argsort(-scores, kind='stable'):
             reasons = []
-            
-            # PENALIZZA ACCESSORI quando non cercati
-            if is_accessory_product(product) and not cerca_accessori:
-                score *= 0.1
+            if accessory[i]:
                 reasons.append("⚠️ Accessorio (penalizzato)")
-            
-            # BOOST per match area
-            if 'area_mq' in requirements:
-                specs = product.get('specifiche_tecniche', {})
-                area_text = specs.get('Area di taglio fino a', '')
-                
-                if area_text:
-                    area_match = re.search(r'(\d+)', area_text)
-                    if area_match:
-                        product_area = int(area_match.group(1))
-                        required_area = requirements['area_mq']
-                        
-                        if product_area >= required_area * 0.8:
-                            score *= 1.3
-                            reasons.append(f"✅ Area ({product_area}mq)")
-            
-            # BOOST per budget
-            if 'budget' in requirements:
-                prezzo_text = product.get('prezzo', '')
-                if prezzo_text and prezzo_text != 'Contattaci':
-                    try:
-                        prezzo = float(prezzo_text.replace('€', '').replace('.', '').replace(',', '.').strip())
-                        if prezzo <= requirements['budget']:
-                            score *= 1.2
-                            reasons.append(f"✅ Budget ({int(prezzo)}€)")
-                    except:
-                        pass
-            
-            reranked.append((product, score, reasons))
-        
-        reranked.sort(key=lambda x: x[1], reverse=True)
-        return reranked
\ No newline at end of file
+            if area_ok[i]:
+                reasons.append(f"✅ Area ({int(features.area_mq[i])}mq)")
+            if budget_ok[i]:
+                reasons.append(f"✅ Budget ({int(features.price[i])}€)")
+            if cited[i]:
+                reasons.append("🏷️ Modello citato")
+            reranked.append((products[i], float(scores[i]), reasons))
+        return reranked
+    
+    def _features_for(self, products: List[dict]):
+        """Feature dei candidati: precalcolate se disponibili, altrimenti calcolate ora"""
+        if self.features is not None:
+            return self.features.for_products(products)
+        from .features import ProductFeatures
+        return ProductFeatures(products)
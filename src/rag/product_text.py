@@ -0,0 +1,138 @@
+"""
+Product Text - Testo canonico dei prodotti usato per gli embeddings
+
+Unico builder per script di generazione, ProductEmbedder e rebuild all'avvio.
+Ogni modifica al testo prodotto va accompagnata da un incremento di
+TEXT_BUILDER_VERSION: gli store costruiti con una versione diversa
+vengono riconosciuti come non aggiornati.
+"""
+import hashlib
+import re
+from typing import Dict, List
+
+from .embedding_store import text_hash
+
+TEXT_BUILDER_VERSION = 1
+
+
+def create_product_text(product: dict) -> str:
+    """Crea testo completo per embedding"""
+    parts = []
+
+    # Nome
+    if product.get('nome'):
+        parts.append(product['nome'])
+
+    # Categoria (ripetuta 2 volte per boost)
+    if product.get('categoria'):
+        categoria = product['categoria']
+        parts.append(f"{categoria} {categoria}")
+
+    # Descrizione COMPLETA
+    descrizione = product.get('descrizione_completa') or product.get('descrizione', '')
+    if descrizione:
+        parts.append(descrizione)
+
+    # Caratteristiche
+    if product.get('caratteristiche'):
+        caratteristiche = product['caratteristiche']
+        if caratteristiche and isinstance(caratteristiche[0], dict):
+            chars_text = ". ".join([f"{c['titolo']}: {c['descrizione']}" for c in caratteristiche])
+        else:
+            chars_text = ", ".join(caratteristiche)
+        parts.append("Caratteristiche: " + chars_text)
+
+    # Specifiche tecniche
+    specs = product.get('specifiche_tecniche', {})
+    if specs:
+        specs_text = []
+        for key, value in specs.items():
+            if value:
+                specs_text.append(f"{key}: {value}")
+
+        if specs_text:
+            parts.append("Specifiche: " + ", ".join(specs_text))
+
+    # Keywords
+    if product.get('keywords'):
+        parts.append("Keywords: " + ", ".join(product['keywords']))
+
+    # Prezzo
+    if product.get('prezzo'):
+        parts.append(f"Prezzo: {product['prezzo']}")
+
+    return " | ".join(parts)
+
+
+def catalog_hash(products: List[dict]) -> str:
+    """
+    Hash dei testi da codificare registrato nel manifest: (id, text_hash) per
+    prodotto, in ordine di id, più la versione del builder. Cambia solo se
+    cambia un testo (o l'insieme dei prodotti), non per campi che non
+    entrano negli embeddings né per l'ordine del catalogo.
+    """
+    pairs = sorted(f"{p.get('id')}:{text_hash(create_product_text(p))}" for p in products)
+    payload = f"v{TEXT_BUILDER_VERSION}\n" + "\n".join(pairs)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def build_metadata(products: List[dict]) -> Dict:
+    """Campi del manifest che legano lo store al builder e al catalogo"""
+    return {
+        'text_builder_version': TEXT_BUILDER_VERSION,
+        'catalog_hash': catalog_hash(products)
+    }
+
+
+# Versione dello spezzettamento in chunk (indice multi-vettore)
+CHUNK_BUILDER_VERSION = 1
+
+
+def _pack(pieces: List[str], max_chars: int) -> List[str]:
+    """Unisce pezzi consecutivi in chunk di al massimo max_chars (un pezzo lungo resta intero)"""
+    chunks, current = [], ''
+    for piece in pieces:
+        piece = piece.strip()
+        if not piece:
+            continue
+        if current and len(current) + len(piece) + 1 > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def create_product_chunks(product: dict, max_chars: int = 400) -> List[str]:
+    """
+    Testi brevi per l'indice multi-vettore: nome+categoria, descrizione,
+    caratteristiche e specifiche in chunk che stanno nel limite di token
+    del modello. Ogni chunk riporta il nome del prodotto come contesto.
+    """
+    nome = product.get('nome', '')
+    head = " ".join(filter(None, [nome, product.get('categoria'), product.get('sottocategoria')]))
+    chunks = [head] if head else []
+
+    descrizione = product.get('descrizione_completa') or product.get('descrizione', '')
+    sentences = re.split(r'(?<=[.!?])\s+', descrizione) if descrizione else []
+    chunks += [f"{nome}: {c}" for c in _pack(sentences, max_chars)]
+
+    caratteristiche = product.get('caratteristiche') or []
+    items = [
+        f"{c['titolo']}: {c['descrizione']}." if isinstance(c, dict) else f"{c}."
+        for c in caratteristiche
+    ]
+    chunks += [f"{nome} - Caratteristiche: {c}" for c in _pack(items, max_chars)]
+
+    # Codici (EAN/SKU) esclusi: li coprono l'indice esatto e BM25
+    specs = product.get('specifiche_tecniche') or {}
+    spec_items = []
+    for key, value in specs.items():
+        key = key.replace('Specifiche tecniche - ', '')
+        if value and key not in ('EAN/UPC', 'SKU'):
+            spec_items.append(f"{key}: {value},")
+    chunks += [f"{nome} - Specifiche: {c}" for c in _pack(spec_items, max_chars)]
+
+    return chunks
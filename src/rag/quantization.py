@@ -0,0 +1,216 @@
+"""
+Quantization - Embeddings compressi (int8 / float16) per lo scan grossolano
+
+Accanto ai file quantizzati, products_embeddings.quantized.json registra per
+ogni rappresentazione l'impronta dei product_id dello store da cui è stata
+generata: copie di uno store riordinato o cambiato vengono scartate.
+"""
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+import numpy as np
+
+from .ann_index import ids_digest
+from .embedding_store import _atomic_write, open_store
+
+QUANTIZATION_KINDS = ('int8', 'float16')
+
+
+def quantized_path(store_path: Union[str, Path], kind: str, suffix: str = '') -> Path:
+    """Path dei file quantizzati accanto allo store: products_embeddings.int8.npy"""
+    store_path = Path(store_path)
+    return store_path.with_name(f"{store_path.stem}.{kind}{suffix}.npy")
+
+
+def quantized_manifest_path(store_path: Union[str, Path]) -> Path:
+    """Path delle impronte dei file quantizzati: products_embeddings.quantized.json"""
+    store_path = Path(store_path)
+    return store_path.with_name(f"{store_path.stem}.quantized.json")
+
+
+def read_quantized_digests(store_path: Union[str, Path]) -> Dict[str, str]:
+    """Impronta dei product_id per rappresentazione (vuoto se assente)"""
+    path = quantized_manifest_path(store_path)
+    if not path.exists():
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get('digests', {})
+
+
+def quantize_int8(matrix: np.ndarray):
+    """
+    Quantizzazione int8 simmetrica con scala per dimensione.
+    
+    Returns:
+        (codici int8, scale float32 per dimensione)
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    scales = np.abs(matrix).max(axis=0) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def write_quantized(
+    store_path: Union[str, Path],
+    matrix: np.ndarray,
+    kinds=QUANTIZATION_KINDS,
+    product_ids: Optional[List[str]] = None
+) -> Dict[str, int]:
+    """
+    Scrive le versioni quantizzate della matrice (stesso ordine righe dello store),
+    in modo atomico: i worker possono averle aperte in memory-map.
+    
+    Args:
+        product_ids: ID delle righe dello store (impronta registrata per il caricamento)
+    
+    Returns:
+        Byte occupati per ogni rappresentazione
+    """
+    sizes = {'float32': int(np.asarray(matrix).nbytes)}
+    for kind in kinds:
+        if kind == 'int8':
+            codes, scales = quantize_int8(matrix)
+            _atomic_write(quantized_path(store_path, 'int8', '_scales'), lambda f: np.save(f, scales))
+            _atomic_write(quantized_path(store_path, 'int8'), lambda f: np.save(f, codes))
+            sizes['int8'] = int(codes.nbytes + scales.nbytes)
+        elif kind == 'float16':
+            codes = np.asarray(matrix, dtype=np.float16)
+            _atomic_write(quantized_path(store_path, 'float16'), lambda f: np.save(f, codes))
+            sizes['float16'] = int(codes.nbytes)
+        else:
+            raise ValueError(f"Quantizzazione non supportata: {kind}")
+    
+    # Impronte per ultime: una rappresentazione vale solo con l'impronta dello store attuale
+    digests = read_quantized_digests(store_path)
+    digest = ids_digest(product_ids, len(matrix))
+    digests.update({kind: digest for kind in kinds})
+    payload = json.dumps({'digests': digests}).encode('utf-8')
+    _atomic_write(quantized_manifest_path(store_path), lambda f: f.write(payload))
+    return sizes
+
+
+def refresh_quantized(store_path: Union[str, Path]) -> List[str]:
+    """
+    Riallinea allo store le rappresentazioni quantizzate già presenti
+    (da chiamare dopo ogni scrittura dello store)
+    
+    Returns:
+        Rappresentazioni riscritte
+    """
+    kinds = [k for k in QUANTIZATION_KINDS if quantized_path(store_path, k).exists()]
+    if kinds:
+        matrix, manifest = open_store(store_path)
+        write_quantized(store_path, matrix, kinds, product_ids=manifest['product_ids'])
+    return kinds
+
+
+class QuantizedMatrix:
+    """
+    Matrice compatta (memory-mapped) per lo scan grossolano.
+    Gli score sono approssimati: il retriever rivaluta solo la shortlist
+    con i vettori a precisione piena.
+    """
+    
+    # Righe convertite in float32 per blocco (limita la memoria temporanea)
+    BLOCK_ROWS = 4096
+    
+    def __init__(self, kind: str, codes: np.ndarray, scales: Optional[np.ndarray] = None,
+                 digest: Optional[str] = None):
+        self.kind = kind
+        self.codes = codes
+        self.scales = scales
+        # Impronta dei product_id dello store di origine (None = file senza impronta)
+        self.digest = digest
+    
+    @classmethod
+    def load(cls, store_path: Union[str, Path], kind: str) -> 'QuantizedMatrix':
+        """Apre la rappresentazione quantizzata con memory-map"""
+        if kind not in QUANTIZATION_KINDS:
+            raise ValueError(f"Quantizzazione non supportata: {kind}")
+        codes = np.load(quantized_path(store_path, kind), mmap_mode='r')
+        scales = None
+        if kind == 'int8':
+            scales = np.load(quantized_path(store_path, 'int8', '_scales'))
+        return cls(kind, codes, scales, digest=read_quantized_digests(store_path).get(kind))
+    
+    @property
+    def shape(self):
+        return self.codes.shape
+    
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0))
+    
+    def score(self, rows: np.ndarray, query_vector: np.ndarray) -> np.ndarray:
+        """Score approssimati (prodotto scalare) per le righe richieste"""
+        # int8: q · (codes * scales) = (q * scales) · codes
+        query = query_vector * self.scales if self.scales is not None else query_vector
+        query = query.astype(np.float32)
+        
+        scores = np.empty(len(rows), dtype=np.float32)
+        contiguous = len(rows) and rows[-1] - rows[0] + 1 == len(rows)
+        for start in range(0, len(rows), self.BLOCK_ROWS):
+            block_rows = rows[start:start + self.BLOCK_ROWS]
+            if contiguous:
+                block = self.codes[block_rows[0]:block_rows[-1] + 1]
+            else:
+                block = self.codes[block_rows]
+            scores[start:start + len(block_rows)] = block.astype(np.float32) @ query
+        return scores
+
+
+def evaluate_recall(
+    matrix: np.ndarray,
+    quantized: QuantizedMatrix,
+    top_k: int = 10,
+    rescore_factor: int = 4,
+    sample: int = 200,
+    seed: int = 1
+) -> Dict[str, float]:
+    """
+    Recall@k rispetto allo scan esatto, usando righe del catalogo (con rumore)
+    come query: sia solo scan quantizzato, sia con rescoring della shortlist.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(matrix), min(sample, len(matrix)), replace=False)
+    queries = matrix[picks] + rng.normal(0, 0.02, (len(picks), matrix.shape[1])).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    
+    rows = np.arange(len(matrix))
+    k = min(top_k, len(matrix))
+    shortlist_size = min(len(matrix), k * rescore_factor)
+    coarse_recall, rescored_recall = [], []
+    
+    for q in queries:
+        exact = np.argpartition(-(matrix @ q), k - 1)[:k]
+        coarse = quantized.score(rows, q)
+        coarse_top = np.argpartition(-coarse, k - 1)[:k]
+        shortlist = np.argpartition(-coarse, shortlist_size - 1)[:shortlist_size]
+        rescored = shortlist[np.argpartition(-(matrix[shortlist] @ q), k - 1)[:k]]
+        
+        coarse_recall.append(len(np.intersect1d(exact, coarse_top)) / k)
+        rescored_recall.append(len(np.intersect1d(exact, rescored)) / k)
+    
+    return {
+        'recall_coarse': float(np.mean(coarse_recall)),
+        'recall_rescored': float(np.mean(rescored_recall))
+    }
+
+
+def report_quantization(
+    store_path: Union[str, Path],
+    kinds=QUANTIZATION_KINDS,
+    top_k: int = 10,
+    rescore_factor: int = 4,
+    sample: int = 200
+):
+    """Stampa memoria e recall@k di ogni rappresentazione quantizzata dello store"""
+    matrix, _ = open_store(store_path)
+    for kind in kinds:
+        quantized = QuantizedMatrix.load(store_path, kind)
+        recall = evaluate_recall(matrix, quantized, top_k, rescore_factor, sample)
+        print(f"{kind:<8} {quantized.nbytes / 1e6:7.2f} MB (float32: {matrix.nbytes / 1e6:.2f} MB) | "
+              f"recall@{top_k} scan={recall['recall_coarse']:.3f} "
+              f"rescoring x{rescore_factor}={recall['recall_rescored']:.3f}")
@@ -0,0 +1,120 @@
+"""
+Query Embedding Cache - Cache LRU degli embedding delle query con tier su disco opzionale
+"""
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Union
+import numpy as np
+
+
+class QueryEmbeddingCache:
+    """
+    Cache limitata degli embedding delle query.
+    
+    - Chiave: testo normalizzato della query + nome del modello di embedding
+    - Memoria: LRU con dimensione massima
+    - Disco (opzionale): SQLite condiviso, così un worker riavviato parte già caldo
+    """
+    
+    def __init__(
+        self,
+        model_name: str,
+        max_size: int = 2048,
+        disk_path: Optional[Union[str, Path]] = None
+    ):
+        """
+        Args:
+            model_name: Nome del modello (entra nella chiave: cambiare modello invalida la cache)
+            max_size: Numero massimo di embedding tenuti in memoria
+            disk_path: File SQLite per il tier persistente (None = solo memoria)
+        """
+        self.model_name = model_name
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        
+        self._db = None
+        if disk_path:
+            disk_path = Path(disk_path)
+            disk_path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(disk_path), timeout=5, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._db.commit()
+    
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Normalizza il testo della query (Unicode NFC + spazi compattati)"""
+        return ' '.join(unicodedata.normalize('NFC', query).split())
+    
+    def _key(self, normalized_query: str) -> str:
+        return f"{self.model_name}\x00{normalized_query}"
+    
+    def get(self, query: str) -> Optional[np.ndarray]:
+        """Ritorna l'embedding in cache (memoria, poi disco) o None"""
+        key = self._key(self.normalize(query))
+        
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+            
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT vector FROM query_embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype=np.float32)
+                    self._store(key, vector)
+                    self.disk_hits += 1
+                    return vector
+            
+            self.misses += 1
+            return None
+    
+    def put(self, query: str, vector: np.ndarray):
+        """Salva l'embedding di una query (memoria + disco se attivo)"""
+        key = self._key(self.normalize(query))
+        vector = np.ascontiguousarray(vector, dtype=np.float32)
+        vector.setflags(write=False)
+        
+        with self._lock:
+            self._store(key, vector)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (key, vector) VALUES (?, ?)",
+                    (key, vector.tobytes())
+                )
+                self._db.commit()
+    
+    def _store(self, key: str, vector: np.ndarray):
+        """Inserisce in memoria con eviction LRU (chiamare con lock acquisito)"""
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def stats(self) -> Dict:
+        """Statistiche di dimensione e hit rate"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                'disk_tier': self._db is not None
+            }
@@ -2,44 +2,61 @@
 Product Retriever - Semantic search sui prodotti
 """
 import json
-import pickle
 import re
 import numpy as np
 from pathlib import Path
 from typing import List, Dict, Tuple, Optional
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+
+from .ann_index import IVFIndex, ids_digest
+from .batching import MicroBatcher
+from .embedding_store import (
+    load_embeddings,
+    normalize_rows,
+    read_manifest,
+    manifest_path,
+    manifest_staleness,
+    incremental_embeddings,
+    store_lock,
+    write_store
+)
+from .encoders import load_query_encoder, load_local_encoder
+from .exact_lookup import ExactLookupIndex
+from .facets import FacetBitsets, FacetIndex
+from .features import ProductFeatures
+from .gazetteer import ModelGazetteer
+from .spec_index import SpecIndex
+from .lexical import BM25Index
+from .lexicon import exact_category, is_accessory_query
+from .multi_vector import MultiVectorIndex
+from .product_text import CHUNK_BUILDER_VERSION, create_product_text, build_metadata
+from .quantization import QuantizedMatrix, quantized_path, refresh_quantized
+from .query_cache import QueryEmbeddingCache
 
 from ..config import (
     PRODUCTS_FILE,
     EMBEDDINGS_FILE,
+    EMBEDDINGS_STORE_FILE,
     EMBEDDING_MODEL,
-    TOP_K_PRODUCTS
+    TOP_K_PRODUCTS,
+    QUERY_CACHE_SIZE,
+    QUERY_CACHE_FILE,
+    RETRIEVAL_INDEX,
+    ANN_INDEX_FILE,
+    ANN_NPROBE,
+    ANN_MIN_ROWS,
+    HYBRID_LEXICAL_WEIGHT,
+    EMBEDDING_QUANTIZATION,
+    QUANTIZED_RESCORE_FACTOR,
+    ENCODER_SOCKET,
+    ENCODER_BATCH_WINDOW_MS,
+    ENCODER_MAX_BATCH,
+    ENCODER_THREADS,
+    EMBEDDINGS_STALE_POLICY,
+    MULTI_VECTOR_INDEX,
+    MULTI_VECTOR_FILE
 )
 
 
-def is_accessory_query(query: str) -> bool:
-    """Determina se la query cerca accessori"""
-    ACCESSORY_KEYWORDS = [
-        'accessorio', 'accessori', 'ricambio', 'ricambi', 'kit', 'pezzo', 'pezzi',
-        'lama', 'lame', 'cavo', 'cavi', 'perimetrale', 'bobina', 'stazione', 'base', 
-        'ricarica', 'chiodi', 'picchetti', 'installazione', 'connettore', 'copertura',
-        'piatto', 'piatti', 'sacco', 'sacchi', 'raccoglierba', 'mulching',
-        'filo', 'testina', 'testine', 'rocchetto', 'catena', 'catene', 'barra',
-        'lancia', 'spazzola', 'ugello', 'tubo', 'detergente', 'prolunga',
-        'batteria', 'batterie', 'caricabatterie', 'alimentatore',
-        'filtro', 'candela', 'guarnizione', 'molla'
-    ]
-    
-    query_lower = query.lower()
-    query_words = set(query_lower.split())
-    
-    for keyword in ACCESSORY_KEYWORDS:
-        if keyword in query_lower or keyword in query_words:
-            return True
-    return False
-
-
 class ProductRetriever:
     """Gestisce il retrieval semantico dei prodotti"""
     
@@ -51,84 +68,420 @@ class ProductRetriever:
         with open(PRODUCTS_FILE, 'r', encoding='utf-8') as f:
             self.products = json.load(f)
         
-        # Carica embeddings
-        with open(EMBEDDINGS_FILE, 'rb') as f:
-            data = pickle.load(f)
-            self.embeddings = data['embeddings']
-            self.model_name = data['model_name']
-            
-            # CRITICAL: Usa product_ids per mappare embeddings → prodotti
-            if 'product_ids' in data:
-                self.product_ids = data['product_ids']
-                # Crea mappatura product_id → indice embedding
-                self.id_to_embedding_idx = {pid: i for i, pid in enumerate(self.product_ids)}
-                # Crea mappatura product_id → prodotto
-                self.id_to_product = {p['id']: p for p in self.products}
-                print(f"✅ Mappatura product_ids caricata: {len(self.product_ids)} prodotti")
-            else:
-                # Fallback: assume ordine array (vecchio comportamento)
-                print("⚠️ WARNING: product_ids non trovato, uso ordine array")
-                self.product_ids = None
+        # Carica embeddings: store memory-mapped (condiviso tra i worker),
+        # fallback sul vecchio pickle; manifest verificato contro modello e catalogo
+        self.embeddings, self.product_ids, self.model_name, normalized = self._load_embeddings()
+        if normalized:
+            print(f"✅ Embeddings memory-mapped da {EMBEDDINGS_STORE_FILE.name}")
+        
+        # CRITICAL: Usa product_ids per mappare embeddings → prodotti
+        if self.product_ids is not None:
+            # Crea mappatura product_id → indice embedding
+            self.id_to_embedding_idx = {pid: i for i, pid in enumerate(self.product_ids)}
+            print(f"✅ Mappatura product_ids caricata: {len(self.product_ids)} prodotti")
+        else:
+            # Fallback: assume ordine array (vecchio comportamento)
+            print("⚠️ WARNING: product_ids non trovato, uso ordine array")
+        
+        # Crea mappatura product_id → prodotto
+        self.id_to_product = {p['id']: p for p in self.products}
+        self.categories = sorted({p['categoria'] for p in self.products if p.get('categoria')})
+        
+        # Indice esatto EAN/SKU/nome: risponde senza encoder
+        self.exact_index = ExactLookupIndex(self.products)
+        
+        # Gazetteer dei nomi modello: menzioni nel testo → product_id
+        self.gazetteer = ModelGazetteer(self.products)
+        
+        # Prodotti allineati alle righe della matrice (None se non più in catalogo)
+        if self.product_ids:
+            self.row_products = [self.id_to_product.get(pid) for pid in self.product_ids]
+        else:
+            self.row_products = [
+                self.products[i] if i < len(self.products) else None
+                for i in range(len(self.embeddings))
+            ]
+        self.valid_mask = np.array([p is not None for p in self.row_products], dtype=bool)
+        self.valid_rows = np.flatnonzero(self.valid_mask)
+        
+        # Feature derivate per riga (accessorio, prezzo, area) per il re-ranking vettoriale
+        self.features = ProductFeatures(self.row_products)
+        
+        # Indice faccette: categoria/sottocategoria/accessorio → righe
+        self.facets = FacetIndex(self.row_products, accessory=self.features.is_accessory)
+        
+        # Indice numerico delle specifiche per i filtri di range (prezzo_max, area_min, ...)
+        self.spec_index = SpecIndex(
+            self.row_products,
+            precomputed={'prezzo': self.features.price, 'area': self.features.area_mq}
+        )
         
-        # Carica modello per query encoding
-        self.model = SentenceTransformer(EMBEDDING_MODEL)
+        # Bitset delle faccette per /api/search (filtri e conteggi senza encoder)
+        self.facet_bits = FacetBitsets(self.row_products, price=self.features.price)
+        
+        # Indice invertito BM25: testo di /api/search e, se attivo, retrieval ibrido
+        # (codici modello, SKU, EAN)
+        self.bm25 = BM25Index(self.row_products)
+        self.lexical = self.bm25 if HYBRID_LEXICAL_WEIGHT > 0 else None
+        
+        # Matrice normalizzata L2 in float32, preparata una volta sola:
+        # il coseno diventa un semplice prodotto matrice-vettore.
+        # Lo store è già normalizzato → si usa il memmap senza copia
+        self.matrix = self.embeddings if normalized else normalize_rows(self.embeddings)
+        
+        # Indice ANN opzionale per cataloghi grandi (fallback: scan esatto)
+        self.ann_index = self._load_ann_index()
+        
+        # Matrice quantizzata opzionale per lo scan grossolano
+        self.quantized = self._load_quantized(normalized)
+        
+        # Chunk per prodotto opzionali: score = max(vettore prodotto, migliori chunk)
+        self.multi_vector = self._load_multi_vector()
+        
+        # Encoder delle query: modello locale o server condiviso (ENCODER_SOCKET)
+        self.model = load_query_encoder(EMBEDDING_MODEL)
+        
+        # Micro-batching delle encode concorrenti (thread dello stesso worker).
+        # Il server condiviso ha già il proprio batcher.
+        self.encoder_batcher = None
+        if not ENCODER_SOCKET and ENCODER_BATCH_WINDOW_MS > 0:
+            self.encoder_batcher = MicroBatcher(
+                self.model.encode,
+                window_ms=ENCODER_BATCH_WINDOW_MS,
+                max_batch=ENCODER_MAX_BATCH
+            )
+        
+        # Cache degli embedding delle query davanti all'encoder
+        # (chiave per encoder: vettori int8 e fp32 non si mescolano)
+        self.query_cache = QueryEmbeddingCache(
+            getattr(self.model, 'encoder_tag', EMBEDDING_MODEL),
+            max_size=QUERY_CACHE_SIZE,
+            disk_path=QUERY_CACHE_FILE or None
+        )
         
         print(f"✅ Caricati {len(self.products)} prodotti")
         print(f"✅ Embeddings shape: {self.embeddings.shape}")
     
-    def _detect_exact_category_match(self, query: str) -> Optional[str]:
+    def _load_embeddings(self) -> Tuple[np.ndarray, Optional[List[str]], Optional[str], bool]:
         """
-        Rileva se la query contiene esattamente il nome di una categoria
-        Ritorna la categoria se trovata, altrimenti None
+        Confronta il manifest con modello, builder del testo e hash del catalogo
+        e poi carica lo store. Se non combaciano applica EMBEDDINGS_STALE_POLICY.
+        
+        Il controllo usa solo il manifest e avviene prima di aprire la matrice:
+        uno store da ricostruire o da rifiutare non viene nemmeno mappato, e
+        open_store legge solo header e trailer del .npy (nessun byte della matrice).
         """
-        query_lower = query.lower().strip()
-        
-        # Mappa categorie esatte (query → categoria nel database)
-        exact_categories = {
-            'tagliasiepi': 'Tagliasiepi',
-            'robot tagliaerba': 'Robot tagliaerba',
-            'robot': 'Robot tagliaerba',
-            'tagliaerba': 'Tagliaerba',
-            'trattorino': 'Trattorini da giardino',
-            'trattorini': 'Trattorini da giardino',
-            'decespugliatore': 'Decespugliatori',
-            'decespugliatori': 'Decespugliatori',
-            'motosega': 'Motoseghe',
-            'motoseghe': 'Motoseghe',
-            'idropulitrice': 'Idropulitrici ad alta pressione',
-            'idropulitrici': 'Idropulitrici ad alta pressione',
-            'spazzaneve': 'Spazzaneve',
-            'soffiatore': 'Soffiatori e aspiratori',
-            'soffiatori': 'Soffiatori e aspiratori',
-            'biotrituratore': 'Biotrituratori',
-            'biotrituratori': 'Biotrituratori',
-            'motozappa': 'Motozappe',
-            'motozappe': 'Motozappe',
-            'spazzatrice': 'Spazzatrici',
-            'spazzatrici': 'Spazzatrici',
-        }
+        has_manifest = EMBEDDINGS_STORE_FILE.exists() and manifest_path(EMBEDDINGS_STORE_FILE).exists()
         
-        # Check se la query è esattamente una categoria
-        if query_lower in exact_categories:
-            return exact_categories[query_lower]
+        metadata = self.catalog_metadata = build_metadata(self.products)
+        reasons = manifest_staleness(
+            read_manifest(EMBEDDINGS_STORE_FILE) if has_manifest else None,
+            EMBEDDING_MODEL,
+            metadata
+        )
+        if reasons:
+            print(f"⚠️ WARNING: embeddings non aggiornati ({'; '.join(reasons)})")
+            if EMBEDDINGS_STALE_POLICY == 'rebuild':
+                self._rebuild_embeddings(metadata)
+            elif EMBEDDINGS_STALE_POLICY == 'refuse':
+                raise ValueError(
+                    "Embeddings non allineati: rigenera con scripts/generate_embeddings.py "
+                    "oppure imposta EMBEDDINGS_STALE_POLICY=rebuild"
+                )
         
-        # Check se la query contiene una categoria
-        for key, cat in exact_categories.items():
-            if key in query_lower:
-                return cat
+        loaded = load_embeddings(EMBEDDINGS_STORE_FILE, EMBEDDINGS_FILE)
+        if not reasons or EMBEDDINGS_STALE_POLICY == 'rebuild':
+            return loaded
         
-        return None
+        # Vettori di un altro modello non sono confrontabili con le query
+        model_name = loaded[2]
+        if model_name and model_name != EMBEDDING_MODEL:
+            raise ValueError(
+                "Embeddings non allineati: rigenera con scripts/generate_embeddings.py "
+                "oppure imposta EMBEDDINGS_STALE_POLICY=rebuild"
+            )
+        print("⚠️ Uso le righe esistenti: prodotti nuovi o modificati non sono ricercabili semanticamente")
+        return loaded
+    
+    def _rebuild_embeddings(self, metadata: Dict):
+        """Ricodifica solo le righe cambiate e riscrive lo store (un worker alla volta)"""
+        with store_lock(EMBEDDINGS_STORE_FILE):
+            # Un altro worker potrebbe averlo già aggiornato mentre si attendeva il lock
+            if manifest_path(EMBEDDINGS_STORE_FILE).exists() and not manifest_staleness(
+                read_manifest(EMBEDDINGS_STORE_FILE), EMBEDDING_MODEL, metadata
+            ):
+                print("✅ Embeddings già aggiornati da un altro processo")
+                return
+            
+            # Modello fp32 a lunghezza piena: lo stesso della generazione offline
+            encoder = load_local_encoder(EMBEDDING_MODEL, 'fp32', 0, ENCODER_THREADS)
+            matrix, text_hashes, stats = incremental_embeddings(
+                EMBEDDINGS_STORE_FILE,
+                [p['id'] for p in self.products],
+                [create_product_text(p) for p in self.products],
+                EMBEDDING_MODEL,
+                encoder.encode
+            )
+            write_store(
+                EMBEDDINGS_STORE_FILE,
+                matrix,
+                product_ids=[p['id'] for p in self.products],
+                model_name=EMBEDDING_MODEL,
+                products=self.products,
+                extra=metadata,
+                text_hashes=text_hashes
+            )
+            
+            # Le copie quantizzate esistenti vanno riallineate al nuovo store
+            refresh_quantized(EMBEDDINGS_STORE_FILE)
+            
+            print(f"✅ Embeddings ricostruiti: {stats['encoded']} codificati, "
+                  f"{stats['reused']} riusati, {stats['removed']} rimossi")
+    
+    def _load_ann_index(self) -> Optional[IVFIndex]:
+        """Carica l'indice IVF se abilitato e allineato agli embeddings"""
+        if RETRIEVAL_INDEX != 'ivf':
+            return None
+        
+        if len(self.matrix) < ANN_MIN_ROWS:
+            print(f"ℹ️ Catalogo piccolo ({len(self.matrix)} righe < {ANN_MIN_ROWS}) - uso scan esatto")
+            return None
+        
+        if not ANN_INDEX_FILE.exists():
+            print(f"⚠️ WARNING: indice IVF non trovato ({ANN_INDEX_FILE}) - uso scan esatto")
+            return None
+        
+        index = IVFIndex.load(ANN_INDEX_FILE)
+        digest = ids_digest(self.product_ids, len(self.matrix))
+        if index.num_rows != len(self.matrix) or index.digest != digest:
+            print("⚠️ WARNING: indice IVF non allineato agli embeddings - uso scan esatto")
+            return None
+        
+        print(f"✅ Indice IVF caricato: {index.n_lists} liste, nprobe={ANN_NPROBE}")
+        return index
+    
+    def _load_quantized(self, store_available: bool) -> Optional[QuantizedMatrix]:
+        """Carica la matrice int8/float16 se abilitata e allineata allo store"""
+        if EMBEDDING_QUANTIZATION in ('', 'none'):
+            return None
+        
+        if not store_available or not quantized_path(EMBEDDINGS_STORE_FILE, EMBEDDING_QUANTIZATION).exists():
+            print(f"⚠️ WARNING: embeddings {EMBEDDING_QUANTIZATION} non trovati - uso precisione piena")
+            return None
+        
+        quantized = QuantizedMatrix.load(EMBEDDINGS_STORE_FILE, EMBEDDING_QUANTIZATION)
+        # Stessa shape non basta: righe riordinate o prodotti cambiati darebbero shortlist sbagliate
+        digest = ids_digest(self.product_ids, len(self.matrix))
+        if quantized.shape != self.matrix.shape or quantized.digest != digest:
+            print("⚠️ WARNING: embeddings quantizzati non allineati allo store "
+                  "(rigenera con scripts/generate_embeddings.py) - uso precisione piena")
+            return None
+        
+        print(f"✅ Scan {EMBEDDING_QUANTIZATION}: {quantized.nbytes / 1e6:.1f} MB "
+              f"(float32: {self.matrix.nbytes / 1e6:.1f} MB), rescoring x{QUANTIZED_RESCORE_FACTOR}")
+        return quantized
+    
+    def _load_multi_vector(self) -> Optional[MultiVectorIndex]:
+        """Carica i chunk multi-vettore se abilitati e costruiti per questo modello e catalogo"""
+        if not MULTI_VECTOR_INDEX:
+            return None
+        
+        if self.product_ids is None or not MULTI_VECTOR_FILE.exists():
+            print(f"⚠️ WARNING: indice multi-vettore non trovato ({MULTI_VECTOR_FILE}) - uso un vettore per prodotto")
+            return None
+        
+        index = MultiVectorIndex.load(MULTI_VECTOR_FILE, self.id_to_embedding_idx, len(self.matrix))
+        reasons = manifest_staleness(index.manifest, EMBEDDING_MODEL, self.catalog_metadata)
+        if index.manifest.get('chunk_builder_version') != CHUNK_BUILDER_VERSION:
+            reasons.append(f"chunk v{index.manifest.get('chunk_builder_version')} ≠ v{CHUNK_BUILDER_VERSION}")
+        if reasons:
+            print(f"⚠️ WARNING: indice multi-vettore non aggiornato ({'; '.join(reasons)}) - uso un vettore per prodotto")
+            return None
+        
+        print(f"✅ Indice multi-vettore: {index.num_chunks} chunk su {len(index.rows_with_chunks)} prodotti")
+        return index
+    
+    def _detect_exact_category_match(self, query: str) -> Optional[str]:
+        """
+        Rileva se la query contiene il nome di una categoria
+        Ritorna la categoria se trovata, altrimenti None
+        """
+        return exact_category(query)
     
     def search(
         self, 
         query: str, 
         top_k: int = TOP_K_PRODUCTS,
         filters: Optional[Dict] = None,
-        min_score: float = 0.0
+        min_score: float = 0.0,
+        exact_prefix: bool = True
     ) -> List[Tuple[dict, float]]:
         """
         Cerca prodotti rilevanti per la query
+        
+        Filtri: faccette (categoria, sottocategoria, accessorio) e range numerici
+        <spec>_min / <spec>_max per prezzo (€), area (m²), batteria (Ah),
+        pendenza (%), larghezza (cm) e autonomia (min), es. {'prezzo_max': 1500};
+        i prodotti senza il valore della specifica non vengono esclusi
+        
+        exact_prefix: accetta codici/nomi parziali univoci nel fast path
+        (False per i messaggi di chat: solo EAN/SKU completi o nome esatto)
+        """
+        # Fast path: EAN/SKU/nome esatto → nessun encoding né scan
+        exact = self.lookup_exact(query, prefix=exact_prefix)
+        if exact and top_k > 0:
+            return exact[:top_k]
+        
+        filters = self._prepare_filters(query, filters)
+        
+        # Encode query (con cache)
+        query_vector = self._encode_queries([query])[0]
+        lexical_scores = self._lexical_scores(query)
+        
+        # Righe ammesse dai filtri: con un filtro di faccetta si calcola
+        # lo score SOLO sul sottoinsieme, le altre righe non vengono toccate
+        rows = self._filter_rows(filters, query_vector, lexical_scores)
+        
+        # Cosine similarity = prodotto scalare su vettori normalizzati
+        rows, scores = self._score_rows(rows, query_vector, top_k, lexical_scores)
+        
+        return self._rank(query, rows, scores, filters, top_k, min_score, lexical_scores)
+    
+    def search_many(
+        self,
+        queries: List[str],
+        top_k: int = TOP_K_PRODUCTS,
+        filters_per_query: Optional[List[Optional[Dict]]] = None,
+        min_score: float = 0.0,
+        exact_prefix: bool = True
+    ) -> List[List[Tuple[dict, float]]]:
+        """
+        Cerca prodotti per più query in un colpo solo.
+        
+        Tutte le query vengono codificate in un unico batch dell'encoder e
+        valutate con un solo prodotto matrice-matrice; i risultati per query
+        sono gli stessi di search().
+        
+        Args:
+            queries: Lista di query
+            top_k: Numero di risultati per query
+            filters_per_query: Filtri per ciascuna query (stessa lunghezza di queries)
+            min_score: Score minimo
+            exact_prefix: Come in search()
+        
+        Returns:
+            Lista (una per query) di liste (prodotto, score)
+        """
+        if filters_per_query is None:
+            filters_per_query = [None] * len(queries)
+        if len(filters_per_query) != len(queries):
+            raise ValueError("filters_per_query deve avere la stessa lunghezza di queries")
+        if not queries:
+            return []
+        
+        # Match esatti (EAN/SKU/nome) come in search(): non passano dall'encoder
+        exact = [self.lookup_exact(q, prefix=exact_prefix) if top_k > 0 else [] for q in queries]
+        pending = [i for i, matches in enumerate(exact) if not matches]
+        
+        results = [matches[:top_k] for matches in exact]
+        if not pending:
+            return results
+        
+        pending_queries = [queries[i] for i in pending]
+        all_filters = [self._prepare_filters(queries[i], filters_per_query[i]) for i in pending]
+        
+        # Un solo batch per l'encoder, un solo GEMM per gli score
+        # (con IVF o matrice quantizzata ogni query segue il proprio percorso)
+        query_matrix = self._encode_queries(pending_queries)
+        batched = self.ann_index is None and self.quantized is None
+        all_scores = query_matrix @ self.matrix.T if batched else None
+        if all_scores is not None and self.multi_vector is not None:
+            all_scores = np.maximum(all_scores, self.multi_vector.max_sim_all(query_matrix))
+        
+        for j, (i, filters) in enumerate(zip(pending, all_filters)):
+            lexical_scores = self._lexical_scores(queries[i])
+            rows = self._filter_rows(filters, query_matrix[j], lexical_scores)
+            if all_scores is not None:
+                scores = all_scores[j, rows]
+            else:
+                rows, scores = self._score_rows(rows, query_matrix[j], top_k, lexical_scores)
+            results[i] = self._rank(queries[i], rows, scores, filters, top_k, min_score, lexical_scores)
+        return results
+    
+    def faceted_search(
+        self,
+        query: str = '',
+        filters: Optional[Dict] = None,
+        top_k: int = 20
+    ) -> Dict:
+        """
+        Ricerca a faccette per i filtri del widget: nessuna chiamata all'encoder.
+        
+        - Filtri di faccetta (FacetBitsets.FIELDS, valore o lista di valori in OR)
+          e range numerici <spec>_min / <spec>_max come in search()
+        - Con la query: righe con match BM25, ordinate per BM25 normalizzato;
+          se l'embedding della query è già in cache si aggiunge il coseno
+        - Senza query: righe nell'ordine del catalogo
+        
+        Returns:
+            {'results': [(prodotto, score)], 'total': int, 'facets': conteggi}
+        """
+        bits = self.facet_bits
+        scope = bits.valid
+        
+        spec_rows = self.spec_index.select(filters)
+        if spec_rows is not None:
+            scope = scope & bits.from_rows(spec_rows)
+        
+        query = (query or '').strip()
+        lexical_scores = self.bm25.score(query) if query else None
+        if query:
+            matched = np.flatnonzero(lexical_scores) if lexical_scores is not None else self.valid_rows[:0]
+            scope = scope & bits.from_rows(matched)
+        
+        rows = bits.to_rows(scope & bits.select(filters))
+        
+        if lexical_scores is not None and len(rows):
+            scores = lexical_scores[rows] / lexical_scores[rows].max()
+            query_vector = self.query_cache.get(query)
+            if query_vector is not None:
+                scores = scores + self._rows_matrix(rows) @ query_vector
+            top = self._select_top_k(scores, top_k)
+            results = [(self.row_products[rows[i]], float(scores[i])) for i in top]
+        else:
+            results = [(self.row_products[row], 0.0) for row in rows[:max(top_k, 0)]]
+        
+        return {
+            'results': results,
+            'total': len(rows),
+            'facets': bits.counts(scope, filters)
+        }
+    
+    def lookup_exact(self, query: str, prefix: bool = False) -> List[Tuple[dict, float]]:
+        """
+        Prodotti che corrispondono esattamente a EAN, SKU o nome nella query
+        (score 1.0), lista vuota se nessun match. prefix=True accetta anche
+        codici/nomi parziali univoci (vedi ExactLookupIndex.lookup)
+        """
+        products = [self.id_to_product[pid] for pid in self.exact_index.lookup(query, prefix=prefix)
+                    if pid in self.id_to_product]
+        if products:
+            print(f"⚡ Match esatto per '{query}': {[p.get('nome') for p in products]}")
+        return [(product, 1.0) for product in products]
+    
+    def lookup_models(self, text: str) -> List[Tuple[dict, float]]:
+        """
+        Prodotti dei modelli citati nel testo (score 1.0, ordine delle menzioni),
+        lista vuota se il testo non cita modelli del catalogo
         """
+        products = [self.id_to_product[pid] for pid in self.gazetteer.product_ids(text)
+                    if pid in self.id_to_product]
+        if products:
+            print(f"🏷️  Modelli citati in '{text}': {[p.get('nome') for p in products]}")
+        return [(product, 1.0) for product in products]
+    
+    def _prepare_filters(self, query: str, filters: Optional[Dict]) -> Optional[Dict]:
+        """Aggiunge ai filtri la categoria esatta rilevata nella query"""
         # 🆕 FIX: NON forzare categoria se cerca accessori
         cerca_accessori = is_accessory_query(query)
         
@@ -139,65 +492,179 @@ class ProductRetriever:
             if exact_category:
                 print(f"🎯 Rilevata categoria esatta: '{exact_category}' dalla query '{query}'")
                 # Forza filtro sulla categoria
-                if not filters:
-                    filters = {}
+                filters = dict(filters) if filters else {}
                 filters['categoria'] = exact_category
         else:
             print(f"🔧 Query accessori rilevata nel retriever - NON forzo categoria")
         
-        # Encode query
-        query_embedding = self.model.encode([query])[0]
-        
-        # Calcola cosine similarity
-        similarities = cosine_similarity(
-            [query_embedding], 
-            self.embeddings
-        )[0]
-        
-        # Crea lista candidati con scores
-        candidates = []
-        for idx, score in enumerate(similarities):
-            # Filtra per score minimo
-            if score < min_score:
-                continue
-                
-            # Usa mappatura product_ids se disponibile
-            if self.product_ids:
-                product_id = self.product_ids[idx]
-                product = self.id_to_product.get(product_id)
-                if not product:
-                    continue  # Skip se prodotto non trovato
-            else:
-                product = self.products[idx]  # Fallback vecchio comportamento
-            
-            # Applica filtri se presenti
-            if filters:
-                if 'categoria' in filters:
-                    cat_filter = filters['categoria'].lower()
-                    prod_cat = product.get('categoria', '').lower()
-                    
-                    # Match ESATTO (non parziale) per evitare accessori
-                    # "Robot tagliaerba" deve matchare "robot tagliaerba" 
-                    # ma NON "accessori per robot tagliaerba"
-                    if prod_cat != cat_filter:
-                        continue
-            
-            candidates.append((product, float(score)))
+        return filters
+    
+    def _filter_rows(
+        self,
+        filters: Optional[Dict],
+        query_vector: Optional[np.ndarray] = None,
+        lexical_scores: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Righe della matrice da valutare per la query.
         
-        # Ordina per score
-        candidates.sort(key=lambda x: x[1], reverse=True)
+        - Filtro di faccetta e/o range numerico → scan esatto sul sottoinsieme
+        - Nessun filtro + indice IVF → righe delle liste più vicine
+          (più le righe con match lessicale, che l'IVF potrebbe perdere)
+        - Altrimenti → tutte le righe valide
+        """
+        rows = self.facets.select(filters)
+        # Range come vincolo solo per i prodotti che hanno il valore
+        spec_rows = self.spec_index.select(filters, keep_missing=True)
+        if spec_rows is not None:
+            rows = spec_rows if rows is None else np.intersect1d(rows, spec_rows, assume_unique=True)
+        if rows is not None:
+            return rows
+        
+        if self.ann_index is not None and query_vector is not None:
+            rows = self.ann_index.candidates(query_vector, ANN_NPROBE)
+            if lexical_scores is not None:
+                rows = np.union1d(rows, np.flatnonzero(lexical_scores))
+            return rows[self.valid_mask[rows]]
+        
+        return self.valid_rows
+    
+    def _rank(
+        self,
+        query: str,
+        rows: np.ndarray,
+        scores: np.ndarray,
+        filters: Optional[Dict],
+        top_k: int,
+        min_score: float,
+        lexical_scores: Optional[np.ndarray] = None
+    ) -> List[Tuple[dict, float]]:
+        """Fonde lo score lessicale, applica min_score, seleziona le top_k righe e risolve i prodotti"""
+        scores = self._fuse_lexical(rows, scores, lexical_scores)
+        
+        keep = scores >= min_score
+        rows, scores = rows[keep], scores[keep]
+        
+        top = self._select_top_k(scores, top_k)
+        
+        # Risolvi i prodotti SOLO per i vincitori
+        candidates = [(self.row_products[rows[i]], float(scores[i])) for i in top]
         
         # Log per debug
-        if len(candidates) > 0:
-            print(f"🔍 Query: '{query}' → Trovati {len(candidates)} prodotti")
+        if len(rows) > 0:
+            print(f"🔍 Query: '{query}' → Trovati {len(rows)} prodotti")
             if filters and 'categoria' in filters:
                 print(f"   Filtrati per categoria: {filters['categoria']}")
             print(f"   Top 3 scores: {[round(c[1], 3) for c in candidates[:3]]}")
         else:
             print(f"⚠️  Query: '{query}' → Nessun prodotto trovato!")
         
-        # Ritorna top K
-        return candidates[:top_k]
+        return candidates
+    
+    def _score_rows(
+        self,
+        rows: np.ndarray,
+        query_vector: np.ndarray,
+        top_k: int,
+        lexical_scores: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score denso (coseno) delle righe.
+        
+        Con la matrice quantizzata: scan grossolano int8/float16 su tutte le
+        righe, poi rescoring a precisione piena solo della shortlist
+        (top_k × QUANTIZED_RESCORE_FACTOR).
+        
+        Con l'indice multi-vettore lo score di ogni riga è il massimo tra il
+        vettore del prodotto e i suoi chunk.
+        
+        Returns:
+            (righe valutate, score a precisione piena)
+        """
+        if self.quantized is not None:
+            shortlist_size = max(top_k, 1) * QUANTIZED_RESCORE_FACTOR
+            if shortlist_size < len(rows):
+                coarse = self._fuse_lexical(rows, self.quantized.score(rows, query_vector), lexical_scores)
+                rows = rows[np.sort(np.argpartition(-coarse, shortlist_size - 1)[:shortlist_size])]
+        
+        scores = self._rows_matrix(rows) @ query_vector
+        if self.multi_vector is not None:
+            scores = np.maximum(scores, self.multi_vector.max_sim(rows, query_vector))
+        return rows, scores
+    
+    @staticmethod
+    def _fuse_lexical(
+        rows: np.ndarray,
+        scores: np.ndarray,
+        lexical_scores: Optional[np.ndarray]
+    ) -> np.ndarray:
+        """Somma al coseno lo score BM25 normalizzato sul massimo delle righe valutate"""
+        if lexical_scores is None or len(rows) == 0:
+            return scores
+        lexical = lexical_scores[rows]
+        best = lexical.max()
+        if best <= 0:
+            return scores
+        return scores + HYBRID_LEXICAL_WEIGHT * (lexical / best)
+    
+    def _lexical_scores(self, query: str) -> Optional[np.ndarray]:
+        """Score BM25 per riga (None se ibrido disattivo o nessun termine noto)"""
+        if self.lexical is None:
+            return None
+        return self.lexical.score(query)
+    
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Embedding normalizzati delle query (una riga per query).
+        Le query già in cache non passano dall'encoder, le altre
+        vengono codificate insieme in un unico batch.
+        """
+        vectors: List[Optional[np.ndarray]] = [self.query_cache.get(q) for q in queries]
+        
+        missing = {}
+        for query, vector in zip(queries, vectors):
+            if vector is None:
+                missing.setdefault(self.query_cache.normalize(query), query)
+        
+        if missing:
+            texts = list(missing)
+            encoder = self.encoder_batcher or self.model
+            encoded = normalize_rows(encoder.encode(texts))
+            fresh = dict(zip(texts, encoded))
+            for text, query in missing.items():
+                self.query_cache.put(query, fresh[text])
+            vectors = [
+                v if v is not None else fresh[self.query_cache.normalize(q)]
+                for q, v in zip(queries, vectors)
+            ]
+        
+        return np.vstack(vectors).astype(np.float32, copy=False)
+    
+    def _rows_matrix(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Sottomatrice delle righe richieste (array ordinato).
+        Righe contigue → vista senza copia, altrimenti gather delle sole righe.
+        """
+        if len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+            return self.matrix[rows[0]:rows[-1] + 1]
+        return self.matrix[rows]
+    
+    @staticmethod
+    def _select_top_k(scores: np.ndarray, top_k: int) -> np.ndarray:
+        """
+        Posizioni delle top_k righe per score (decrescente) senza ordinare tutto:
+        argpartition isola i vincitori, poi si ordinano solo quelli.
+        A parità di score vince l'ordine di riga, come con il sort stabile.
+        """
+        positions = np.arange(len(scores))
+        if top_k <= 0 or len(scores) == 0:
+            return positions[:0]
+        
+        if top_k < len(scores):
+            positions = np.sort(np.argpartition(-scores, top_k - 1)[:top_k])
+        
+        order = np.lexsort((positions, -scores[positions]))
+        return positions[order]
     
     def get_product_by_id(self, product_id: str) -> Optional[dict]:
         """Trova prodotto per ID"""
@@ -207,9 +674,5 @@ class ProductRetriever:
         return None
     
     def get_all_categories(self) -> List[str]:
-        """Ottieni lista di tutte le categorie"""
-        categories = set()
-        for product in self.products:
-            if product.get('categoria'):
-                categories.add(product['categoria'])
-        return sorted(list(categories))
\ No newline at end of file
+        """Ottieni lista di tutte le categorie (calcolata al caricamento)"""
+        return list(self.categories)
\ No newline at end of file
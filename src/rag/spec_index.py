@@ -0,0 +1,149 @@
+"""
+Spec Index - Indice numerico delle specifiche per filtri di range
+
+Per ogni specifica (prezzo, area, batteria, pendenza, larghezza, autonomia)
+un valore normalizzato per riga e le righe ordinate per valore: un filtro
+come prezzo_max=1500 diventa una bisect (np.searchsorted) sull'array
+ordinato, prima di qualunque calcolo di score.
+"""
+import math
+import re
+from typing import Callable, Dict, List, Optional
+import numpy as np
+
+from .specs import AREA_KEYS, get_spec, parse_number, parse_price, spec_number
+
+_NUMBER = re.compile(r'\d+(?:[.,]\d+)?')
+
+
+def _battery_ah(product: dict) -> Optional[float]:
+    """Capacità batteria in Ah: '2 x 4 Ah' → 8, '25 Ah (2x5Ah + 2x7.5Ah)' → 25"""
+    text = get_spec(product, 'Capacità batteria')
+    if not text:
+        return None
+    pack = re.match(r'\s*(\d+)\s*x\s*(\d+(?:[.,]\d+)?)', text)
+    if pack:
+        return int(pack.group(1)) * float(pack.group(2).replace(',', '.'))
+    return parse_number(text)
+
+
+def _slope_percent(product: dict) -> Optional[float]:
+    """Pendenza massima in %: i gradi vengono convertiti ('15°' → 26.8)"""
+    text = get_spec(product, 'Pendenza massima')
+    value = parse_number(text)
+    if value is None:
+        return None
+    if '°' in text:
+        return round(math.tan(math.radians(value)) * 100, 1)
+    return value
+
+
+def _cutting_width_cm(product: dict) -> Optional[float]:
+    """Larghezza di taglio in cm; per i range ('95 - 125 cm') il massimo"""
+    text = get_spec(product, 'Larghezza di taglio')
+    if not text:
+        return None
+    values = [float(v.replace(',', '.')) for v in _NUMBER.findall(text)]
+    if not values:
+        return None
+    width = max(values)
+    return width / 10 if 'mm' in text else width
+
+
+def _run_time_min(product: dict) -> Optional[float]:
+    """Autonomia in minuti (tempo di lavoro / di taglio per ciclo)"""
+    for key in ('Tempo di lavoro (+/-20%)', 'Tempo massimo di taglio per ciclo', 'Tempo di lavoro massimo'):
+        text = get_spec(product, key)
+        value = parse_number(text)
+        if value is not None:
+            return value * 60 if re.search(r'\d\s*(h|ore)\b', text) else value
+    return None
+
+
+# Nome del filtro → estrattore del valore numerico
+SPEC_EXTRACTORS: Dict[str, Callable[[dict], Optional[float]]] = {
+    'prezzo': lambda p: parse_price(p.get('prezzo')),
+    'area': lambda p: spec_number(p, *AREA_KEYS),
+    'batteria': _battery_ah,
+    'pendenza': _slope_percent,
+    'larghezza': _cutting_width_cm,
+    'autonomia': _run_time_min
+}
+
+
+class SpecIndex:
+    """
+    Valori numerici per riga + righe ordinate per valore.
+    Filtri supportati: <spec>_min / <spec>_max (es. prezzo_max, area_min).
+    Le righe senza il valore non passano un filtro su quella specifica,
+    salvo keep_missing=True (il filtro vale solo per chi ha il valore).
+    """
+
+    def __init__(self, row_products: List[Optional[dict]], precomputed: Optional[Dict[str, np.ndarray]] = None):
+        """
+        Args:
+            row_products: Prodotti allineati alle righe della matrice (None = riga orfana)
+            precomputed: Valori già calcolati per riga (es. prezzo/area da ProductFeatures)
+        """
+        precomputed = precomputed or {}
+        self.values: Dict[str, np.ndarray] = {}
+        self._sorted_rows: Dict[str, np.ndarray] = {}
+        self._sorted_values: Dict[str, np.ndarray] = {}
+        self._missing_rows: Dict[str, np.ndarray] = {}
+        present = np.array([product is not None for product in row_products], dtype=bool)
+
+        for name, extract in SPEC_EXTRACTORS.items():
+            if name in precomputed:
+                values = np.asarray(precomputed[name], dtype=np.float32)
+            else:
+                values = np.full(len(row_products), np.nan, dtype=np.float32)
+                for row, product in enumerate(row_products):
+                    if product is not None:
+                        value = extract(product)
+                        if value is not None:
+                            values[row] = value
+            known = np.flatnonzero(~np.isnan(values))
+            order = known[np.argsort(values[known], kind='stable')]
+            self.values[name] = values
+            self._sorted_rows[name] = order
+            self._sorted_values[name] = values[order]
+            self._missing_rows[name] = np.flatnonzero(np.isnan(values) & present)
+
+    def range(
+        self,
+        name: str,
+        low: Optional[float] = None,
+        high: Optional[float] = None,
+        keep_missing: bool = False
+    ) -> np.ndarray:
+        """Righe (ordinate) con low <= valore <= high (più quelle senza valore se keep_missing)"""
+        sorted_values = self._sorted_values[name]
+        # Limiti nel dtype dei valori: 199.99 float32 == prezzo_min=199.99
+        start = 0 if low is None else np.searchsorted(sorted_values, sorted_values.dtype.type(low), side='left')
+        end = len(sorted_values) if high is None else np.searchsorted(sorted_values, sorted_values.dtype.type(high), side='right')
+        rows = np.sort(self._sorted_rows[name][start:end])
+        if keep_missing:
+            rows = np.union1d(rows, self._missing_rows[name])
+        return rows
+
+    def select(self, filters: Optional[Dict], keep_missing: bool = False) -> Optional[np.ndarray]:
+        """
+        Interseca i range di tutti i filtri numerici presenti.
+        Ritorna None se i filtri non contengono specifiche indicizzate.
+
+        keep_missing: le righe senza il valore passano il filtro (requisiti
+        estratti dalla chat: un decespugliatore senza area non va escluso
+        da area_min)
+        """
+        if not filters:
+            return None
+
+        selected = None
+        for name in SPEC_EXTRACTORS:
+            low, high = filters.get(f'{name}_min'), filters.get(f'{name}_max')
+            if low is None and high is None:
+                continue
+            rows = self.range(name, low, high, keep_missing)
+            selected = rows if selected is None else np.intersect1d(selected, rows, assume_unique=True)
+
+        return selected
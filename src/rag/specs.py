@@ -0,0 +1,58 @@
+"""
+Specifiche tecniche - Accesso uniforme alle specifiche dei prodotti
+"""
+import re
+from typing import Optional
+
+SPEC_PREFIX = 'Specifiche tecniche - '
+
+_NUMBER = re.compile(r'\d+(?:[.,]\d+)*')
+
+
+def get_spec(product: dict, key: str) -> Optional[str]:
+    """
+    Valore di una specifica tecnica, cercata sia come 'X'
+    che come 'Specifiche tecniche - X'
+    """
+    specs = product.get('specifiche_tecniche') or {}
+    return specs.get(key) or specs.get(f'{SPEC_PREFIX}{key}')
+
+
+# Chiavi con l'area di taglio massima (il catalogo usa entrambe)
+AREA_KEYS = ('Area di taglio fino a', 'Area di taglioinfo_outline')
+
+
+def parse_number(text: Optional[str]) -> Optional[float]:
+    """
+    Primo numero in un valore di specifica ('1200 ㎡', '2.5 Ah', '45%').
+    Il punto seguito da tre cifre è trattato come separatore delle migliaia.
+    """
+    if not text:
+        return None
+    match = _NUMBER.search(str(text))
+    if not match:
+        return None
+    value = match.group(0)
+    if re.fullmatch(r'\d{1,3}(\.\d{3})+', value):
+        value = value.replace('.', '')
+    return float(value.replace(',', '.'))
+
+
+def parse_price(text: Optional[str]) -> Optional[float]:
+    """Prezzo italiano ('1.199,00 €') in euro, None per 'Contattaci' o valori non numerici"""
+    if not text:
+        return None
+    cleaned = str(text).replace('€', '').replace('\xa0', '').replace('.', '').replace(',', '.').strip()
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+
+
+def spec_number(product: dict, *keys: str) -> Optional[float]:
+    """Valore numerico della prima specifica presente tra le chiavi indicate"""
+    for key in keys:
+        value = parse_number(get_spec(product, key))
+        if value is not None:
+            return value
+    return None